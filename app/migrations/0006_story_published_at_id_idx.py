@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-18 17:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("app", "0005_promptresult_playground"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="story",
+            index=models.Index(
+                fields=["published_at", "id"], name="stories_published_at_id_idx"
+            ),
+        ),
+    ]
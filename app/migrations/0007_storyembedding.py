@@ -0,0 +1,55 @@
+# Generated by Django 5.1.1 on 2026-10-18 18:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("app", "0006_story_published_at_id_idx"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StoryEmbedding",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("model", models.CharField(max_length=255)),
+                ("dimensions", models.IntegerField()),
+                ("vector", models.BinaryField()),
+                ("published_at", models.DateTimeField()),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "story",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="embeddings",
+                        to="app.story",
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "story_embeddings",
+                "indexes": [
+                    models.Index(
+                        fields=["model", "dimensions", "id"],
+                        name="story_emb_model_dims_idx",
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("story", "model", "dimensions"),
+                        name="story_embeddings_story_model_dimensions_uniq",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -57,6 +57,11 @@ class Story(models.Model):
 
     class Meta:
         db_table = "stories"
+        indexes = [
+            models.Index(
+                fields=["published_at", "id"], name="stories_published_at_id_idx"
+            ),
+        ]
 
 
 class PromptResult(models.Model):
@@ -73,3 +78,33 @@ class PromptResult(models.Model):
 
     class Meta:
         db_table = "prompt_results"
+
+
+class StoryEmbedding(models.Model):
+    story = models.ForeignKey(
+        Story, on_delete=models.CASCADE, related_name="embeddings"
+    )
+    model = models.CharField(max_length=255)
+    dimensions = models.IntegerField()
+    # float32 vector, L2-normalised, stored as raw bytes
+    vector = models.BinaryField()
+    published_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Story Embedding {self.story_id}"
+
+    class Meta:
+        db_table = "story_embeddings"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["story", "model", "dimensions"],
+                name="story_embeddings_story_model_dimensions_uniq",
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["model", "dimensions", "id"],
+                name="story_emb_model_dims_idx",
+            ),
+        ]
@@ -1,3 +1,3 @@
-from . import prompt_results, stories
+from . import prompt_results, stories, story_sources, tasks
 
-__all__ = ["prompt_results", "stories"]
+__all__ = ["prompt_results", "stories", "story_sources", "tasks"]
@@ -3,6 +3,8 @@ from django.db import IntegrityError
 from app import models as md
 from src import services
 
+from .story_sources import get_story_source
+
 PROMPT_NAME_DUPLICATE_ERROR = (
     'duplicate key value violates unique constraint "prompt_results_prompt_name_key"'
     "\nDETAIL:  Key (prompt_name)"
@@ -53,6 +55,10 @@ def save(results, playground):
     else:
         raise ValueError(f"Invalid playground '{playground}'")
 
+    return _create(prompt_name, playground, prompt_attributes, stories)
+
+
+def _create(prompt_name, playground, prompt_attributes, stories):
     prompt_result = md.PromptResult(
         prompt_name=prompt_name,
         playground=playground,
@@ -73,6 +79,29 @@ def save(results, playground):
     return prompt_result
 
 
+def save_ranked_stories(prompt_name, prompt_attributes, ranked_stories):
+    """
+    Save the scored story records of a ranking batch job, highest value first, in
+    the same shape as results saved from the ranking playground.
+    """
+    stories = {
+        "data": [
+            {
+                "id": story["id"],
+                "value": story["value"],
+                "similarity_score": story["similarity_score"],
+                "vector_position": story["position"],
+            }
+            for story in ranked_stories
+        ]
+    }
+    return _create(prompt_name, "ranking", prompt_attributes, stories)
+
+
+def exists(prompt_name):
+    return md.PromptResult.objects.filter(prompt_name=prompt_name).exists()
+
+
 def get_all():
     return md.PromptResult.objects.all()
 
@@ -82,8 +111,9 @@ def get_stories_by_prompt_id(prompt_id):
     if prompt_result.playground == "ranking":
         stories = prompt_result.stories["data"]
         results = []
-        db_stories = services.get_stories_by_id(
-            story_ids=[story["id"] for story in stories]
+        db_stories = get_story_source().get_stories_by_id(
+            story_ids=[story["id"] for story in stories],
+            fields=services.external_data.STORY_FIELDS_WITHOUT_TEXT,
         )["data"]
         for story in stories:
             result = next(
@@ -91,7 +121,7 @@ def get_stories_by_prompt_id(prompt_id):
                     {
                         "id": db_story["id"],
                         "title": db_story["title"],
-                        "text": db_story["text"],
+                        "text": db_story.get("text"),
                         "published_at": db_story["published_at"],
                         "publication": db_story["publication"],
                         "author": db_story["author"],
@@ -1,15 +1,44 @@
 from app import models as md
+from app.types import StorySelection
 from src import services
 
+from .story_sources import get_story_source
 
-def get_repeat_stories(stories):
+
+def _story_fields(with_text):
+    if with_text:
+        return services.external_data.STORY_FIELDS
+    return services.external_data.STORY_FIELDS_WITHOUT_TEXT
+
+
+def load_story_texts(stories):
+    """
+    Fill in the text of stories fetched without it, using a single replica query.
+
+    Only call this for the stories whose text is actually needed, e.g. the sampled
+    stories that are sent to the LLM.
+    """
+    missing = [story for story in stories if story.text is None]
+    if not missing:
+        return stories
+    texts = get_story_source().get_story_texts(
+        story_ids=[str(story.id) for story in missing]
+    )
+    for story in missing:
+        story.text = texts.get(str(story.id))
+    return stories
+
+
+def get_repeat_stories(stories, with_text=True):
     story_ids = [story["id"] for story in stories]
-    db_stories = services.get_stories_by_id(story_ids=story_ids)
+    db_stories = get_story_source().get_stories_by_id(
+        story_ids=story_ids, fields=_story_fields(with_text)
+    )
     result = [
         md.Story(
             id=story["id"],
             title=story["title"],
-            text=story["text"],
+            text=story.get("text"),
             published_at=story["published_at"],
             publication=story["publication"],
             author=story["author"],
@@ -28,39 +57,42 @@ def get_repeat_stories(stories):
     return result
 
 
-def get_random_stories(
-    is_vector_search=False,
-    vector_search=None,
-    query=None,
-    start_date=None,
-):
-    if is_vector_search:
-        if query is None or start_date is None:
+def get_random_stories(selection: StorySelection, with_text=False, limit=1_000):
+    fields = _story_fields(with_text)
+    source = get_story_source()
+    if selection.is_vector_search:
+        if selection.query is None or selection.start_date is None:
             raise ValueError(
                 "Query and Start Date must be provided when vector_search is True."
             )
         vector_stories = services.get_vector_search_stories(
-            start_date=start_date,
-            limit=1_000,
-            vector_search=vector_search,
+            start_date=selection.start_date,
+            limit=limit,
+            vector_search=selection.vector_search,
         )
-        story_ids = [story["id"] for story in vector_stories]
-        stories = services.get_stories_by_id(story_ids=story_ids)["data"]
+        similarity_scores = {
+            story["id"]: story["similarity_score"] for story in vector_stories
+        }
+        stories = source.get_stories_by_id(
+            story_ids=list(similarity_scores), fields=fields
+        )["data"]
         for story in stories:
-            story["similarity_score"] = next(
-                item["similarity_score"]
-                for item in vector_stories
-                if item["id"] == story["id"]
-            )
+            story["similarity_score"] = similarity_scores[story["id"]]
         stories = sorted(stories, key=lambda x: x["similarity_score"], reverse=True)
 
     else:
-        stories = services.get_stories(limit=1_000, start_date=start_date)["data"]
+        stories = (
+            story
+            for batch in source.iter_story_batches(
+                start_date=selection.start_date, limit=limit, fields=fields
+            )
+            for story in batch
+        )
     return [
         md.Story(
             id=story["id"],
             title=story["title"],
-            text=story["text"],
+            text=story.get("text"),
             published_at=story["published_at"],
             publication=story["publication"],
             author=story["author"],
@@ -0,0 +1,97 @@
+import datetime
+import uuid
+
+from app import models as md
+from src import services
+
+
+class ReplicaStorySource:
+    """Reads stories from the Curio replica database."""
+
+    name = "replica"
+
+    def iter_story_batches(self, start_date=None, limit=10, fields=None):
+        return services.iter_story_batches(
+            start_date=start_date, limit=limit, fields=fields
+        )
+
+    def get_stories_by_id(self, story_ids, fields=None):
+        return services.get_stories_by_id(story_ids=story_ids, fields=fields)
+
+    def get_story_texts(self, story_ids):
+        return services.get_story_texts(story_ids=story_ids)
+
+
+class MirrorStorySource:
+    """
+    Reads stories from the local `stories` table that `fetch_stories` mirrors from
+    the replica. Results have the same shape as the replica queries.
+    """
+
+    name = "mirror"
+    batch_size = services.external_data.STORY_STREAM_BATCH_SIZE
+
+    def _values(self, queryset, fields):
+        fields = services.external_data.resolve_story_fields(fields)
+        for story in queryset.values(*fields).iterator(chunk_size=self.batch_size):
+            yield {**story, "id": str(story["id"])}
+
+    def iter_story_batches(self, start_date=None, limit=10, fields=None):
+        tomorrow = datetime.datetime.combine(
+            datetime.date.today() + datetime.timedelta(days=1),
+            datetime.time.min,
+            tzinfo=datetime.timezone.utc,
+        )
+        queryset = md.Story.objects.filter(published_at__lt=tomorrow).exclude(
+            type="SEGMENT"
+        )
+        if start_date is not None:
+            start_day = datetime.datetime.fromisoformat(str(start_date)).date()
+            queryset = queryset.filter(
+                published_at__gte=datetime.datetime.combine(
+                    start_day, datetime.time.min, tzinfo=datetime.timezone.utc
+                )
+            )
+        queryset = queryset.order_by("-published_at")[:limit]
+
+        batch = []
+        for story in self._values(queryset, fields):
+            batch.append(story)
+            if len(batch) == self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def get_stories_by_id(self, story_ids, fields=None):
+        services.external_data.validate_story_ids(story_ids)
+        story_ids = list(
+            dict.fromkeys(str(uuid.UUID(story_id)) for story_id in story_ids)
+        )
+        stories = {
+            story["id"]: story
+            for story in self._values(md.Story.objects.filter(id__in=story_ids), fields)
+        }
+        result = [stories[story_id] for story_id in story_ids if story_id in stories]
+        return {"total": len(result), "data": result}
+
+    def get_story_texts(self, story_ids):
+        services.external_data.validate_story_ids(story_ids)
+        return {
+            str(story_id): text
+            for story_id, text in md.Story.objects.filter(id__in=story_ids).values_list(
+                "id", "text"
+            )
+        }
+
+
+replica = ReplicaStorySource()
+mirror = MirrorStorySource()
+
+
+def get_story_source():
+    """
+    Return the replica source when the replica database is healthy, otherwise the
+    local mirror (e.g. while the replica is being re-populated).
+    """
+    return replica if services.replica.is_available() else mirror
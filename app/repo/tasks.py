@@ -0,0 +1,16 @@
+import json
+import uuid
+
+from app import models as md
+
+
+def create():
+    return md.Task.objects.create(task_id=str(uuid.uuid4()))
+
+
+def get(task_id):
+    return md.Task.objects.get(task_id=task_id)
+
+
+def get_result(task):
+    return json.loads(task.result) if task.result else {}
@@ -1,26 +1,260 @@
+import datetime
+import json
+
 from celery import shared_task
+from celery.exceptions import MaxRetriesExceededError
 from celery.utils.log import get_task_logger
+from django.utils import timezone
 
 from app import models as md
+from app import repo
+from app.types import StorySelection
 from src import services
+from src.services import batch_ranking, vector_search
 
 logger = get_task_logger(__name__)
 
+STORY_SYNC_LIMIT = 1000
+# How far back to start syncing from when the local mirror is empty.
+STORY_SYNC_BOOTSTRAP_DAYS = 3
+# How far behind the newest stored story each sync checks for stories it missed.
+STORY_SYNC_OVERLAP_MINUTES = 30
+HEADLINE_PREFETCH_MARKETS = ("GB", "US")
+RANKING_BATCH_POLL_SECONDS = 60
+# Candidate stories per ranking batch, the most requests the Batch API takes in one.
+# Fewer are submitted if their requests exceed the input file size limit.
+RANKING_BATCH_STORY_LIMIT = 50_000
+# Batches expire after their 24h completion window; poll for a little longer.
+RANKING_BATCH_MAX_POLLS = 25 * 60 * 60 // RANKING_BATCH_POLL_SECONDS
+
+
+def _story_sync_cursor():
+    return (
+        md.Story.objects.order_by("-published_at", "-id")
+        .values_list("published_at", "id")
+        .first()
+    )
+
+
+def _unstored_story_ids(story_ids) -> list:
+    stored = {
+        str(story_id)
+        for story_id in md.Story.objects.filter(id__in=story_ids).values_list(
+            "id", flat=True
+        )
+    }
+    return [story_id for story_id in story_ids if str(story_id) not in stored]
+
+
+def _store_stories(stories) -> int:
+    """Insert the stories that are not stored yet and return how many were."""
+    new_ids = set(_unstored_story_ids([story["id"] for story in stories]))
+    md.Story.objects.bulk_create(
+        [md.Story(**story) for story in stories if story["id"] in new_ids],
+        ignore_conflicts=True,
+    )
+    return len(new_ids)
+
 
 @shared_task
 def fetch_stories():
-    stories = services.get_stories(limit=1000)
-
-    for story in stories["data"]:
-        if md.Story.objects.filter(id=story["id"]).exists():
-            continue
-        md.Story.objects.create(
-            id=story["id"],
-            title=story["title"],
-            text=story["text"],
-            published_at=story["published_at"],
-            publication=story["publication"],
-            author=story["author"],
-            type=story["type"],
-            classification=story["classification"],
+    """
+    Incrementally mirror new replica stories into the local stories table.
+
+    The newest (published_at, id) already stored locally is the high-water mark;
+    only stories after it are read from the replica and they are written with a
+    single bulk insert per batch. Stories can show up on the replica after newer
+    ones (a late commit, or a published_at in the past), so the ids of the last
+    STORY_SYNC_OVERLAP_MINUTES up to the mark are compared with the local table as
+    well, and only the missing stories are read in full.
+    """
+    cursor = _story_sync_cursor()
+    recovered = 0
+    if cursor is None:
+        after_published_at = timezone.now() - datetime.timedelta(
+            days=STORY_SYNC_BOOTSTRAP_DAYS
+        )
+        after_id = None
+    else:
+        after_published_at, after_id = cursor
+        missing_ids = _unstored_story_ids(
+            services.get_story_ids_in_range(
+                after_published_at=after_published_at
+                - datetime.timedelta(minutes=STORY_SYNC_OVERLAP_MINUTES),
+                until_published_at=after_published_at,
+                until_id=after_id,
+            )
+        )
+        if missing_ids:
+            recovered = _store_stories(
+                services.get_stories_by_id(missing_ids).get("data", [])
+            )
+
+    synced = sum(
+        _store_stories(batch)
+        for batch in services.iter_new_story_batches(
+            after_published_at=after_published_at,
+            after_id=after_id,
+            limit=STORY_SYNC_LIMIT,
+        )
+    )
+
+    cursor = _story_sync_cursor()
+    replica_latest = services.get_latest_story_published_at()
+    if replica_latest is not None and timezone.is_naive(replica_latest):
+        replica_latest = timezone.make_aware(replica_latest, datetime.timezone.utc)
+    lag_seconds = (
+        (replica_latest - cursor[0]).total_seconds()
+        if cursor is not None and replica_latest is not None
+        else None
+    )
+    logger.info(
+        f"Story sync | Synced: {synced} | Recovered: {recovered} "
+        f"| Lag behind replica: {lag_seconds}s"
+    )
+    return {"synced": synced, "recovered": recovered, "lag_seconds": lag_seconds}
+
+
+@shared_task
+def embed_stories():
+    """
+    Embed newly mirrored stories for the local vector search engine and publish them
+    to the index files its web workers map.
+    """
+    if vector_search.VECTOR_SEARCH_ENGINE != "local":
+        return 0
+    from src.services import local_vector_search
+
+    embedded = local_vector_search.embed_new_stories()
+    updated = local_vector_search.update_index_files()
+    logger.info(f"Story embeddings | Embedded: {embedded} | Index updated: {updated}")
+    return embedded
+
+
+@shared_task
+def prefetch_headline_feeds():
+    """Prefetch the news playground's Bing feeds for every market into Redis."""
+    prefetched = {}
+    for market in HEADLINE_PREFETCH_MARKETS:
+        for use_top_headlines_feed in (False, True):
+            feed = "top-news" if use_top_headlines_feed else "categories"
+            try:
+                prefetched[
+                    f"{market}:{feed}"
+                ] = services.headlines.prefetch_bing_news_headlines(
+                    market, use_top_headlines_feed
+                )
+            except Exception as e:
+                logger.error(f"Headline prefetch | {market} {feed} failed: {e}")
+    logger.info(f"Headline prefetch | Headlines: {prefetched}")
+    return prefetched
+
+
+def _finish_task(task, status, **result):
+    state = json.loads(task.result or "{}")
+    # The submitted stories are only needed until the batch results are parsed.
+    state.pop("stories", None)
+    task.status = status
+    task.result = json.dumps({**state, **result})
+    task.date_completed = timezone.now()
+    task.save()
+
+
+@shared_task
+def submit_ranking_batch(task_id, job):
+    """
+    Score the candidate stories of a ranking job against its prompt through the
+    OpenAI Batch API, then poll the batch until its results can be saved.
+    """
+    task = md.Task.objects.get(task_id=task_id)
+    try:
+        stories = repo.stories.get_random_stories(
+            StorySelection(
+                query=job["prompt_value"],
+                is_vector_search=bool(job["is_vector_search"]),
+                vector_search=job["vector_query"],
+                start_date=job["start_date"],
+            ),
+            with_text="text" in job["attributes"],
+            limit=RANKING_BATCH_STORY_LIMIT,
+        )
+        batch_id, submitted = batch_ranking.submit_batch(
+            prompt=job["prompt_value"],
+            stories=stories,
+            attributes=job["attributes"],
+            metadata={"task_id": task_id, "prompt_name": job["prompt_name"]},
+        )
+    except Exception as e:
+        logger.error(f"Ranking batch | Task {task_id} failed to submit: {e}")
+        _finish_task(task, "FAILED", error=str(e))
+        return
+    task.status = "STARTED"
+    task.result = json.dumps(
+        {
+            "job": job,
+            "batch_id": batch_id,
+            "stories": [
+                batch_ranking.story_metadata(story) for story in stories[:submitted]
+            ],
+        }
+    )
+    task.save()
+    poll_ranking_batch.apply_async(args=[task_id], countdown=RANKING_BATCH_POLL_SECONDS)
+
+
+@shared_task(bind=True, max_retries=RANKING_BATCH_MAX_POLLS)
+def poll_ranking_batch(self, task_id):
+    """Save a ranking batch's results as a PromptResult once the batch has ended."""
+    task = md.Task.objects.get(task_id=task_id)
+    state = json.loads(task.result)
+    try:
+        batch = batch_ranking.get_batch(state["batch_id"])
+    except Exception as e:
+        logger.error(f"Ranking batch | {state['batch_id']} could not be read: {e}")
+        _finish_task(task, "FAILED", error=str(e))
+        return
+    if batch.status in batch_ranking.PENDING_BATCH_STATUSES:
+        try:
+            raise self.retry(countdown=RANKING_BATCH_POLL_SECONDS)
+        except MaxRetriesExceededError:
+            logger.error(f"Ranking batch | {batch.id} still {batch.status}, gave up")
+            _finish_task(task, "FAILED", error=f"Batch still {batch.status}")
+            return
+    if batch.status != "completed":
+        logger.error(f"Ranking batch | {batch.id} ended as {batch.status}")
+        _finish_task(task, "FAILED", error=f"Batch {batch.status}")
+        return
+
+    try:
+        ranked_stories = batch_ranking.get_batch_results(batch, state["stories"])
+    except Exception as e:
+        logger.error(f"Ranking batch | {batch.id} results could not be read: {e}")
+        _finish_task(task, "FAILED", error=str(e))
+        return
+    job = state["job"]
+    prompt_attributes = {
+        key: job[key]
+        for key in ("vector_query", "start_date", "prompt_value", "is_vector_search")
+    }
+    try:
+        prompt_result = repo.prompt_results.save_ranked_stories(
+            prompt_name=job["prompt_name"],
+            prompt_attributes={
+                **prompt_attributes,
+                "attribute": job["attributes"],
+                "batch_id": batch.id,
+            },
+            ranked_stories=ranked_stories,
         )
+    except repo.prompt_results.PromptResultExistsError as e:
+        _finish_task(task, "FAILED", error=str(e))
+        return
+    logger.info(
+        f"Ranking batch | {batch.id} completed | Stories: {len(ranked_stories)}"
+    )
+    _finish_task(
+        task,
+        "COMPLETED",
+        prompt_result_id=str(prompt_result.id),
+        ranked=len(ranked_stories),
+    )
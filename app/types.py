@@ -1,5 +1,5 @@
 import enum
-from typing import Tuple
+from typing import List, Optional, Tuple
 
 from pydantic import BaseModel
 
@@ -10,6 +10,37 @@ class Headline(BaseModel):
     summary: str
     publication: str
     category: str
+    published_at: Optional[str] = None
+
+
+class StorySelection(BaseModel):
+    """The candidate stories of a ranking run: a vector search or the latest stories."""
+
+    start_date: Optional[str] = None
+    is_vector_search: bool = False
+    vector_search: Optional[str] = None
+    query: Optional[str] = None
+
+
+class HeadlineCluster(BaseModel):
+    representative: Headline
+    duplicates: List[Headline]
+
+
+class ClusterRepresentative(enum.Enum):
+    MOST_CENTRAL = enum.auto()
+    EARLIEST = enum.auto()
+
+    @staticmethod
+    def from_user_str(user_str: str) -> "ClusterRepresentative":
+        if user_str == "most-central":
+            return ClusterRepresentative.MOST_CENTRAL
+        elif user_str == "earliest":
+            return ClusterRepresentative.EARLIEST
+        else:
+            raise ValueError(
+                f"Unrecognized user str for ClusterRepresentative: {user_str}"
+            )
 
 
 class HeadlineStoryQueryStrategy(enum.Enum):
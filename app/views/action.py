@@ -3,16 +3,19 @@ from django.http import JsonResponse
 
 class ActionView:
     def post(self, request, action):
-        if action == "save":
-            return self.save(request)
-        elif action == "run":
-            return self.run(request)
-        elif action == "output":
-            return self.output(request)
-        elif action == "re-run":
-            return self.rerun(request)
-        else:
+        handlers = {
+            "save": self.save,
+            "run": self.run,
+            "output": self.output,
+            "re-run": self.rerun,
+            "stream": self.stream,
+            "batch": self.batch,
+            "batch-status": self.batch_status,
+        }
+        handler = handlers.get(action)
+        if handler is None:
             return JsonResponse({"error": "Invalid action"}, status=400)
+        return handler(request)
 
     def save(self, request):
         raise NotImplementedError("Method save not implemented")
@@ -25,3 +28,12 @@ class ActionView:
 
     def rerun(self, request):
         pass
+
+    def stream(self, request):
+        raise NotImplementedError("Method stream not implemented")
+
+    def batch(self, request):
+        raise NotImplementedError("Method batch not implemented")
+
+    def batch_status(self, request):
+        raise NotImplementedError("Method batch_status not implemented")
@@ -10,6 +10,7 @@ from django.views import View
 from django.views.decorators.csrf import csrf_exempt
 
 from app import repo
+from app.types import ClusterRepresentative
 from src import services
 from src.services.headlines import HeadlineStoryQueryStrategy
 
@@ -75,42 +76,77 @@ class NewsView(View, ActionView):
         dedupe_headlines = request.POST.get("dedupe-headlines")
         dedupe_headlines = dedupe_headlines == "true"
         dedupe_thresh = float(request.POST.get("dedupe-threshold"))
+        use_llm_cache = request.POST.get("fresh-llm-samples") != "true"
+        dedupe_representative = ClusterRepresentative.from_user_str(
+            request.POST.get("dedupe-representative", "most-central")
+        )
 
         logger.info(f"News Ranking | Market: {news_market} | Prompt: {prompt_value}")
 
         try:
-            raw_headlines = services.headlines.get_all_bing_news_headlines(
+            raw_headlines = services.headlines.get_prefetched_bing_news_headlines(
                 market=news_market,
                 use_top_headlines_feed=is_top_headlines,
                 headline_limit=headline_limit,
             )
+            if raw_headlines is None:
+                raw_headlines = services.headlines.get_all_bing_news_headlines(
+                    market=news_market,
+                    use_top_headlines_feed=is_top_headlines,
+                    headline_limit=headline_limit,
+                )
             if dedupe_headlines:
-                headlines = services.headlines.dedupe_headlines(
-                    raw_headlines, dedupe_thresh
+                headline_clusters = services.headlines.cluster_headlines(
+                    raw_headlines, dedupe_thresh, dedupe_representative
                 )
+                headlines = [cluster.representative for cluster in headline_clusters]
             else:
+                headline_clusters = []
                 headlines = raw_headlines
 
         except ValueError as e:
             return HttpResponse(f"<p>{e}</p><p>Please try again.</p>")
 
-        reranked_headlines = (
-            services.llm.make_concurrent_llm_request_for_headline_scoring(
-                headlines=headlines, relevancy_prompt=prompt_value
+        if request.POST.get("ranking-method") == "listwise":
+            listwise_headlines = (
+                services.llm.make_windowed_llm_request_for_headline_reranking(
+                    headlines=headlines,
+                    reranking_prompt=prompt_value,
+                    use_cache=use_llm_cache,
+                )
+            )
+            # Listwise reranking returns an order without scores, so each headline
+            # gets a pseudo-score from its rank: 1 for the first, falling towards 0.
+            reranked_headlines = [
+                (headline, 1 - idx / len(listwise_headlines))
+                for idx, headline in enumerate(listwise_headlines)
+            ]
+        else:
+            reranked_headlines = (
+                services.llm.make_concurrent_llm_request_for_headline_scoring(
+                    headlines=headlines,
+                    relevancy_prompt=prompt_value,
+                    use_cache=use_llm_cache,
+                )
             )
-        )
 
         scored_story_matches = None
         if story_matching_strategy:
             strategy = HeadlineStoryQueryStrategy.from_user_str(story_matching_strategy)
             scored_story_matches = (
                 services.headlines.match_headlines_to_internal_stories(
-                    [headline for headline, _ in reranked_headlines], strategy
+                    [headline for headline, _ in reranked_headlines],
+                    strategy,
+                    story_source=repo.story_sources.get_story_source(),
                 )
             )
 
+        duplicate_clusters = [
+            cluster for cluster in headline_clusters if cluster.duplicates
+        ]
         context = {
             "headlines": raw_headlines,
+            "duplicate_clusters": duplicate_clusters,
             "reranked_headlines": reranked_headlines,
             "reranked_headlines_and_stories": list(
                 zip(reranked_headlines, scored_story_matches)
@@ -137,6 +173,7 @@ class NewsView(View, ActionView):
 
         json_context = {
             "headlines": headlines,
+            "duplicate_clusters": [cluster.dict() for cluster in duplicate_clusters],
             "reranked_headlines": reranked_headlines,
             "reranked_headlines_and_stories": reranked_headlines_and_stories,
             "has_story_matches": has_story_matches,
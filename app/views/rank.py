@@ -1,14 +1,15 @@
 import datetime
 import logging
 
-from django.http import HttpResponse, JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
 from django.template.loader import render_to_string
 from django.utils.decorators import method_decorator
 from django.views import View
 from django.views.decorators.csrf import csrf_exempt
 
-from app import repo
+from app import repo, tasks
+from app.types import StorySelection
 from src import constants, services
 
 from .action import ActionView
@@ -16,6 +17,51 @@ from .action import ActionView
 logger = logging.getLogger(__name__)
 
 
+def _score_stories(request, stories, prompt, attributes):
+    """Score stories one per request, or in batches when the sidebar asks for them."""
+    use_llm_cache = request.POST.get("fresh-llm-samples") != "true"
+    stories_per_request = int(request.POST.get("stories-per-request") or 1)
+    if stories_per_request > 1:
+        return services.make_batched_llm_requests_for_stories(
+            stories=stories,
+            prompt=prompt,
+            attributes=attributes,
+            stories_per_request=stories_per_request,
+            use_cache=use_llm_cache,
+        )
+    return services.make_concurrent_llm_requests_for_stories(
+        stories=stories,
+        prompt=prompt,
+        attributes=attributes,
+        use_cache=use_llm_cache,
+    )
+
+
+def _stream_request(request, stories):
+    """The form fields the streaming output posts to the stream action."""
+    fields = {
+        key: request.POST[key]
+        for key in request.POST
+        if key.startswith("attribute-") or key in ("prompt-value", "fresh-llm-samples")
+    }
+    fields["story-id"] = [str(story.id) for story in stories]
+    fields["similarity-score"] = [story.similarity_score for story in stories]
+    fields["vector-position"] = [story.position for story in stories]
+    return fields
+
+
+def _story_events(stories, prompt, attributes, use_cache):
+    for llm_story in services.iter_concurrent_llm_requests_for_stories(
+        stories=stories, prompt=prompt, attributes=attributes, use_cache=use_cache
+    ):
+        html = render_to_string(
+            "rank/partials/llm_story.html", {"llm_story": llm_story}
+        )
+        data = "".join(f"data: {line}\n" for line in html.splitlines())
+        yield f"event: story\n{data}\n"
+    yield "event: done\ndata: \n\n"
+
+
 @method_decorator(csrf_exempt, name="dispatch")
 class RankingView(View, ActionView):
     template_name = "rank/index.html"
@@ -87,17 +133,14 @@ class RankingView(View, ActionView):
             request.POST[key] for key in request.POST if key.startswith("attribute-")
         ]
 
-        now = datetime.datetime.now().time()
-        for start_time, end_time in constants.REPLICATION_PERIODS:
-            if start_time <= now <= end_time:
-                return HttpResponse(constants.REPLICATING_HTML_MSG)
-
         try:
             stories = repo.stories.get_random_stories(
-                query=prompt_value,
-                is_vector_search=is_vector_search,
-                vector_search=vector_query,
-                start_date=start_date,
+                StorySelection(
+                    query=prompt_value,
+                    is_vector_search=bool(is_vector_search),
+                    vector_search=vector_query,
+                    start_date=start_date,
+                )
             )
         except ValueError as e:
             return HttpResponse(f"<p>{e}</p><p>Please try again.</p>")
@@ -105,8 +148,25 @@ class RankingView(View, ActionView):
         llm_stories = services.sampling.sample_stories(
             stories=stories, limit=story_limit, sampling_method=sampling_method
         )
-        data = services.make_concurrent_llm_requests_for_stories(
-            stories=llm_stories, prompt=prompt_value, attributes=selected_attributes
+        if request.POST.get("stream-results") == "true":
+            # The page asks the stream action to score the sampled stories.
+            html = render_to_string(
+                "rank/output.html",
+                {
+                    "llm_stories": [],
+                    "vector_stories": stories,
+                    "stream_stories": llm_stories,
+                    "stream_request": _stream_request(request, llm_stories),
+                },
+            )
+            return HttpResponse(html)
+        if "text" in selected_attributes:
+            repo.stories.load_story_texts(llm_stories)
+        data = _score_stories(
+            request,
+            stories=llm_stories,
+            prompt=prompt_value,
+            attributes=selected_attributes,
         )
         html = render_to_string(
             "rank/output.html",
@@ -114,7 +174,7 @@ class RankingView(View, ActionView):
         )
         return HttpResponse(html)
 
-    def output(self, request):
+    def stream(self, request):
         story_ids = request.POST.getlist("story-id")
         vector_positions = request.POST.getlist("vector-position")
         similarity_scores = request.POST.getlist("similarity-score")
@@ -122,11 +182,38 @@ class RankingView(View, ActionView):
         selected_attributes = [
             request.POST[key] for key in request.POST if key.startswith("attribute-")
         ]
+        use_llm_cache = request.POST.get("fresh-llm-samples") != "true"
 
-        now = datetime.datetime.now().time()
-        for start_time, end_time in constants.REPLICATION_PERIODS:
-            if start_time <= now <= end_time:
-                return HttpResponse(constants.REPLICATING_HTML_MSG)
+        stories = [
+            {
+                "id": story_id,
+                "vector_position": int(vector_position),
+                "similarity_score": float(similarity_score),
+            }
+            for story_id, vector_position, similarity_score in zip(
+                story_ids, vector_positions, similarity_scores
+            )
+        ]
+        stories = repo.stories.get_repeat_stories(
+            stories=stories, with_text="text" in selected_attributes
+        )
+        response = StreamingHttpResponse(
+            _story_events(stories, prompt_value, selected_attributes, use_llm_cache),
+            content_type="text/event-stream",
+        )
+        response["Cache-Control"] = "no-cache"
+        # Stops reverse proxies buffering the events.
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+    def output(self, request):
+        story_ids = request.POST.getlist("story-id")
+        vector_positions = request.POST.getlist("vector-position")
+        similarity_scores = request.POST.getlist("similarity-score")
+        prompt_value = request.POST.get("prompt-value")
+        selected_attributes = [
+            request.POST[key] for key in request.POST if key.startswith("attribute-")
+        ]
 
         stories = [
             {
@@ -140,10 +227,16 @@ class RankingView(View, ActionView):
         ]
 
         stories = sorted(
-            repo.stories.get_repeat_stories(stories=stories), key=lambda x: x.position
+            repo.stories.get_repeat_stories(
+                stories=stories, with_text="text" in selected_attributes
+            ),
+            key=lambda x: x.position,
         )
-        data = services.make_concurrent_llm_requests_for_stories(
-            stories=stories, prompt=prompt_value, attributes=selected_attributes
+        data = _score_stories(
+            request,
+            stories=stories,
+            prompt=prompt_value,
+            attributes=selected_attributes,
         )
         html = render_to_string(
             "rank/output.html",
@@ -159,10 +252,6 @@ class RankingView(View, ActionView):
         selected_attributes = [
             request.POST[key] for key in request.POST if key.startswith("attribute-")
         ]
-        for start_time, end_time in constants.REPLICATION_PERIODS:
-            now = datetime.datetime.now().time()
-            if start_time <= now <= end_time:
-                return HttpResponse(constants.REPLICATING_HTML_MSG)
 
         stories = []
         for story_id, vector_position, similarity_score in zip(
@@ -176,9 +265,12 @@ class RankingView(View, ActionView):
                 }
             )
 
-        stories = repo.stories.get_repeat_stories(stories=stories)
+        stories = repo.stories.get_repeat_stories(
+            stories=stories, with_text="text" in selected_attributes
+        )
         stories = sorted(stories, key=lambda x: x.position, reverse=False)
-        data = services.make_concurrent_llm_requests_for_stories(
+        data = _score_stories(
+            request,
             stories=stories,
             prompt=prompt_value,
             attributes=selected_attributes,
@@ -188,3 +280,43 @@ class RankingView(View, ActionView):
             {"llm_stories": data, "vector_stories": stories},
         )
         return HttpResponse(html)
+
+    def batch(self, request):
+        prompt_name = request.POST.get("prompt-name")
+        if not prompt_name:
+            return HttpResponse("<p>A name is required to save the batch results.</p>")
+        if repo.prompt_results.exists(prompt_name):
+            return HttpResponse(
+                f"<p>Prompt result with name '{prompt_name}' already exists.</p>"
+            )
+        job = {
+            "prompt_name": prompt_name,
+            "prompt_value": request.POST.get("prompt-value"),
+            "vector_query": request.POST.get("vector-query"),
+            "is_vector_search": request.POST.get("is-vector-search"),
+            "start_date": (
+                datetime.datetime.now()
+                - datetime.timedelta(days=int(request.POST.get("start-date")))
+            ).isoformat(),
+            "attributes": [
+                request.POST[key]
+                for key in request.POST
+                if key.startswith("attribute-")
+            ],
+        }
+        logger.info(f"Batch Ranking|Name: {prompt_name}|Prompt: {job['prompt_value']}")
+
+        task = repo.tasks.create()
+        tasks.submit_ranking_batch.delay(task.task_id, job)
+        html = render_to_string(
+            "rank/batch_job.html", {"task": task, "result": {"job": job}}
+        )
+        return HttpResponse(html)
+
+    def batch_status(self, request):
+        task = repo.tasks.get(request.POST.get("task-id"))
+        html = render_to_string(
+            "rank/batch_job.html",
+            {"task": task, "result": repo.tasks.get_result(task)},
+        )
+        return HttpResponse(html)
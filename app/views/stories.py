@@ -3,7 +3,8 @@ from django.http import Http404, HttpResponse
 from django.template.loader import render_to_string
 from django.views.decorators import csrf, http
 
-from src import firebase, services
+from app import repo
+from src import firebase
 
 
 @csrf.csrf_exempt
@@ -11,7 +12,9 @@ from src import firebase, services
 def get_story_by_id(request, story_id):
     try:
         # Fetch the story by ID
-        story = services.get_stories_by_id([story_id])["data"][0]
+        story = repo.story_sources.get_story_source().get_stories_by_id([story_id])[
+            "data"
+        ][0]
 
         # Render the story into the story_detail.html template
         story_html = render_to_string("shared/story_detail.html", {"story": story})
@@ -1,6 +1,6 @@
 import logging
 
-from django.http import HttpResponse, JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
 from django.template.loader import render_to_string
 from django.utils.decorators import method_decorator
@@ -28,6 +28,8 @@ class TransformView(View, ActionView):
             return self.save(request)
         elif action == "run":
             return self.run(request)
+        elif action == "stream":
+            return self.stream(request)
         elif action == "prompts":
             return self.prompts(request)
         elif action == "stories":
@@ -68,28 +70,61 @@ class TransformView(View, ActionView):
             raise ValueError(f"Invalid prompt type '{results['type']}'")
         return HttpResponse(html)
 
+    def _stories(self, request):
+        if request.POST.get("playground") == "ranking":
+            return repo.story_sources.get_story_source().get_stories_by_id(
+                story_ids=request.POST.getlist("story-option")
+            )["data"]
+        stories = []
+        for o in request.POST.getlist("headline-option"):
+            title, summary = o.split("||")
+            h = {"title": title, "text": summary}
+            stories.append(h)
+        return stories
+
     def run(self, request):
-        stories = request.POST.getlist("story-option")
         prompt = request.POST.get("prompt-value")
-        playground = request.POST.get("playground")
-        if playground == "ranking":
-            results = services.get_stories_by_id(story_ids=stories)["data"]
-            transformation = services.llm.transform_stories(
-                stories=results, prompt=prompt
+        use_llm_cache = request.POST.get("fresh-llm-samples") != "true"
+        map_reduce = request.POST.get("map-reduce") == "true"
+        if request.POST.get("stream-output") == "true" and not map_reduce:
+            # The page asks the stream action for the transformation.
+            stream_request = {
+                key: request.POST.getlist(key)
+                for key in request.POST
+                if key != "stream-output"
+            }
+            html = render_to_string(
+                "transform/partials/stream_output.html",
+                {"stream_request": stream_request},
+            )
+            return HttpResponse(html)
+
+        stories = self._stories(request)
+        if map_reduce:
+            transformation = services.llm.map_reduce_transform_stories(
+                stories=stories, prompt=prompt, use_cache=use_llm_cache
             )
         else:
-            headlines = request.POST.getlist("headline-option")
-            stories = []
-            for o in headlines:
-                title, summary = o.split("||")
-                h = {"title": title, "text": summary}
-                stories.append(h)
             transformation = services.llm.transform_stories(
-                stories=stories, prompt=prompt
+                stories=stories, prompt=prompt, use_cache=use_llm_cache
             )
-            print(transformation)
-            print([i["title"] for i in stories])
         html = render_to_string(
             "transform/output.html", {"transformation": transformation}
         )
         return HttpResponse(html)
+
+    def stream(self, request):
+        prompt = request.POST.get("prompt-value")
+        use_llm_cache = request.POST.get("fresh-llm-samples") != "true"
+        stories = self._stories(request)
+        logger.info(f"Stream Transform|Stories: {len(stories)}|Prompt: {prompt}")
+        response = StreamingHttpResponse(
+            services.llm.stream_transform_stories(
+                stories=stories, prompt=prompt, use_cache=use_llm_cache
+            ),
+            content_type="text/html; charset=utf-8",
+        )
+        response["Cache-Control"] = "no-cache"
+        # Stops reverse proxies buffering the chunks.
+        response["X-Accel-Buffering"] = "no"
+        return response
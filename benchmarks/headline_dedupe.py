@@ -0,0 +1,79 @@
+"""
+Time and peak memory of headline dedupe over synthetic embeddings: the previous
+dense N x N similarity matrix versus the blockwise nearest neighbour search with
+union-find clustering in services.dedupe.
+
+    python -m benchmarks.headline_dedupe --sizes 100 1000 10000 50000
+
+The dense approach needs O(N^2) memory, so it is only run up to --dense-max.
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+from src.services import dedupe
+
+
+def _synthetic_embeddings(size, dimensions, duplicate_rate, rng):
+    # A fraction of the headlines are noisy copies of earlier ones, the way Bing
+    # returns the same story under several categories and publications.
+    distinct = max(1, int(size * (1 - duplicate_rate)))
+    vectors = rng.standard_normal((size, dimensions), dtype=np.float32)
+    sources = rng.integers(0, distinct, size - distinct)
+    noise = rng.standard_normal((size - distinct, dimensions), dtype=np.float32)
+    vectors[distinct:] = vectors[sources] + 0.3 * noise
+    return dedupe.normalise(vectors)
+
+
+def _dense_dedupe(vectors, similarity_threshold):
+    intra_similarity = vectors @ vectors.T
+    upper_tri = np.triu(intra_similarity, k=1)
+    dupe_pairs = np.argwhere(upper_tri > similarity_threshold)
+    exclude = np.zeros(len(vectors), dtype=bool)
+    for _i, j in dupe_pairs:
+        exclude[j] = True
+    return int((~exclude).sum())
+
+
+def _clustered_dedupe(vectors, similarity_threshold, block_size):
+    return len(dedupe.cluster_duplicates(vectors, similarity_threshold, block_size))
+
+
+def _measure(fn, *args):
+    tracemalloc.start()
+    begin = time.perf_counter()
+    kept = fn(*args)
+    elapsed = time.perf_counter() - begin
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return kept, elapsed, peak / 2**20
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[100, 1000, 10_000, 50_000]
+    )
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--threshold", type=float, default=0.8)
+    parser.add_argument("--duplicate-rate", type=float, default=0.2)
+    parser.add_argument("--block-size", type=int, default=dedupe.DEDUPE_BLOCK_SIZE)
+    parser.add_argument("--dense-max", type=int, default=10_000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    print(f"{'headlines':>10} {'method':>10} {'kept':>8} {'time':>10} {'peak mem':>10}")
+    for size in args.sizes:
+        vectors = _synthetic_embeddings(size, args.dimensions, args.duplicate_rate, rng)
+        runs = [("clustered", _clustered_dedupe, args.block_size)]
+        if size <= args.dense_max:
+            runs.insert(0, ("dense", _dense_dedupe))
+        for name, fn, *extra in runs:
+            kept, elapsed, peak = _measure(fn, vectors, args.threshold, *extra)
+            print(f"{size:>10} {name:>10} {kept:>8} {elapsed:>9.3f}s {peak:>8.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Top-k latency of the in-process embedding index used by the local vector search
+engine, over synthetic float32 embeddings with a publication date filter.
+
+    python -m benchmarks.local_vector_search --sizes 10000 100000 1000000
+
+At 512 dimensions one million stories take ~2GB of memory. Only the stories in the
+--days window are scored.
+"""
+import argparse
+import os
+import statistics
+import time
+
+import django
+import numpy as np
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+django.setup()
+
+from src.services.local_vector_search import EmbeddingIndex  # noqa: E402
+
+DAY_US = 86_400 * 1_000_000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000]
+    )
+    parser.add_argument("--dimensions", type=int, default=512)
+    parser.add_argument("--k", type=int, nargs="+", default=[3, 1000])
+    parser.add_argument("--days", type=int, default=3)
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    now = int(time.time() * 1_000_000)
+    print(f"{'stories':>10} {'k':>6} {'p50':>10} {'p95':>10}")
+    for size in args.sizes:
+        index = EmbeddingIndex.from_rows(
+            story_ids=[str(i) for i in range(size)],
+            published_at=now - rng.integers(0, 365 * DAY_US, size),
+            vectors=rng.standard_normal((size, args.dimensions), dtype=np.float32),
+        )
+        for k in args.k:
+            timings = []
+            for _ in range(args.iterations):
+                query = rng.standard_normal(args.dimensions, dtype=np.float32)
+                begin = time.perf_counter()
+                index.search(query, k=k, start=now - args.days * DAY_US, end=now)
+                timings.append((time.perf_counter() - begin) * 1000)
+            timings.sort()
+            p95 = timings[int(len(timings) * 0.95) - 1]
+            print(
+                f"{size:>10} {k:>6} {statistics.median(timings):>8.2f}ms {p95:>8.2f}ms"
+            )
+        del index
+
+
+if __name__ == "__main__":
+    main()
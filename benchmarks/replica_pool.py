@@ -0,0 +1,68 @@
+"""
+Per-query latency of the replica data layer with and without the connection pool.
+
+Point the REPLICA_* environment variables at a local Postgres (e.g. the
+``curio-db-replica`` service in docker-compose.yml) and run:
+
+    python -m benchmarks.replica_pool --iterations 200
+"""
+import argparse
+import statistics
+import time
+
+from src.services import replica
+
+QUERY = "SELECT relname, n_live_tup FROM pg_stat_user_tables LIMIT 10"
+
+
+def _run_query(conn):
+    with conn.cursor() as cur:
+        cur.execute(QUERY)
+        cur.fetchall()
+    conn.rollback()
+
+
+def _without_pool():
+    conn = replica.connect()
+    try:
+        _run_query(conn)
+    finally:
+        conn.close()
+
+
+def _with_pool():
+    with replica.connection() as conn:
+        _run_query(conn)
+
+
+def _measure(fn, iterations):
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def _report(name, timings):
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(
+        f"{name:<12} mean={statistics.mean(timings):8.2f}ms "
+        f"p50={statistics.median(timings):8.2f}ms p95={p95:8.2f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=100)
+    args = parser.parse_args()
+
+    # warm up the pool so the first connect is not counted against it
+    _with_pool()
+    _report("no pool", _measure(_without_pool, args.iterations))
+    _report("pool", _measure(_with_pool, args.iterations))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Latency of story lookups by id: one ``IN (%s, ...)`` placeholder per id versus the
+chunked, prepared ``= ANY($1::uuid[])`` lookup used by get_stories_by_id.
+
+Point the REPLICA_* environment variables at a local Postgres holding the replica
+schema and run:
+
+    python -m benchmarks.story_lookup --sizes 10 100 1000 10000
+"""
+import argparse
+import statistics
+import time
+
+from src.services import external_data, replica
+
+
+def _sample_story_ids(limit):
+    with replica.connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT id FROM content_story LIMIT %s", (limit,))
+        return [str(row[0]) for row in cur.fetchall()]
+
+
+def _in_list_lookup(story_ids):
+    placeholders = ", ".join(["%s"] * len(story_ids))
+    columns = external_data._story_columns(external_data.STORY_FIELDS)
+    query = f"""
+        SELECT {columns}
+        FROM content_story st
+        INNER JOIN scripts_script s on s.story_id = st.id
+        INNER JOIN content_publication p on p.id = st.publication_id
+        WHERE st.id IN ({placeholders});
+    """
+    with replica.connection() as conn, conn.cursor() as cur:
+        cur.execute(query, (*story_ids,))
+        return cur.fetchall()
+
+
+def _any_array_lookup(story_ids):
+    # bypass the story cache so only the replica query is measured
+    return external_data._query_stories_by_id(story_ids, external_data.STORY_FIELDS)
+
+
+def _measure(fn, story_ids, iterations):
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn(story_ids)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--iterations", type=int, default=10)
+    args = parser.parse_args()
+
+    all_story_ids = _sample_story_ids(max(args.sizes))
+    print(f"{'ids':>8} {'IN list':>12} {'ANY array':>12}")
+    for size in args.sizes:
+        story_ids = all_story_ids[:size]
+        in_list = _measure(_in_list_lookup, story_ids, args.iterations)
+        any_array = _measure(_any_array_lookup, story_ids, args.iterations)
+        print(f"{len(story_ids):>8} {in_list:>10.2f}ms {any_array:>10.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Latency of the transform playground over synthetic story selections: one request
+with every story (transform_stories) versus chunked map requests run concurrently
+and merged by reduce requests (map_reduce_transform_stories).
+
+    python -m benchmarks.transform_map_reduce --sizes 5 20 50 --text-chars 4000
+
+Every request goes to the OpenAI API (or OPENAI_BASE_URL) with the response cache
+skipped. The single request is skipped once the selection exceeds --single-max
+tokens, roughly where it would no longer fit the model's context window.
+"""
+import argparse
+import os
+import random
+import time
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+django.setup()
+
+from src.services import llm  # noqa: E402
+
+PROMPT = "Write a short news briefing covering the most important of these stories. "
+WORDS = (
+    "government minister economy market election report police court health "
+    "climate energy company share price rise fall week year people city country"
+).split()
+
+
+def _synthetic_stories(size, text_chars, rng):
+    stories = []
+    for i in range(size):
+        words = []
+        while sum(len(word) + 1 for word in words) < text_chars:
+            words.append(rng.choice(WORDS))
+        stories.append(
+            {"title": f"Story {i}: {' '.join(words[:8])}", "text": " ".join(words)}
+        )
+    return stories
+
+
+def _measure(fn, *args, **kwargs):
+    begin = time.perf_counter()
+    output = fn(*args, **kwargs)
+    return time.perf_counter() - begin, len(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5, 20, 50])
+    parser.add_argument("--text-chars", type=int, default=4000)
+    parser.add_argument(
+        "--chunk-max-tokens", type=int, default=llm.TRANSFORM_CHUNK_MAX_TOKENS
+    )
+    parser.add_argument(
+        "--max-concurrency", type=int, default=llm.TRANSFORM_MAX_CONCURRENCY
+    )
+    parser.add_argument("--single-max", type=int, default=100_000)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    print(f"{'stories':>8} {'tokens':>8} {'method':>12} {'time':>10} {'chars':>8}")
+    for size in args.sizes:
+        stories = _synthetic_stories(size, args.text_chars, rng)
+        tokens = sum(len(story["text"]) + len(story["title"]) for story in stories) // 4
+        runs = [
+            (
+                "map-reduce",
+                llm.map_reduce_transform_stories,
+                {
+                    "chunk_max_tokens": args.chunk_max_tokens,
+                    "max_concurrency": args.max_concurrency,
+                },
+            )
+        ]
+        if tokens <= args.single_max:
+            runs.insert(0, ("single", llm.transform_stories, {}))
+        for name, fn, kwargs in runs:
+            elapsed, chars = _measure(fn, stories, PROMPT, use_cache=False, **kwargs)
+            print(f"{size:>8} {tokens:>8} {name:>12} {elapsed:>9.2f}s {chars:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 import os
 
 from celery import Celery
+from celery.signals import worker_init, worker_process_init
 
 # set the default Django settings module for the 'celery' program.
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
@@ -20,4 +21,21 @@ app.conf.beat_schedule = {
         "task": "app.tasks.fetch_stories",
         "schedule": 10.0,
     },
+    "embed-stories-every-60-seconds": {
+        "task": "app.tasks.embed_stories",
+        "schedule": 60.0,
+    },
+    "prefetch-headline-feeds-every-5-minutes": {
+        "task": "app.tasks.prefetch_headline_feeds",
+        "schedule": 300.0,
+    },
 }
+
+
+@worker_init.connect
+@worker_process_init.connect
+def use_background_llm_priority(**kwargs):
+    # Celery work yields the OpenAI rate limits to interactive playground requests.
+    from src.services import rate_limit
+
+    rate_limit.default_priority = rate_limit.Priority.BACKGROUND
@@ -1,26 +1,55 @@
-from . import cache, sampling
+from . import aio, batch_ranking, cache, dedupe, rate_limit, replica, sampling
 from .external_data import (
+    get_latest_story_published_at,
     get_stories,
     get_stories_by_id,
     get_stories_by_title,
+    get_story_cache_stats,
+    get_story_ids_in_range,
+    get_story_texts,
     get_table_row_counts,
-    get_vector_search_stories,
+    iter_new_story_batches,
+    iter_story_batches,
 )
 from .headlines import get_all_bing_news_headlines
 from .llm import (
+    get_llm_cache_stats,
+    get_llm_executor_stats,
+    iter_concurrent_llm_requests_for_stories,
+    make_batched_llm_requests_for_stories,
     make_concurrent_llm_requests_for_stories,
     make_llm_request_for_story_batch,
 )
+from .vector_search import (
+    get_vector_search_stories,
+    get_vector_search_stories_for_queries,
+)
 
 __all__ = [
+    "aio",
+    "batch_ranking",
     "cache",
+    "dedupe",
+    "rate_limit",
+    "replica",
     "get_stories_by_id",
     "get_stories_by_title",
+    "get_story_cache_stats",
+    "get_story_ids_in_range",
+    "get_story_texts",
     "get_table_row_counts",
     "get_vector_search_stories",
+    "get_vector_search_stories_for_queries",
     "get_stories",
+    "get_latest_story_published_at",
+    "iter_new_story_batches",
+    "iter_story_batches",
+    "get_llm_cache_stats",
+    "get_llm_executor_stats",
     "make_llm_request_for_story_batch",
     "make_concurrent_llm_requests_for_stories",
+    "make_batched_llm_requests_for_stories",
+    "iter_concurrent_llm_requests_for_stories",
     "sampling",
     "get_all_bing_news_headlines",
 ]
@@ -0,0 +1,41 @@
+import asyncio
+import os
+import threading
+from typing import Awaitable, Optional, TypeVar
+
+T = TypeVar("T")
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """
+    Return the process-wide event loop, which runs forever on a daemon thread so that
+    async clients bound to it (and their keep-alive connections) outlive each call.
+    """
+    global _loop  # noqa: PLW0603
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=loop.run_forever, name="services-event-loop", daemon=True
+                ).start()
+                _loop = loop
+    return _loop
+
+
+def run(coro: Awaitable[T], timeout: Optional[float] = None) -> T:
+    """Run ``coro`` on the background event loop and block until it completes."""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop()).result(timeout)
+
+
+def _reset_loop_in_child():
+    # The loop's thread does not survive a fork, so the child starts its own.
+    global _loop, _loop_lock  # noqa: PLW0603
+    _loop = None
+    _loop_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_loop_in_child)
@@ -0,0 +1,170 @@
+import json
+import logging
+import os
+from http import HTTPStatus
+from typing import List, Optional, Tuple
+
+from openai import OpenAI
+from openai.types import Batch
+from pydantic import ValidationError
+
+from .llm import (
+    LLMSingleStoryValueResponse,
+    _response_format_schema,
+    _single_story_request,
+)
+
+LOG = logging.getLogger(__name__)
+
+RANKING_BATCH_ENDPOINT = "/v1/chat/completions"
+RANKING_BATCH_COMPLETION_WINDOW = "24h"
+# Points the Batch API at another server, e.g. the local stand-in in
+# tests/local_batch_server.py, without redirecting the playground's other OpenAI calls.
+OPENAI_BATCH_BASE_URL = os.environ.get("OPENAI_BATCH_BASE_URL")
+PENDING_BATCH_STATUSES = ("validating", "in_progress", "finalizing", "cancelling")
+# Batch input files may be at most 200 MB; stories beyond this size are left out.
+RANKING_BATCH_MAX_FILE_BYTES = int(
+    os.environ.get("RANKING_BATCH_MAX_FILE_BYTES", 190_000_000)
+)
+
+batch_client = OpenAI(base_url=OPENAI_BATCH_BASE_URL)
+
+
+def story_metadata(story) -> dict:
+    """The fields of a ranked story record, as stored with a batch job."""
+    published_at = story.published_at
+    return {
+        "id": str(story.id),
+        "title": story.title,
+        "similarity_score": story.similarity_score,
+        "position": story.position,
+        "publication": story.publication,
+        "published_at": published_at.isoformat() if published_at else None,
+    }
+
+
+def _json_schema_response_format(response_format) -> dict:
+    """
+    The strict JSON schema response format which the SDK's parse() sends for a
+    pydantic model. Strict mode requires every property and no others, which holds
+    for the flat response models the batch requests use.
+    """
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": response_format.__name__,
+            "schema": {
+                **_response_format_schema(response_format),
+                "additionalProperties": False,
+            },
+            "strict": True,
+        },
+    }
+
+
+def build_batch_file(
+    prompt: str, stories, attributes: List[str], max_bytes: int
+) -> Tuple[bytes, int]:
+    """
+    Serialise one chat completion per story, identical to the requests of
+    make_concurrent_llm_requests_for_stories, into a Batch API JSONL input file.
+    Stories are added in order until the file would exceed ``max_bytes``; the file
+    is returned with the number of stories it holds.
+    """
+    lines = []
+    size = 0
+    for story in stories:
+        request = _single_story_request(story, prompt, attributes)
+        request["response_format"] = _json_schema_response_format(
+            request["response_format"]
+        )
+        line = json.dumps(
+            {
+                "custom_id": str(story.id),
+                "method": "POST",
+                "url": RANKING_BATCH_ENDPOINT,
+                "body": request,
+            }
+        ).encode()
+        # Every line but the first is preceded by a newline.
+        size += len(line) + bool(lines)
+        if size > max_bytes:
+            break
+        lines.append(line)
+    return b"\n".join(lines), len(lines)
+
+
+def submit_batch(
+    prompt: str, stories, attributes: List[str], metadata: Optional[dict] = None
+) -> Tuple[str, int]:
+    """
+    Upload the stories' requests and start a batch, returning its id and the number
+    of leading ``stories`` that fit into its input file.
+    """
+    content, submitted = build_batch_file(
+        prompt, stories, attributes, max_bytes=RANKING_BATCH_MAX_FILE_BYTES
+    )
+    if not submitted:
+        raise ValueError("No story fits into a batch input file")
+    if submitted < len(stories):
+        LOG.warning(
+            f"Ranking batch input is capped at {RANKING_BATCH_MAX_FILE_BYTES} bytes "
+            f"| Stories: {submitted} of {len(stories)}"
+        )
+    input_file = batch_client.files.create(
+        file=("ranking.jsonl", content), purpose="batch"
+    )
+    batch = batch_client.batches.create(
+        input_file_id=input_file.id,
+        endpoint=RANKING_BATCH_ENDPOINT,
+        completion_window=RANKING_BATCH_COMPLETION_WINDOW,
+        metadata=metadata,
+    )
+    LOG.info(f"Submitted ranking batch {batch.id} | Stories: {submitted}")
+    return batch.id, submitted
+
+
+def get_batch(batch_id: str) -> Batch:
+    return batch_client.batches.retrieve(batch_id)
+
+
+def _story_value(line: dict) -> Optional[float]:
+    response = line.get("response") or {}
+    if line.get("error") or response.get("status_code") != HTTPStatus.OK:
+        LOG.warning(f"Batch request {line.get('custom_id')} failed: {line}")
+        return None
+    try:
+        content = response["body"]["choices"][0]["message"]["content"]
+        return LLMSingleStoryValueResponse.model_validate_json(content).value
+    except (KeyError, IndexError, TypeError, ValidationError) as e:
+        LOG.warning(f"Batch request {line.get('custom_id')} has no valid value: {e}")
+        return None
+
+
+def get_batch_results(batch: Batch, stories: List[dict]) -> List[dict]:
+    """
+    Parse a completed batch's output into the records returned by
+    make_concurrent_llm_requests_for_stories, highest value first. ``stories`` are
+    the story_metadata of the submitted stories; failed requests and malformed
+    responses are left out.
+    """
+    if batch.output_file_id is None:
+        return []
+    stories_by_id = {story["id"]: story for story in stories}
+    output = batch_client.files.content(batch.output_file_id).text
+    results = []
+    for raw_line in output.splitlines():
+        if not raw_line.strip():
+            continue
+        try:
+            line = json.loads(raw_line)
+        except json.JSONDecodeError as e:
+            LOG.warning(f"Malformed batch output line: {e}")
+            continue
+        story = stories_by_id.get(line.get("custom_id"))
+        if story is None:
+            continue
+        value = _story_value(line)
+        if value is not None:
+            results.append({**story, "value": value})
+    return sorted(results, key=lambda x: x["value"], reverse=True)
@@ -1,5 +1,14 @@
+import hashlib
 import json
+import logging
 import os
+import threading
+import time
+from collections import OrderedDict
+
+import redis
+
+LOG = logging.getLogger(__name__)
 
 CACHE_FILE = "cached_news_ranking_result.json"
 
@@ -14,3 +23,208 @@ def load_cached_result(filename=CACHE_FILE):
         with open(filename) as f:
             return json.load(f)
     return None
+
+
+class LRUCache:
+    """
+    A thread-safe, in-process LRU cache whose entries also expire after ``ttl``
+    seconds. Hits and misses are counted for every key looked up.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys, accept=None) -> dict:
+        """
+        Return the cached values for ``keys``. Entries for which ``accept(value)``
+        is false are treated (and counted) as misses but left in the cache.
+        """
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] <= now:
+                    del self._entries[key]
+                    entry = None
+                if entry is None or (accept is not None and not accept(entry[1])):
+                    self.misses += 1
+                    continue
+                self._entries.move_to_end(key)
+                found[key] = entry[1]
+                self.hits += 1
+        return found
+
+    def get(self, key, default=None):
+        return self.get_many([key]).get(key, default)
+
+    def peek(self, key, default=None):
+        """Return a live entry without counting a lookup or refreshing its recency."""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            return default
+        return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+            }
+
+
+_redis = None
+_redis_lock = threading.Lock()
+
+
+def get_redis() -> redis.Redis:
+    """Return the process-wide client for the shared Redis instance (REDIS_URL)."""
+    global _redis  # noqa: PLW0603
+    if _redis is None:
+        with _redis_lock:
+            if _redis is None:
+                url = os.environ["REDIS_URL"]
+                options = {"ssl_cert_reqs": None} if url.startswith("rediss://") else {}
+                _redis = redis.Redis.from_url(url, **options)
+    return _redis
+
+
+def make_key(*parts) -> str:
+    """Build a fixed-length cache key from JSON-serialisable parts."""
+    serialised = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(serialised.encode()).hexdigest()
+
+
+class SharedCache:
+    """
+    A cache stored in Redis and therefore shared by every gunicorn and celery worker.
+
+    Entries expire after ``ttl`` seconds, and once the namespace holds more than
+    ``max_entries`` entries the oldest ones are evicted. Values are stored as JSON,
+    so they must be JSON-serialisable. Redis errors and entries which cannot be
+    decoded are logged and treated as cache misses so callers never fail because of
+    the cache.
+    """
+
+    def __init__(self, namespace: str, ttl: int, max_entries: int):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    @property
+    def _index_key(self) -> str:
+        return f"{self.namespace}:__index__"
+
+    def get(self, key: str, default=None):
+        return self.get_many([key]).get(key, default)
+
+    def get_many(self, keys) -> dict:
+        """Return the cached values of ``keys`` that are present, in a single round trip."""
+        keys = list(keys)
+        if not keys:
+            return {}
+        try:
+            values = get_redis().mget([self._key(key) for key in keys])
+        except redis.RedisError as e:
+            LOG.warning(f"Shared cache '{self.namespace}' unavailable: {e}")
+            return {}
+        found = {}
+        for key, value in zip(keys, values):
+            if value is None:
+                continue
+            try:
+                found[key] = json.loads(value)
+            except ValueError as e:
+                LOG.warning(
+                    f"Shared cache '{self.namespace}' entry {key} is invalid: {e}"
+                )
+        return found
+
+    def set(self, key: str, value):
+        self.set_many({key: value})
+
+    def set_many(self, items: dict):
+        if not items:
+            return
+        now = time.time()
+        try:
+            client = get_redis()
+            pipe = client.pipeline()
+            for key, value in items.items():
+                pipe.set(self._key(key), json.dumps(value), ex=self.ttl)
+            pipe.zadd(self._index_key, {key: now for key in items})
+            pipe.zremrangebyscore(self._index_key, "-inf", now - self.ttl)
+            pipe.zcard(self._index_key)
+            size = pipe.execute()[-1]
+            if size > self.max_entries:
+                evicted = client.zpopmin(self._index_key, size - self.max_entries)
+                if evicted:
+                    client.delete(*[self._key(k.decode()) for k, _ in evicted])
+        except redis.RedisError as e:
+            LOG.warning(f"Shared cache '{self.namespace}' unavailable: {e}")
+
+    def delete(self, key: str):
+        try:
+            pipe = get_redis().pipeline()
+            pipe.delete(self._key(key))
+            pipe.zrem(self._index_key, key)
+            pipe.execute()
+        except redis.RedisError as e:
+            LOG.warning(f"Shared cache '{self.namespace}' unavailable: {e}")
+
+    def claim(self, key: str, ttl: int) -> bool:
+        """
+        Atomically claim ``key`` for ``ttl`` seconds across all workers, returning
+        whether this caller got it. Used to let a single worker refresh an entry.
+        """
+        try:
+            return bool(
+                get_redis().set(self._key(f"__claim__:{key}"), 1, nx=True, ex=ttl)
+            )
+        except redis.RedisError as e:
+            LOG.warning(f"Shared cache '{self.namespace}' unavailable: {e}")
+            return False
+
+    @property
+    def _counters_key(self) -> str:
+        return f"{self.namespace}:__counters__"
+
+    def incr(self, counter: str, amount: int = 1):
+        """Increment one of the namespace's shared counters, e.g. its hit count."""
+        try:
+            get_redis().hincrby(self._counters_key, counter, amount)
+        except redis.RedisError as e:
+            LOG.warning(f"Shared cache '{self.namespace}' unavailable: {e}")
+
+    def counters(self) -> dict:
+        try:
+            counters = get_redis().hgetall(self._counters_key)
+        except redis.RedisError as e:
+            LOG.warning(f"Shared cache '{self.namespace}' unavailable: {e}")
+            return {}
+        return {key.decode(): int(value) for key, value in counters.items()}
@@ -0,0 +1,172 @@
+import html
+import os
+import re
+import zlib
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+
+# Rows of the similarity matrix computed at a time, bounding memory to
+# DEDUPE_BLOCK_SIZE x N similarities instead of N x N.
+DEDUPE_BLOCK_SIZE = int(os.environ.get("DEDUPE_BLOCK_SIZE", 512))
+# Texts whose estimated Jaccard similarity of word shingles reaches this are treated
+# as near-verbatim duplicates without being embedded.
+LEXICAL_DUPLICATE_THRESHOLD = float(os.environ.get("LEXICAL_DUPLICATE_THRESHOLD", 0.8))
+SHINGLE_SIZE = 3
+# 16 bands of 4 rows make pairs with a Jaccard similarity of 0.5 or more likely to
+# share a band, comfortably below LEXICAL_DUPLICATE_THRESHOLD.
+MINHASH_BANDS = 16
+MINHASH_ROWS = 4
+_MINHASH_PRIME = np.uint64(4294967311)
+_minhash_rng = np.random.default_rng(0)
+_MINHASH_A = _minhash_rng.integers(
+    1, 2**32, MINHASH_BANDS * MINHASH_ROWS, dtype=np.uint64
+)
+_MINHASH_B = _minhash_rng.integers(
+    0, 2**32, MINHASH_BANDS * MINHASH_ROWS, dtype=np.uint64
+)
+_WORD_RE = re.compile(r"\w+")
+
+
+class UnionFind:
+    """Disjoint sets over ``0..size-1`` with path halving and union by size."""
+
+    def __init__(self, size: int):
+        self.parent = np.arange(size)
+        self.size = np.ones(size, dtype=np.int64)
+
+    def find(self, i: int) -> int:
+        parent = self.parent
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(self, i: int, j: int):
+        root_i, root_j = self.find(i), self.find(j)
+        if root_i == root_j:
+            return
+        if self.size[root_i] < self.size[root_j]:
+            root_i, root_j = root_j, root_i
+        self.parent[root_j] = root_i
+        self.size[root_i] += self.size[root_j]
+
+    def groups(self) -> List[List[int]]:
+        """Return every set as a sorted list, ordered by its smallest member."""
+        groups = {}
+        for i in range(len(self.parent)):
+            groups.setdefault(self.find(i), []).append(i)
+        return sorted(groups.values(), key=lambda members: members[0])
+
+
+def normalise(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, np.finfo(np.float32).eps)
+
+
+def iter_similar_pairs(
+    vectors: np.ndarray,
+    similarity_threshold: float,
+    block_size: int = DEDUPE_BLOCK_SIZE,
+) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Yield arrays ``(i, j)`` of the index pairs, ``i < j``, whose cosine similarity is
+    above ``similarity_threshold``, one block of rows at a time. ``vectors`` must be
+    L2-normalised.
+    """
+    for start in range(0, len(vectors), block_size):
+        end = min(start + block_size, len(vectors))
+        # Only the upper triangle is needed, so each block is compared with itself
+        # and the rows after it.
+        similarities = vectors[start:end] @ vectors[start:].T
+        rows, cols = np.nonzero(similarities > similarity_threshold)
+        upper = cols > rows
+        yield rows[upper] + start, cols[upper] + start
+
+
+def cluster_duplicates(
+    vectors: np.ndarray,
+    similarity_threshold: float,
+    block_size: int = DEDUPE_BLOCK_SIZE,
+) -> List[List[int]]:
+    """
+    Group vectors into clusters of near duplicates: the connected components of the
+    graph linking every pair more similar than ``similarity_threshold``. Clusters
+    are returned in order of their first member.
+    """
+    vectors = normalise(vectors)
+    union_find = UnionFind(len(vectors))
+    for rows, cols in iter_similar_pairs(vectors, similarity_threshold, block_size):
+        for i, j in zip(rows.tolist(), cols.tolist()):
+            union_find.union(i, j)
+    return union_find.groups()
+
+
+def most_central(
+    vectors: np.ndarray, members: List[int], weights: Optional[List[int]] = None
+) -> int:
+    """
+    Return the member with the highest (optionally weighted) mean similarity to the
+    rest of its cluster.
+    """
+    if len(members) == 1:
+        return members[0]
+    cluster = normalise(vectors[members])
+    weights = np.ones(len(members)) if weights is None else np.asarray(weights)
+    centroid = (cluster * weights[:, None].astype(np.float32)).sum(axis=0)
+    return members[int(np.argmax(cluster @ centroid))]
+
+
+def _shingle_hashes(text: str) -> np.ndarray:
+    words = _WORD_RE.findall(html.unescape(re.sub(r"<[^>]+>", " ", text)).lower())
+    shingles = {
+        " ".join(words[i : i + SHINGLE_SIZE])
+        for i in range(max(1, len(words) - SHINGLE_SIZE + 1))
+    }
+    return np.fromiter(
+        (zlib.crc32(shingle.encode()) for shingle in shingles),
+        dtype=np.uint64,
+        count=len(shingles),
+    )
+
+
+def minhash_signatures(texts: List[str]) -> np.ndarray:
+    """
+    Return a (len(texts), MINHASH_BANDS * MINHASH_ROWS) matrix of MinHash signatures
+    over lowercased word shingles. The fraction of equal signature values estimates
+    the Jaccard similarity of two texts' shingle sets.
+    """
+    signatures = np.empty((len(texts), len(_MINHASH_A)), dtype=np.uint64)
+    for i, text in enumerate(texts):
+        hashes = _shingle_hashes(text)
+        # a * x + b stays below 2**64 because a, b and x are all below 2**32.
+        permuted = (np.outer(hashes, _MINHASH_A) + _MINHASH_B) % _MINHASH_PRIME
+        signatures[i] = permuted.min(axis=0)
+    return signatures
+
+
+def cluster_near_verbatim(
+    texts: List[str], threshold: float = LEXICAL_DUPLICATE_THRESHOLD
+) -> List[List[int]]:
+    """
+    Group near-verbatim duplicate texts with MinHash and locality-sensitive hashing:
+    only pairs sharing a band of their signatures are compared, and those with an
+    estimated Jaccard similarity of at least ``threshold`` are joined. Clusters are
+    returned in order of their first member.
+    """
+    signatures = minhash_signatures(texts)
+    union_find = UnionFind(len(texts))
+    for band in range(MINHASH_BANDS):
+        buckets = {}
+        columns = signatures[:, band * MINHASH_ROWS : (band + 1) * MINHASH_ROWS]
+        for i, key in enumerate(map(bytes, columns)):
+            buckets.setdefault(key, []).append(i)
+        for bucket in buckets.values():
+            for a, i in enumerate(bucket):
+                for j in bucket[a + 1 :]:
+                    if union_find.find(i) == union_find.find(j):
+                        continue
+                    if np.mean(signatures[i] == signatures[j]) >= threshold:
+                        union_find.union(i, j)
+    return union_find.groups()
@@ -1,16 +1,105 @@
-import datetime
+import logging
 import os
+import threading
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 
-import httpx
-import psycopg2
+from . import replica
+from .cache import LRUCache
 
+LOG = logging.getLogger(__name__)
 
-def get_stories(start_date, limit=10):
-    host = os.environ["REPLICA_HOST"]
-    database = os.environ["REPLICA_DB"]
-    user = os.environ["REPLICA_USER"]
-    password = os.environ["REPLICA_PASSWORD"]
+STORY_STREAM_BATCH_SIZE = 500
+STORY_CACHE_MAX_SIZE = int(os.environ.get("STORY_CACHE_MAX_SIZE", 2000))
+STORY_CACHE_TTL = float(os.environ.get("STORY_CACHE_TTL", 600))
+STORY_LOOKUP_CHUNK_SIZE = int(os.environ.get("STORY_LOOKUP_CHUNK_SIZE", 2000))
+STORY_LOOKUP_CONCURRENCY = int(os.environ.get("STORY_LOOKUP_CONCURRENCY", 4))
+
+# Story field name -> replica column expression. A query only selects the columns
+# of the fields it was asked for; `id` is always included.
+STORY_COLUMNS = {
+    "id": "st.id",
+    "title": "st.title",
+    "text": "s.text",
+    "published_at": "st.published_at",
+    "publication": "p.name",
+    "author": "st.author",
+    "type": "st.type",
+    "classification": "st.classification",
+}
+STORY_FIELDS = list(STORY_COLUMNS)
+STORY_FIELDS_WITHOUT_TEXT = [field for field in STORY_FIELDS if field != "text"]
+
+
+def resolve_story_fields(fields):
+    if fields is None:
+        return STORY_FIELDS
+    unknown_fields = set(fields) - set(STORY_COLUMNS)
+    if unknown_fields:
+        raise ValueError(f"Unknown story fields: {sorted(unknown_fields)}")
+    return [field for field in STORY_FIELDS if field == "id" or field in fields]
+
+
+def _story_columns(fields):
+    return ", ".join(STORY_COLUMNS[field] for field in fields)
+
+
+def _story_from_row(row, fields):
+    story = dict(zip(fields, row))
+    # psycopg2 returns UUID objects once Django has registered its uuid adapter
+    story["id"] = str(story["id"])
+    return story
+
+
+def _fetch_by_array(query, param_type, values):
+    """
+    Run ``query``, whose only parameter ``$1`` is an array of ``param_type``, for
+    ``values`` split into chunks of STORY_LOOKUP_CHUNK_SIZE. Chunks are executed
+    concurrently on separate pooled connections and their rows concatenated.
+    """
+
+    def fetch(chunk):
+        with replica.connection() as conn, conn.cursor() as cur:
+            replica.execute_prepared(cur, query, [param_type], (chunk,))
+            return cur.fetchall()
+
+    chunks = [
+        values[i : i + STORY_LOOKUP_CHUNK_SIZE]
+        for i in range(0, len(values), STORY_LOOKUP_CHUNK_SIZE)
+    ]
+    if len(chunks) <= 1:
+        results = [fetch(chunk) for chunk in chunks]
+    else:
+        max_workers = min(STORY_LOOKUP_CONCURRENCY, len(chunks))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(fetch, chunks))
+    return [row for rows in results for row in rows]
+
+
+def validate_story_ids(story_ids):
+    # do security check on the list and make sure it's a list of uuids
+    if not isinstance(story_ids, list):
+        raise ValueError("story_ids should be a list of story ids")
+    for story_id in story_ids:
+        try:
+            uuid.UUID(story_id, version=4)
+        except ValueError:
+            raise ValueError("story_ids should be a list of valid story ids") from None
+
+
+def iter_story_batches(
+    start_date=None, limit=10, batch_size=STORY_STREAM_BATCH_SIZE, fields=None
+):
+    """
+    Stream stories published since ``start_date`` in batches of ``batch_size``.
+
+    ``fields`` restricts the selected columns (all fields by default), e.g. pass
+    ``STORY_FIELDS_WITHOUT_TEXT`` to skip transferring the full script text.
+
+    The rows are read through a named (server-side) cursor, so at most one batch is
+    held in memory at a time regardless of ``limit``. The replica connection is
+    borrowed for as long as the returned generator is being consumed.
+    """
     if not isinstance(limit, int):
         raise ValueError("limit should be an integer")
     min_limit = 1
@@ -20,10 +109,10 @@ def get_stories(start_date, limit=10):
     if limit > max_limit:
         raise ValueError("limit should be less than 100000")
 
-    conn = psycopg2.connect(host=host, database=database, user=user, password=password)
+    fields = resolve_story_fields(fields)
     query = f"""
     SELECT
-        st.id, st.title, s.text, st.published_at, p.name as publication, st.author, st.type, st.classification
+        {_story_columns(fields)}
     FROM
         content_story st
     INNER JOIN
@@ -32,46 +121,125 @@ def get_stories(start_date, limit=10):
         content_publication p on p.id = st.publication_id
     WHERE
         st.published_at::date <= current_date
-        AND st.published_at::date >= '{start_date}'
+        AND (%(start_date)s::date IS NULL OR st.published_at::date >= %(start_date)s::date)
         AND (st.type != 'SEGMENT' OR st.type IS NULL)
     ORDER BY
         st.published_at DESC
-    LIMIT ({limit});
+    LIMIT %(limit)s;
     """
 
+    def batches():
+        cursor_name = f"stories_{uuid.uuid4().hex}"
+        with replica.connection() as conn, conn.cursor(name=cursor_name) as cur:
+            cur.execute(query, {"start_date": start_date, "limit": limit})
+            while rows := cur.fetchmany(batch_size):
+                yield [_story_from_row(row, fields) for row in rows]
+
+    return batches()
+
+
+def get_stories(start_date, limit=10, fields=None):
+    batches = iter_story_batches(start_date=start_date, limit=limit, fields=fields)
     try:
-        cur = conn.cursor()
-        cur.execute(query)
-        result = cur.fetchall()
-        table_row_count_dict = [
-            {
-                "id": row[0],
-                "title": row[1],
-                "text": row[2],
-                "published_at": row[3],
-                "publication": row[4],
-                "author": row[5],
-                "type": row[6],
-                "classification": row[7],
-            }
-            for row in result
-        ]
-        cur.close()
-        conn.close()
-        return {"total": len(table_row_count_dict), "data": table_row_count_dict}
+        stories = [story for batch in batches for story in batch]
+        return {"total": len(stories), "data": stories}
     except Exception:
         return {}
 
 
-def get_table_row_counts(
-    host=os.environ["REPLICA_HOST"],
-    database=os.environ["REPLICA_DB"],
-    user=os.environ["REPLICA_USER"],
-    password=os.environ["REPLICA_PASSWORD"],
+def iter_new_story_batches(
+    after_published_at, after_id=None, limit=1000, batch_size=STORY_STREAM_BATCH_SIZE
 ):
-    # Database connection details (you can load these from environment variables)
-    conn = psycopg2.connect(host=host, database=database, user=user, password=password)
+    """
+    Stream stories published after the ``(after_published_at, after_id)`` keyset
+    cursor, oldest first, so an incremental sync can resume from the last story it
+    stored.
+    """
+    if after_id is None:
+        cursor_condition = "st.published_at > %(after_published_at)s"
+    else:
+        cursor_condition = (
+            "(st.published_at, st.id) > (%(after_published_at)s, %(after_id)s::uuid)"
+        )
+    fields = STORY_FIELDS
+    query = f"""
+    SELECT
+        {_story_columns(fields)}
+    FROM
+        content_story st
+    INNER JOIN
+        scripts_script s on s.story_id = st.id
+    INNER JOIN
+        content_publication p on p.id = st.publication_id
+    WHERE
+        {cursor_condition}
+        AND st.published_at < current_date + 1
+        AND (st.type != 'SEGMENT' OR st.type IS NULL)
+    ORDER BY
+        st.published_at, st.id
+    LIMIT %(limit)s;
+    """
+    params = {
+        "after_published_at": after_published_at,
+        "after_id": str(after_id) if after_id is not None else None,
+        "limit": limit,
+    }
+
+    cursor_name = f"new_stories_{uuid.uuid4().hex}"
+    with replica.connection() as conn, conn.cursor(name=cursor_name) as cur:
+        cur.execute(query, params)
+        while rows := cur.fetchmany(batch_size):
+            yield [_story_from_row(row, fields) for row in rows]
+
 
+def get_story_ids_in_range(after_published_at, until_published_at, until_id):
+    """
+    Return the ids of the stories in the keyset range from ``after_published_at``
+    (exclusive) to ``(until_published_at, until_id)`` (inclusive), without their
+    content, so a sync can check which of them it has not stored yet.
+    """
+    query = """
+    SELECT
+        st.id
+    FROM
+        content_story st
+    INNER JOIN
+        scripts_script s on s.story_id = st.id
+    INNER JOIN
+        content_publication p on p.id = st.publication_id
+    WHERE
+        st.published_at > %(after_published_at)s
+        AND (st.published_at, st.id) <= (%(until_published_at)s, %(until_id)s::uuid)
+        AND (st.type != 'SEGMENT' OR st.type IS NULL);
+    """
+    params = {
+        "after_published_at": after_published_at,
+        "until_published_at": until_published_at,
+        "until_id": str(until_id),
+    }
+
+    with replica.connection() as conn, conn.cursor() as cur:
+        cur.execute(query, params)
+        return [str(row[0]) for row in cur.fetchall()]
+
+
+def get_latest_story_published_at():
+    query = """
+    SELECT
+        max(st.published_at)
+    FROM
+        content_story st
+    WHERE
+        st.published_at < current_date + 1
+        AND (st.type != 'SEGMENT' OR st.type IS NULL);
+    """
+
+    with replica.connection() as conn, conn.cursor() as cur:
+        cur.execute(query)
+        return cur.fetchone()[0]
+
+
+def get_table_row_counts():
     # Query to get table names and row counts from public schema
     query = """
     SELECT
@@ -85,40 +253,22 @@ def get_table_row_counts(
         row_count DESC;
     """
 
-    try:
-        cur = conn.cursor()
-        cur.execute(query)
-        result = cur.fetchall()
-        table_row_count_dict = {row[0]: row[1] for row in result}
-        cur.close()
-        conn.close()
-        return table_row_count_dict
-    except Exception:
-        return {}
-
-
-def get_stories_by_id(story_ids):
-    host = os.environ["REPLICA_HOST"]
-    database = os.environ["REPLICA_DB"]
-    user = os.environ["REPLICA_USER"]
-    password = os.environ["REPLICA_PASSWORD"]
-
-    # do security check on the list and make sure it's a list of uuids
-    if not isinstance(story_ids, list):
-        raise ValueError("story_ids should be a list of story ids")
-    for story_id in story_ids:
+    with replica.connection() as conn:
         try:
-            uuid.UUID(story_id, version=4)
-        except ValueError:
-            raise ValueError("story_ids should be a list of valid story ids") from None
-
-    story_ids_placeholder = ", ".join(["%s"] * len(story_ids))
+            cur = conn.cursor()
+            cur.execute(query)
+            result = cur.fetchall()
+            table_row_count_dict = {row[0]: row[1] for row in result}
+            cur.close()
+            return table_row_count_dict
+        except Exception:
+            return {}
 
-    conn = psycopg2.connect(host=host, database=database, user=user, password=password)
 
+def _query_stories_by_id(story_ids, fields):
     query = f"""
         SELECT
-            st.id, st.title, s.text, st.published_at, p.name as publication, st.author, st.type, st.classification
+            {_story_columns(fields)}
         FROM
             content_story st
         INNER JOIN
@@ -126,75 +276,107 @@ def get_stories_by_id(story_ids):
         INNER JOIN
             content_publication p on p.id = st.publication_id
         WHERE
-            st.id IN ({story_ids_placeholder})
-        ORDER BY
-            st.published_at DESC;
+            st.id = ANY($1);
     """
 
     try:
-        cur = conn.cursor()
-        cur.execute(query, (*story_ids,))
-        result = cur.fetchall()
-        table_row_count_dict = [
-            {
-                "id": row[0],
-                "title": row[1],
-                "text": row[2],
-                "published_at": row[3],
-                "publication": row[4],
-                "author": row[5],
-                "type": row[6],
-                "classification": row[7],
-            }
-            for row in result
-        ]
-
-        cur.close()
-        conn.close()
-
-        return {"total": len(table_row_count_dict), "data": table_row_count_dict}
-
+        result = _fetch_by_array(query, "uuid[]", story_ids)
+        return [_story_from_row(row, fields) for row in result]
     except Exception:
-        return {}
+        return None
 
 
-def get_vector_search_stories(start_date, limit, vector_search):
-    end_date_time = datetime.datetime.now().isoformat()
-    vector_db_url = "http://13.92.253.7"
-    headers = {
-        "accept": "application/json",
-        "Content-Type": "application/json",
-    }
-    payload = {
-        "query": str(vector_search),
-        "n_results": limit,
-        "start_date_time": start_date,
-        "end_date_time": end_date_time,
-    }
-    response = httpx.post(
-        f"{vector_db_url}/search_articles/", headers=headers, json=payload
+story_cache = LRUCache(maxsize=STORY_CACHE_MAX_SIZE, ttl=STORY_CACHE_TTL)
+_story_cache_generation = None
+_story_cache_generation_lock = threading.Lock()
+
+
+def _story_cache_is_current():
+    """
+    Clear the story cache whenever the replica comes back after being unavailable
+    (e.g. after being re-populated), and report whether it may be written to.
+    """
+    global _story_cache_generation  # noqa: PLW0603
+    available, generation = replica.availability()
+    with _story_cache_generation_lock:
+        if generation != _story_cache_generation:
+            story_cache.clear()
+            _story_cache_generation = generation
+    return available
+
+
+def get_story_cache_stats():
+    return story_cache.stats()
+
+
+def get_stories_by_id(story_ids, fields=None):
+    """
+    Fetch stories by id, in the order requested.
+
+    Stories are served from an in-process LRU/TTL cache where possible and only
+    the misses are queried from the replica. The cache is cleared whenever the
+    replica becomes available again and is not written to while it is unavailable.
+    """
+    validate_story_ids(story_ids)
+    fields = resolve_story_fields(fields)
+    story_ids = list(dict.fromkeys(str(uuid.UUID(story_id)) for story_id in story_ids))
+    use_cache = _story_cache_is_current()
+
+    stories = story_cache.get_many(
+        story_ids, accept=lambda story: all(field in story for field in fields)
     )
-    response.raise_for_status()
-    return response.json()[0]
+    missing_ids = [story_id for story_id in story_ids if story_id not in stories]
+    LOG.info(
+        f"Story lookup | Requested: {len(story_ids)} | Cached: {len(stories)} "
+        f"| Cache: {get_story_cache_stats()}"
+    )
+    if missing_ids:
+        fetched_stories = _query_stories_by_id(missing_ids, fields)
+        if fetched_stories is None:
+            return {}
+        for fetched in fetched_stories:
+            story_id = str(fetched["id"])
+            story = fetched
+            if use_cache:
+                # Keep the fields of a cached entry that this query did not select.
+                story = {**story_cache.peek(story_id, {}), **fetched}
+                story_cache.set(story_id, story)
+            stories[story_id] = story
+
+    result = [
+        {field: stories[story_id][field] for field in fields}
+        for story_id in story_ids
+        if story_id in stories
+    ]
+    return {"total": len(result), "data": result}
 
 
-def get_stories_by_title(story_titles):
-    host = os.environ["REPLICA_HOST"]
-    database = os.environ["REPLICA_DB"]
-    user = os.environ["REPLICA_USER"]
-    password = os.environ["REPLICA_PASSWORD"]
+def get_story_texts(story_ids):
+    """Fetch the script text for each of ``story_ids``, keyed by story id."""
+    validate_story_ids(story_ids)
 
+    query = """
+        SELECT
+            s.story_id, s.text
+        FROM
+            scripts_script s
+        WHERE
+            s.story_id = ANY($1);
+    """
+
+    result = _fetch_by_array(query, "uuid[]", story_ids)
+    return {str(story_id): text for story_id, text in result}
+
+
+def get_stories_by_title(story_titles, fields=None):
     # do security check on the list and make sure it's a list of uuids
     if not isinstance(story_titles, list):
         raise ValueError("story_ids should be a list of story ids")
-
-    story_titles_placeholder = ", ".join(["%s"] * len(story_titles))
-
-    conn = psycopg2.connect(host=host, database=database, user=user, password=password)
+    fields = resolve_story_fields(fields)
 
     query = f"""
         SELECT
-            st.id, st.title, s.text, st.published_at, p.name as publication, st.author, st.type, st.classification
+            {_story_columns(fields)}
         FROM
             content_story st
         INNER JOIN
@@ -202,33 +384,16 @@ def get_stories_by_title(story_titles):
         INNER JOIN
             content_publication p on p.id = st.publication_id
         WHERE
-            st.title IN ({story_titles_placeholder})
+            st.title = ANY($1)
         ORDER BY
             st.published_at DESC;
     """
 
     try:
-        cur = conn.cursor()
-        cur.execute(query, (*story_titles,))
-        result = cur.fetchall()
-        table_row_count_dict = [
-            {
-                "id": row[0],
-                "title": row[1],
-                "text": row[2],
-                "published_at": row[3],
-                "publication": row[4],
-                "author": row[5],
-                "type": row[6],
-                "classification": row[7],
-            }
-            for row in result
-        ]
-
-        cur.close()
-        conn.close()
-
-        return {"total": len(table_row_count_dict), "data": table_row_count_dict}
-
+        result = _fetch_by_array(query, "text[]", story_titles)
+        stories = [_story_from_row(row, fields) for row in result]
+        if "published_at" in fields:
+            stories.sort(key=lambda story: story["published_at"], reverse=True)
+        return {"total": len(stories), "data": stories}
     except Exception:
         return {}
@@ -1,21 +1,46 @@
+import asyncio
 import html
+import importlib.util
 import logging
 import os
-from concurrent.futures import ThreadPoolExecutor
+import time
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 
 import httpx
-import numpy as np
-from retry import retry
 
-from app.types import Headline, HeadlineStoryQueryStrategy
-from src.services import get_stories_by_id, get_vector_search_stories
-from src.services.llm import openai_text_intra_similarity
+from app.types import (
+    ClusterRepresentative,
+    Headline,
+    HeadlineCluster,
+    HeadlineStoryQueryStrategy,
+)
+from src.services import aio, dedupe
+from src.services.cache import SharedCache, make_key
+from src.services.llm import openai_text_embeddings
+from src.services.vector_search import get_vector_search_stories_for_queries
 
 SUBSCRIPTION_KEY = os.environ["BING_NEWS_API_KEY"]
 BING_NEWS_TOPIC_URL = "https://api.bing.microsoft.com/v7.0/news"
 BING_NEWS_SEARCH_URL = "https://api.bing.microsoft.com/v7.0/news/search"
+TOP_HEADLINES_FEED = "TopGeneralHeadlines"
+# Feeds use freshness "day", so they are served from the cache for a few minutes and
+# then refreshed in the background while the stale copy is still being served.
+BING_FEED_FRESH_SECONDS = int(os.environ.get("BING_FEED_FRESH_SECONDS", 300))
+BING_FEED_STALE_SECONDS = int(os.environ.get("BING_FEED_STALE_SECONDS", 3600))
+BING_FEED_REVALIDATE_TIMEOUT = 60
+BING_TIMEOUT = float(os.environ.get("BING_TIMEOUT", 10))
+BING_CONNECT_TIMEOUT = float(os.environ.get("BING_CONNECT_TIMEOUT", 5))
+BING_MAX_CONNECTIONS = int(os.environ.get("BING_MAX_CONNECTIONS", 20))
+BING_RETRY_TRIES = 3
+BING_RETRY_DELAY = 2
+BING_RETRY_BACKOFF = 4
+BING_RETRY_MAX_DELAY = 20
+# Feeds prefetched by the prefetch_headline_feeds task are used by the news playground
+# until they are older than this. The top news feed is prefetched at the largest
+# headline limit the playground allows.
+HEADLINE_PREFETCH_MAX_AGE = int(os.environ.get("HEADLINE_PREFETCH_MAX_AGE", 900))
+PREFETCH_TOP_HEADLINES_LIMIT = 50
 
 
 class RateLimitedError(Exception):
@@ -32,6 +57,34 @@ HTTP_SERVER_ERROR = 500
 
 LOG = logging.getLogger(__name__)
 
+bing_feed_cache = SharedCache("bing-feed", ttl=BING_FEED_STALE_SECONDS, max_entries=500)
+prefetched_feed_cache = SharedCache(
+    "headline-feeds", ttl=HEADLINE_PREFETCH_MAX_AGE, max_entries=20
+)
+
+_client = None
+
+
+def _get_client() -> httpx.AsyncClient:
+    # Only ever used from the services event loop, which owns its connections.
+    global _client  # noqa: PLW0603
+    if _client is None:
+        _client = httpx.AsyncClient(
+            headers={"Ocp-Apim-Subscription-Key": SUBSCRIPTION_KEY},
+            timeout=httpx.Timeout(BING_TIMEOUT, connect=BING_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=BING_MAX_CONNECTIONS),
+            http2=importlib.util.find_spec("h2") is not None,
+        )
+    return _client
+
+
+def _reset_client_in_child():
+    global _client  # noqa: PLW0603
+    _client = None
+
+
+os.register_at_fork(after_in_child=_reset_client_in_child)
+
 
 def _bing_categories_gb() -> List[str]:
     return [
@@ -62,14 +115,14 @@ def _bing_categories_us() -> List[str]:
     ]
 
 
-def _bing_request(url: str, headers: Dict, params: Dict) -> Dict:
+async def _bing_request(url: str, params: Dict) -> Dict:
     try:
-        resp = httpx.get(url=url, headers=headers, params=params)
+        resp = await _get_client().get(url=url, params=params)
         resp.raise_for_status()
         if "category" in params:
             return {**resp.json(), "category": params["category"]}
         else:
-            return {**resp.json(), "category": "TopGeneralHeadlines"}
+            return {**resp.json(), "category": TOP_HEADLINES_FEED}
     except httpx.HTTPStatusError as err:
         if err.response.status_code == HTTP_TOO_MANY_REQUEST:
             raise RateLimitedError() from err
@@ -79,6 +132,19 @@ def _bing_request(url: str, headers: Dict, params: Dict) -> Dict:
             raise err
 
 
+async def _bing_request_with_retries(url: str, params: Dict) -> Dict:
+    delay = BING_RETRY_DELAY
+    for attempt in range(1, BING_RETRY_TRIES + 1):
+        try:
+            return await _bing_request(url, params)
+        except (RateLimitedError, BingAPIServerError) as e:
+            if attempt == BING_RETRY_TRIES:
+                raise
+            LOG.warning(f"{e!r}, retrying Bing request in {delay} seconds...")
+            await asyncio.sleep(delay)
+            delay = min(delay * BING_RETRY_BACKOFF, BING_RETRY_MAX_DELAY)
+
+
 def _id_from_bing_headline(headline_result: Dict) -> str:
     headline_description = headline_result["description"]
     headline_description = html.unescape(headline_description)
@@ -92,48 +158,93 @@ def _id_from_bing_headline(headline_result: Dict) -> str:
     return "-".join(first_5_words)
 
 
-def get_all_bing_news_headlines(
-    market: str,
-    use_top_headlines_feed: Optional[bool] = False,
-    headline_limit: Optional[int] = 20,
-) -> List[Headline]:
-    market_str = "en-GB" if market == "GB" else "en-US"
-    categories = _bing_categories_gb() if market == "GB" else _bing_categories_us()
-    base_headers = {"Ocp-Apim-Subscription-Key": SUBSCRIPTION_KEY}
+def _bing_feed_cache_key(market: str, feed: str, headline_limit: int) -> str:
+    # Only the top news search takes a count, the category feeds always return the
+    # same page regardless of the requested headline limit.
+    count = headline_limit if feed == TOP_HEADLINES_FEED else None
+    return make_key(market, feed, count)
+
+
+async def _fetch_bing_feed(market: str, feed: str, headline_limit: int) -> Dict:
     params = {
         "textDecorations": True,
         "textFormat": "HTML",
         "sortBy": "Relevance",
         "freshness": "day",
-        "mkt": market_str,
+        "mkt": "en-GB" if market == "GB" else "en-US",
     }
-    retry_policy = retry(
-        exceptions=(RateLimitedError, BingAPIServerError),
-        tries=3,
-        delay=2,
-        backoff=4,
-        max_delay=20,
-    )
-
-    if use_top_headlines_feed:
+    if feed == TOP_HEADLINES_FEED:
         url = BING_NEWS_SEARCH_URL
-        results = retry_policy(
-            lambda: _bing_request(
-                url, base_headers, {**params, "count": headline_limit, "q": "top news"}
-            )
-        )()
-        results = [results]
+        params = {**params, "count": headline_limit, "q": "top news"}
     else:
         url = BING_NEWS_TOPIC_URL
-        results = ThreadPoolExecutor(max_workers=5).map(
-            lambda category: retry_policy(
-                lambda: _bing_request(
-                    url, base_headers, {**params, "category": category}
-                )
-            )(),
-            categories,
+        params = {**params, "category": feed}
+    return await _bing_request_with_retries(url, params)
+
+
+def _store_bing_feed(market: str, feed: str, headline_limit: int, result: Dict):
+    bing_feed_cache.set(
+        _bing_feed_cache_key(market, feed, headline_limit),
+        {"fetched_at": time.time(), "result": result},
+    )
+
+
+async def _refresh_bing_feeds_async(
+    market: str, feeds: List[str], headline_limit: int
+) -> List[Dict]:
+    results = await asyncio.gather(
+        *[_fetch_bing_feed(market, feed, headline_limit) for feed in feeds],
+        return_exceptions=True,
+    )
+    # Feeds that were fetched are cached even if another one failed, so that
+    # retrying only has to fetch the failed feeds again.
+    for feed, result in zip(feeds, results):
+        if not isinstance(result, BaseException):
+            await asyncio.to_thread(
+                _store_bing_feed, market, feed, headline_limit, result
+            )
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return results
+
+
+def _refresh_bing_feeds(
+    market: str, feeds: List[str], headline_limit: int
+) -> List[Dict]:
+    """Fetch the given feeds from Bing concurrently and cache them."""
+    return aio.run(_refresh_bing_feeds_async(market, feeds, headline_limit))
+
+
+async def _revalidate_bing_feed(market: str, feed: str, headline_limit: int):
+    try:
+        await _refresh_bing_feeds_async(market, [feed], headline_limit)
+    except Exception as e:
+        LOG.warning(f"Failed to refresh Bing {market} {feed} feed: {e}")
+
+
+def _get_cached_bing_feed(
+    market: str, feed: str, headline_limit: int
+) -> Optional[Dict]:
+    """
+    Return a single Bing feed from the shared cache, or None if it is not cached.
+
+    Entries older than BING_FEED_FRESH_SECONDS are still returned, but one worker
+    refreshes them in the background.
+    """
+    cache_key = _bing_feed_cache_key(market, feed, headline_limit)
+    entry = bing_feed_cache.get(cache_key)
+    if entry is None:
+        return None
+    is_stale = time.time() - entry["fetched_at"] >= BING_FEED_FRESH_SECONDS
+    if is_stale and bing_feed_cache.claim(cache_key, ttl=BING_FEED_REVALIDATE_TIMEOUT):
+        asyncio.run_coroutine_threadsafe(
+            _revalidate_bing_feed(market, feed, headline_limit), aio.get_loop()
         )
+    return entry["result"]
+
 
+def _headlines_from_bing_results(results) -> List[Headline]:
     headlines = {}
     for result in results:
         for headline_result in result["value"]:
@@ -145,78 +256,249 @@ def get_all_bing_news_headlines(
                     summary=html.unescape(headline_result["description"]),
                     publication=headline_result["provider"][0]["name"],
                     category=result["category"],
+                    published_at=headline_result.get("datePublished"),
                 )
     return list(headlines.values())
 
 
-def match_headlines_to_internal_stories(
-    headlines: List[Headline], query_strategy: HeadlineStoryQueryStrategy
-) -> List[Optional[Tuple[Dict, float]]]:
-    return list(
-        ThreadPoolExecutor(max_workers=10).map(
-            lambda h: match_headline_to_internal_story(h, query_strategy), headlines
+def _bing_feeds(market: str, use_top_headlines_feed: bool) -> List[str]:
+    if use_top_headlines_feed:
+        return [TOP_HEADLINES_FEED]
+    return _bing_categories_gb() if market == "GB" else _bing_categories_us()
+
+
+def get_all_bing_news_headlines(
+    market: str,
+    use_top_headlines_feed: Optional[bool] = False,
+    headline_limit: Optional[int] = 20,
+) -> List[Headline]:
+    feeds = _bing_feeds(market, use_top_headlines_feed)
+    results = {
+        feed: _get_cached_bing_feed(market, feed, headline_limit) for feed in feeds
+    }
+    missing_feeds = [feed for feed, result in results.items() if result is None]
+    if missing_feeds:
+        results.update(
+            zip(
+                missing_feeds,
+                _refresh_bing_feeds(market, missing_feeds, headline_limit),
+            )
         )
+    return _headlines_from_bing_results(results[feed] for feed in feeds)
+
+
+def _prefetched_feed_key(market: str, use_top_headlines_feed: bool) -> str:
+    return f"{market}:{'top-news' if use_top_headlines_feed else 'categories'}"
+
+
+def prefetch_bing_news_headlines(market: str, use_top_headlines_feed: bool) -> int:
+    """
+    Fetch a market's category or top news feed from Bing and store the normalised
+    headlines for get_prefetched_bing_news_headlines, returning how many there are.
+    """
+    headline_limit = PREFETCH_TOP_HEADLINES_LIMIT if use_top_headlines_feed else None
+    results = _refresh_bing_feeds(
+        market, _bing_feeds(market, use_top_headlines_feed), headline_limit
     )
+    headlines = _headlines_from_bing_results(results)
+    prefetched_feed_cache.set(
+        _prefetched_feed_key(market, use_top_headlines_feed),
+        {
+            "fetched_at": time.time(),
+            "headlines": [headline.model_dump() for headline in headlines],
+        },
+    )
+    return len(headlines)
 
 
-def match_headline_to_internal_story(
-    headline: Headline, query_strategy: Optional[HeadlineStoryQueryStrategy] = None
-) -> Optional[Tuple[Dict, float]]:
-    query_strategy = query_strategy or HeadlineStoryQueryStrategy.USE_SUMMARY
+def get_prefetched_bing_news_headlines(
+    market: str,
+    use_top_headlines_feed: Optional[bool] = False,
+    headline_limit: Optional[int] = 20,
+) -> Optional[List[Headline]]:
+    """
+    Return the headlines stored by the prefetch task, or None when they are missing,
+    older than HEADLINE_PREFETCH_MAX_AGE seconds or cannot satisfy headline_limit.
+    """
+    entry = prefetched_feed_cache.get(
+        _prefetched_feed_key(market, use_top_headlines_feed)
+    )
+    if entry is None or time.time() - entry["fetched_at"] > HEADLINE_PREFETCH_MAX_AGE:
+        return None
+    headlines = [Headline(**headline) for headline in entry["headlines"]]
+    if not use_top_headlines_feed:
+        return headlines
+    if headline_limit > PREFETCH_TOP_HEADLINES_LIMIT:
+        return None
+    return headlines[:headline_limit]
+
+
+def _query_text_for_headline(
+    headline: Headline, query_strategy: HeadlineStoryQueryStrategy
+) -> str:
     match query_strategy:
         case HeadlineStoryQueryStrategy.USE_TITLE:
-            query_text = headline.title
+            return headline.title
         case HeadlineStoryQueryStrategy.USE_SUMMARY:
-            query_text = headline.summary
+            return headline.summary
         case HeadlineStoryQueryStrategy.USE_TITLE_AND_SUMMARY:
-            query_text = f"{headline.title}   {headline.summary}"
+            return f"{headline.title}   {headline.summary}"
         case _:
             raise ValueError(f"Unsupported query strategy {query_strategy}")
 
-    similarity_results = get_vector_search_stories(
+
+def match_headlines_to_internal_stories(
+    headlines: List[Headline],
+    query_strategy: HeadlineStoryQueryStrategy,
+    story_source=None,
+) -> List[Optional[Tuple[Dict, float]]]:
+    """
+    Match each headline to its most similar internal story.
+
+    All headlines are searched concurrently over the shared vector search client and
+    the best matching stories are then fetched with a single query to
+    ``story_source`` (by default the replica, or the local mirror while the replica
+    is unavailable).
+    """
+    if story_source is None:
+        from app.repo.story_sources import get_story_source
+
+        story_source = get_story_source()
+    query_strategy = query_strategy or HeadlineStoryQueryStrategy.USE_SUMMARY
+    query_texts = [
+        _query_text_for_headline(headline, query_strategy) for headline in headlines
+    ]
+    all_similarity_results = get_vector_search_stories_for_queries(
         start_date=(datetime.now() - timedelta(days=3)).isoformat(),
         limit=3,
-        vector_search=query_text,
+        vector_searches=query_texts,
     )
-    if len(similarity_results) == 0:
-        return None
-    else:
-        best_match_story_id = similarity_results[0]["id"]
-        best_match_score = similarity_results[0]["similarity_score"]
-        best_match_stories = get_stories_by_id([best_match_story_id])["data"]
-        if len(best_match_stories) == 0:
+    best_matches = [
+        (results[0]["id"], results[0]["similarity_score"]) if results else None
+        for results in all_similarity_results
+    ]
+    best_match_story_ids = list(
+        dict.fromkeys(match[0] for match in best_matches if match is not None)
+    )
+    best_match_stories = (
+        {
+            story["id"]: story
+            for story in story_source.get_stories_by_id(
+                story_ids=best_match_story_ids
+            ).get("data", [])
+        }
+        if best_match_story_ids
+        else {}
+    )
+
+    matches = []
+    for best_match in best_matches:
+        if best_match is None:
+            matches.append(None)
+            continue
+        best_match_story_id, best_match_score = best_match
+        best_match_story = best_match_stories.get(best_match_story_id)
+        if best_match_story is None:
             LOG.warning(
                 f"Story with ID {best_match_story_id} exists in vector DB but not in playground DB."
             )
-            return {
-                "id": best_match_story_id,
-                "title": "(An internal story was found but does not yet exist in the Playground DB)",
-                "text": "(An internal story was found but does not yet exist in the Playground DB)",
-                "published_at": "UNKNOWN",
-                "publication": "UNKNOWN",
-            }, best_match_score
+            matches.append(
+                (
+                    {
+                        "id": best_match_story_id,
+                        "title": "(An internal story was found but does not yet exist in the Playground DB)",
+                        "text": "(An internal story was found but does not yet exist in the Playground DB)",
+                        "published_at": "UNKNOWN",
+                        "publication": "UNKNOWN",
+                    },
+                    best_match_score,
+                )
+            )
         else:
-            best_match_story = best_match_stories[0]
-            best_match_story["published_at"] = best_match_story[
-                "published_at"
-            ].isoformat()
-            return best_match_stories[0], best_match_score
+            best_match_story = {
+                **best_match_story,
+                "published_at": best_match_story["published_at"].isoformat(),
+            }
+            matches.append((best_match_story, best_match_score))
+    return matches
 
 
-def dedupe_headlines(
-    headlines: List[Headline], similarity_threshold: float
-) -> List[Headline]:
-    headline_intra_similarity = openai_text_intra_similarity(
-        [headline.summary for headline in headlines]
+def match_headline_to_internal_story(
+    headline: Headline,
+    query_strategy: Optional[HeadlineStoryQueryStrategy] = None,
+    story_source=None,
+) -> Optional[Tuple[Dict, float]]:
+    return match_headlines_to_internal_stories(
+        [headline], query_strategy, story_source
+    )[0]
+
+
+def cluster_headlines(
+    headlines: List[Headline],
+    similarity_threshold: float,
+    representative: ClusterRepresentative = ClusterRepresentative.MOST_CENTRAL,
+) -> List[HeadlineCluster]:
+    """
+    Group headlines whose summaries are more similar than ``similarity_threshold``
+    (transitively) and pick one representative per cluster. Clusters keep the order
+    of the headlines they first appear at.
+
+    Near-verbatim duplicates are first collapsed locally from their title and
+    summary, so only one headline of each is embedded.
+    """
+    if not headlines:
+        return []
+    lexical_clusters = dedupe.cluster_near_verbatim(
+        [f"{headline.title} {headline.summary}" for headline in headlines]
+    )
+    embeddings = openai_text_embeddings(
+        [headlines[members[0]].summary for members in lexical_clusters]
     )
-    upper_tri = np.triu(headline_intra_similarity, k=1)
-    dupe_mask = upper_tri > similarity_threshold
-    dupe_pairs = np.argwhere(dupe_mask)
-    exclude_docs = np.zeros(headline_intra_similarity.shape[0], dtype=bool)
+    LOG.info(
+        f"Headline dedupe | Headlines: {len(headlines)} | Embedded after lexical dedupe: {len(lexical_clusters)}"
+    )
+
+    clusters = []
+    for groups in dedupe.cluster_duplicates(embeddings, similarity_threshold):
+        members = sorted(i for group in groups for i in lexical_clusters[group])
+        match representative:
+            case ClusterRepresentative.MOST_CENTRAL:
+                # Each embedded headline stands in for its near-verbatim duplicates.
+                group = dedupe.most_central(
+                    embeddings,
+                    groups,
+                    weights=[len(lexical_clusters[group]) for group in groups],
+                )
+                kept = lexical_clusters[group][0]
+            case ClusterRepresentative.EARLIEST:
+                # Headlines without a publication time are only kept as a last resort.
+                kept = min(
+                    members,
+                    key=lambda i: (
+                        headlines[i].published_at is None,
+                        headlines[i].published_at or "",
+                        i,
+                    ),
+                )
+            case _:
+                raise ValueError(f"Unsupported cluster representative {representative}")
+        clusters.append(
+            HeadlineCluster(
+                representative=headlines[kept],
+                duplicates=[headlines[i] for i in members if i != kept],
+            )
+        )
+    return clusters
 
-    for _i, j in dupe_pairs:
-        exclude_docs[j] = True
 
-    exclude_docs = list(exclude_docs)
-    include_idxs = [idx for idx, exclude in enumerate(exclude_docs) if not exclude]
-    return [headlines[idx] for idx in include_idxs]
+def dedupe_headlines(
+    headlines: List[Headline],
+    similarity_threshold: float,
+    representative: ClusterRepresentative = ClusterRepresentative.MOST_CENTRAL,
+) -> List[Headline]:
+    return [
+        cluster.representative
+        for cluster in cluster_headlines(
+            headlines, similarity_threshold, representative
+        )
+    ]
@@ -1,28 +1,87 @@
+import asyncio
+import base64
 import datetime
+import hashlib
 import json
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from math import exp
-from typing import List, Optional, Tuple
+from typing import Iterator, List, Optional, Tuple
 
 import numpy as np
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
+from openai.types.chat import ChatCompletion, ParsedChatCompletion
 from openai.types.chat.chat_completion_token_logprob import TopLogprob
 from pydantic import BaseModel, Field
 
 from app.types import Headline, RelevancyScoredHeadline, TokenLogprob
 
-from .utils import TaskList, execute_in_thread_pool
+from . import aio, llm_executor, rate_limit
+from .cache import SharedCache, make_key
 
 OPEN_AI_DEFAULT_MODEL = "gpt-4o-2024-08-06"
 OPEN_AI_API_URL = "https://api.openai.com/v1/chat/completions"
 OPEN_AI_API_KEY = os.environ["OPENAI_API_KEY"]
 
 client = OpenAI()
+_async_client = None
 
 LOG = logging.getLogger(__name__)
 
 ZERO_TEMPERATURE = 0.000000001
+# Completion tokens assumed by the rate limiter when a request sets no max_tokens.
+LLM_ESTIMATED_COMPLETION_TOKENS = 256
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+# Dimensions of EMBEDDING_MODEL's vectors when no smaller size is requested.
+EMBEDDING_MODEL_DIMENSIONS = 1536
+# The embeddings API accepts at most 2048 inputs and ~300k tokens per request.
+EMBEDDING_BATCH_SIZE = 2048
+EMBEDDING_BATCH_MAX_CHARS = 600_000
+EMBEDDING_MAX_CONCURRENCY = int(os.environ.get("EMBEDDING_MAX_CONCURRENCY", 4))
+EMBEDDING_CACHE_TTL = int(os.environ.get("EMBEDDING_CACHE_TTL", 7 * 24 * 3600))
+EMBEDDING_CACHE_MAX_ENTRIES = int(
+    os.environ.get("EMBEDDING_CACHE_MAX_ENTRIES", 200_000)
+)
+
+# Stories scored in one request by make_batched_llm_requests_for_stories, and the
+# most prompt tokens their contents may take up.
+STORIES_PER_REQUEST = int(os.environ.get("STORIES_PER_REQUEST", 10))
+STORY_BATCH_MAX_PROMPT_TOKENS = int(
+    os.environ.get("STORY_BATCH_MAX_PROMPT_TOKENS", 12_000)
+)
+STORY_BATCH_INSTRUCTIONS = (
+    "You are given a JSON list of stories, each with a ref. Apply the instructions "
+    "above to every story independently and return one value for each story, "
+    "together with its ref."
+)
+
+# Stories per map request of map_reduce_transform_stories, by estimated tokens,
+# and the map requests it runs at a time.
+TRANSFORM_CHUNK_MAX_TOKENS = int(os.environ.get("TRANSFORM_CHUNK_MAX_TOKENS", 8000))
+TRANSFORM_MAX_CONCURRENCY = int(os.environ.get("TRANSFORM_MAX_CONCURRENCY", 8))
+TRANSFORM_REDUCE_INSTRUCTIONS = (
+    "You are given a JSON list of partial results, each produced by following the "
+    "instructions above for a part of the stories. Merge them into a single result "
+    "that follows the instructions as if they had been applied to all of the "
+    "stories at once."
+)
+
+# Most headlines in one listwise reranking request.
+RERANK_WINDOW_SIZE = int(os.environ.get("RERANK_WINDOW_SIZE", 20))
+# Windows of a larger list carry one pivot per this many headlines.
+RERANK_WINDOW_SIZE_PER_PIVOT = 5
+
+LLM_CACHE_TTL = int(os.environ.get("LLM_CACHE_TTL", 7 * 24 * 3600))
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", 50_000))
+
+llm_response_cache = SharedCache(
+    "llm-responses", ttl=LLM_CACHE_TTL, max_entries=LLM_CACHE_MAX_ENTRIES
+)
+embedding_cache = SharedCache(
+    "embeddings", ttl=EMBEDDING_CACHE_TTL, max_entries=EMBEDDING_CACHE_MAX_ENTRIES
+)
 
 
 class Story(BaseModel):
@@ -38,6 +97,15 @@ class LLMSingleStoryValueResponse(BaseModel):
     value: float
 
 
+class StoryValue(BaseModel):
+    ref: str
+    value: float
+
+
+class LLMStoryBatchValuesResponse(BaseModel):
+    stories: list[StoryValue]
+
+
 class LLMTransformStoriesResponse(BaseModel):
     text: str
 
@@ -52,6 +120,264 @@ class LLMHeadlineRerankingResponse(BaseModel):
     )
 
 
+def _get_async_client() -> AsyncOpenAI:
+    # Retries are left to the LLM executor, which adapts its concurrency to them.
+    global _async_client  # noqa: PLW0603
+    if _async_client is None:
+        _async_client = AsyncOpenAI(max_retries=0)
+    return _async_client
+
+
+def _reset_async_client_in_child():
+    global _async_client  # noqa: PLW0603
+    _async_client = None
+
+
+os.register_at_fork(after_in_child=_reset_async_client_in_child)
+
+
+def _response_format_schema(response_format) -> Optional[dict]:
+    return response_format.model_json_schema() if response_format else None
+
+
+def _chat_completion_cache_key(request: dict) -> str:
+    return make_key(
+        {
+            **request,
+            "response_format": _response_format_schema(request.get("response_format")),
+        }
+    )
+
+
+def _get_cached_chat_completion(cache_key: str, request: dict):
+    cached = llm_response_cache.get(cache_key)
+    if cached is None:
+        return None
+    response_format = request.get("response_format")
+    response_type = (
+        ParsedChatCompletion[response_format] if response_format else ChatCompletion
+    )
+    response = response_type.model_validate(cached)
+    llm_response_cache.incr("hits")
+    if response.usage:
+        llm_response_cache.incr("tokens_saved", response.usage.total_tokens)
+    return response
+
+
+def _cache_chat_completion(cache_key: str, response):
+    llm_response_cache.incr("misses")
+    llm_response_cache.set(cache_key, response.model_dump(mode="json"))
+
+
+def _estimate_tokens(request: dict) -> int:
+    # Roughly four characters per token, plus the completion.
+    prompt_tokens = len(json.dumps(request.get("messages", []))) // 4
+    return prompt_tokens + (
+        request.get("max_tokens") or LLM_ESTIMATED_COMPLETION_TOKENS
+    )
+
+
+def _record_usage(request: dict, estimated_tokens: int, response):
+    if response.usage:
+        rate_limit.record_usage(
+            request["model"], estimated_tokens, response.usage.total_tokens
+        )
+
+
+def _chat_completion(
+    use_cache: bool = True,
+    priority: Optional[rate_limit.Priority] = None,
+    **request,
+):
+    """
+    Make a chat completion request, parsed into ``response_format`` when one is given.
+
+    Responses are cached by a hash of the whole request (model, messages, response
+    format schema and sampling parameters), so byte-identical requests are answered
+    from the cache. ``use_cache=False`` always asks the model for a fresh sample,
+    which still refreshes the cached response.
+
+    Requests which are not answered from the cache first wait for the shared OpenAI
+    rate limiter, at the given priority (or the process default).
+    """
+    cache_key = _chat_completion_cache_key(request)
+    if use_cache:
+        cached = _get_cached_chat_completion(cache_key, request)
+        if cached is not None:
+            return cached
+
+    estimated_tokens = _estimate_tokens(request)
+    rate_limit.acquire(request["model"], estimated_tokens, priority)
+    if request.get("response_format"):
+        response = client.beta.chat.completions.parse(**request)
+    else:
+        response = client.chat.completions.create(**request)
+    _record_usage(request, estimated_tokens, response)
+    _cache_chat_completion(cache_key, response)
+    return response
+
+
+async def _chat_completion_async(
+    use_cache: bool = True,
+    priority: Optional[rate_limit.Priority] = None,
+    **request,
+):
+    """
+    The asyncio counterpart of _chat_completion, for the services event loop. API
+    calls go through the adaptive concurrency limit of the shared LLM executor.
+    """
+    cache_key = _chat_completion_cache_key(request)
+    if use_cache:
+        cached = await asyncio.to_thread(
+            _get_cached_chat_completion, cache_key, request
+        )
+        if cached is not None:
+            return cached
+
+    estimated_tokens = _estimate_tokens(request)
+
+    async def wait_for_rate_limit():
+        await rate_limit.acquire_async(request["model"], estimated_tokens, priority)
+
+    async def make_request():
+        async_client = _get_async_client()
+        if request.get("response_format"):
+            return await async_client.beta.chat.completions.parse(**request)
+        return await async_client.chat.completions.create(**request)
+
+    response = await llm_executor.executor.submit(
+        make_request, before_attempt=wait_for_rate_limit
+    )
+    await asyncio.to_thread(_record_usage, request, estimated_tokens, response)
+    await asyncio.to_thread(_cache_chat_completion, cache_key, response)
+    return response
+
+
+def _stream_chat_completion(
+    use_cache: bool = True,
+    priority: Optional[rate_limit.Priority] = None,
+    **request,
+) -> Iterator[str]:
+    """
+    Make a chat completion request and yield its text as the model generates it.
+
+    The streamed text is cached like a _chat_completion response once the stream
+    has finished, so a repeated request yields the cached text in one chunk.
+    """
+    cache_key = _chat_completion_cache_key(request)
+    if use_cache:
+        cached = _get_cached_chat_completion(cache_key, request)
+        if cached is not None:
+            yield cached.choices[0].message.content
+            return
+
+    estimated_tokens = _estimate_tokens(request)
+    rate_limit.acquire(request["model"], estimated_tokens, priority)
+    stream = client.chat.completions.create(
+        **request, stream=True, stream_options={"include_usage": True}
+    )
+    chunks, finish_reason, usage, response_id, created = [], None, None, None, 0
+    for chunk in stream:
+        response_id, created = chunk.id, chunk.created
+        usage = chunk.usage or usage
+        if not chunk.choices:
+            continue
+        finish_reason = chunk.choices[0].finish_reason or finish_reason
+        if chunk.choices[0].delta.content:
+            chunks.append(chunk.choices[0].delta.content)
+            yield chunk.choices[0].delta.content
+
+    response = ChatCompletion.model_validate(
+        {
+            "id": response_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": request["model"],
+            "choices": [
+                {
+                    "index": 0,
+                    "finish_reason": finish_reason or "stop",
+                    "message": {"role": "assistant", "content": "".join(chunks)},
+                }
+            ],
+            "usage": usage.model_dump() if usage else None,
+        }
+    )
+    _record_usage(request, estimated_tokens, response)
+    _cache_chat_completion(cache_key, response)
+
+
+def _log_completed_requests(completed: int, total: int):
+    LOG.info(
+        f"LLM requests | Completed: {completed} of {total} "
+        f"| Executor: {get_llm_executor_stats()} "
+        f"| Rate limit: {rate_limit.get_rate_limit_stats()}"
+    )
+
+
+def _run_concurrently(make_request, items) -> list:
+    """
+    Run the coroutine ``make_request(item)`` for every item concurrently on the
+    services event loop. Failed requests are logged and left out of the results.
+    """
+
+    async def run_all():
+        return await asyncio.gather(
+            *[make_request(item) for item in items], return_exceptions=True
+        )
+
+    results = aio.run(run_all())
+    errors = [result for result in results if isinstance(result, Exception)]
+    if errors:
+        LOG.warning(
+            f"{len(errors)} of {len(results)} LLM requests failed, e.g. {errors[0]!r}"
+        )
+    _log_completed_requests(len(results) - len(errors), len(results))
+    return [result for result in results if not isinstance(result, Exception)]
+
+
+def _iter_concurrently(make_request, items) -> Iterator:
+    """
+    Like _run_concurrently, but yield each result as soon as its request completes.
+    Requests still running when the iterator is closed early are cancelled.
+    """
+    loop = aio.get_loop()
+    futures = [
+        asyncio.run_coroutine_threadsafe(make_request(item), loop) for item in items
+    ]
+    completed = 0
+    try:
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                LOG.warning(f"LLM request failed: {e!r}")
+                continue
+            completed += 1
+            yield result
+    finally:
+        for future in futures:
+            future.cancel()
+        _log_completed_requests(completed, len(futures))
+
+
+def get_llm_executor_stats() -> dict:
+    """Current concurrency limit, in-flight requests and queue depth of this process."""
+    return llm_executor.executor.stats()
+
+
+def get_llm_cache_stats() -> dict:
+    """Hit rate and tokens saved by the LLM response cache, across all workers."""
+    counters = llm_response_cache.counters()
+    hits, misses = counters.get("hits", 0), counters.get("misses", 0)
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+        "tokens_saved": counters.get("tokens_saved", 0),
+    }
+
+
 def _headlines_prompt_from_reranking_prompt(reranking_prompt: str) -> str:
     return f"""
     Rerank these headlines in accordance with the below instruction:
@@ -110,11 +436,9 @@ def _extract_true_false_probs(scored_tokens: List[TokenLogprob]) -> Tuple[float,
         return adjusted_true_prob, adjusted_false_prob
 
 
-def make_llm_request_for_headline_scoring(
-    headline: Headline, relevancy_prompt: str
-) -> RelevancyScoredHeadline:
+def _headline_scoring_request(headline: Headline, relevancy_prompt: str) -> dict:
     prompt = _headlines_prompt_from_reranking_prompt(relevancy_prompt)
-    result = client.chat.completions.create(
+    return dict(
         model=OPEN_AI_DEFAULT_MODEL,
         messages=[
             {
@@ -129,6 +453,9 @@ def make_llm_request_for_headline_scoring(
         logprobs=True,
         top_logprobs=5,
     )
+
+
+def _scored_headline(headline: Headline, result) -> RelevancyScoredHeadline:
     top_logprobs = result.choices[0].logprobs.content[-1].top_logprobs
     top_scored_tokens = [
         _extract_top_logprob_token_and_score(top_logprob)
@@ -141,57 +468,195 @@ def make_llm_request_for_headline_scoring(
     )
 
 
+def make_llm_request_for_headline_scoring(
+    headline: Headline, relevancy_prompt: str, use_cache: bool = True
+) -> RelevancyScoredHeadline:
+    result = _chat_completion(
+        use_cache=use_cache, **_headline_scoring_request(headline, relevancy_prompt)
+    )
+    return _scored_headline(headline, result)
+
+
 def make_concurrent_llm_request_for_headline_scoring(
-    headlines: list[Headline], relevancy_prompt: str
+    headlines: list[Headline], relevancy_prompt: str, use_cache: bool = True
 ) -> List[RelevancyScoredHeadline]:
-    tasks: TaskList = [
-        (
-            make_llm_request_for_headline_scoring,
-            (
-                headline,
-                relevancy_prompt,
-            ),
+    async def score_headline(headline: Headline) -> RelevancyScoredHeadline:
+        result = await _chat_completion_async(
+            use_cache=use_cache,
+            **_headline_scoring_request(headline, relevancy_prompt),
         )
-        for headline in headlines
-    ]
-    results = execute_in_thread_pool(tasks, max_workers=10)
+        return _scored_headline(headline, result)
+
+    results = _run_concurrently(score_headline, headlines)
     results = sorted(results, key=lambda x: x[1], reverse=True)
     return results
 
 
-def make_llm_request_for_headline_reranking(
+def _headline_reranking_request(
     headlines: List[Headline], reranking_prompt: str
-) -> List[Headline]:
-    headlines_id_mapping = {h.id: h for h in headlines}
-    prompt = _headlines_prompt_from_reranking_prompt(reranking_prompt)
-    result: LLMHeadlineRerankingResponse = client.beta.chat.completions.parse(
+) -> dict:
+    # Headlines are identified by their index, so duplicate ids are kept apart.
+    content = [
+        {**headline.dict(), "id": str(idx)} for idx, headline in enumerate(headlines)
+    ]
+    return dict(
         model=OPEN_AI_DEFAULT_MODEL,
         messages=[
-            {"role": "system", "content": prompt},
             {
-                "role": "user",
-                "content": json.dumps([headline.dict() for headline in headlines]),
+                "role": "system",
+                "content": _headlines_prompt_from_reranking_prompt(reranking_prompt),
             },
+            {"role": "user", "content": json.dumps(content)},
         ],
         response_format=LLMHeadlineRerankingResponse,
         temperature=ZERO_TEMPERATURE,
     )
+
+
+def _reranked_order(headlines: List[Headline], result) -> List[int]:
+    """
+    Return the indexes of headlines in the model's order. Hallucinated and repeated
+    ids are ignored and headlines the model left out follow in their original
+    order, so none are lost.
+    """
     parsed_result: LLMHeadlineRerankingResponse = result.choices[0].message.parsed
-    reranked_headlines = []
+    reranked_idxs = []
     for reranked_headline in parsed_result.headlines:
         reranked_headline_id = reranked_headline.id
-        if reranked_headline_id in headlines_id_mapping:
-            reranked_headlines.append(headlines_id_mapping[reranked_headline_id])
+        idx = int(reranked_headline_id) if reranked_headline_id.isdigit() else -1
+        if 0 <= idx < len(headlines):
+            if idx not in reranked_idxs:
+                reranked_idxs.append(idx)
         else:
             warn_message = f"""
             LLM hallucinated a headline identifier: {reranked_headline_id}
-            Possible ids: {list(headlines_id_mapping.keys())}
+            Possible ids: 0-{len(headlines) - 1}
             """
             LOG.warning(warn_message)
-    return reranked_headlines
+    missing = [idx for idx in range(len(headlines)) if idx not in reranked_idxs]
+    if missing:
+        LOG.warning(f"LLM left out {len(missing)} of {len(headlines)} headlines")
+    return reranked_idxs + missing
+
+
+def make_llm_request_for_headline_reranking(
+    headlines: List[Headline], reranking_prompt: str, use_cache: bool = True
+) -> List[Headline]:
+    result = _chat_completion(
+        use_cache=use_cache,
+        **_headline_reranking_request(headlines, reranking_prompt),
+    )
+    return [headlines[idx] for idx in _reranked_order(headlines, result)]
+
 
+async def _rerank_headline_window(
+    headlines: List[Headline], window: List[int], reranking_prompt: str, use_cache: bool
+) -> List[int]:
+    """Rerank the headlines at the ``window`` indexes, returning the indexes."""
+    window_headlines = [headlines[idx] for idx in window]
+    try:
+        result = await _chat_completion_async(
+            use_cache=use_cache,
+            **_headline_reranking_request(window_headlines, reranking_prompt),
+        )
+    except Exception as e:
+        # The window keeps its order rather than losing its headlines.
+        LOG.warning(f"Reranking a window of {len(window)} headlines failed: {e!r}")
+        return window
+    return [window[idx] for idx in _reranked_order(window_headlines, result)]
+
+
+async def _rerank_headlines_windowed(
+    headlines: List[Headline],
+    idxs: List[int],
+    reranking_prompt: str,
+    window_size: int,
+    use_cache: bool,
+) -> List[int]:
+    if len(idxs) <= window_size:
+        return await _rerank_headline_window(
+            headlines, idxs, reranking_prompt, use_cache
+        )
 
-def make_llm_request_for_story_batch(stories, prompt: str, limit=10):
+    # Evenly spaced headlines of the reranked first window become pivots, which
+    # split the rest into buckets. Every other window holds all of the pivots, so
+    # the windows overlap in them and are reranked concurrently. A headline's
+    # bucket is the number of pivots ranked above it in its window.
+    first = await _rerank_headline_window(
+        headlines, idxs[:window_size], reranking_prompt, use_cache
+    )
+    n_pivots = max(1, window_size // RERANK_WINDOW_SIZE_PER_PIVOT)
+    step = len(first) // (n_pivots + 1)
+    pivots = [first[step * (i + 1)] for i in range(n_pivots)]
+    buckets = [[] for _ in range(n_pivots + 1)]
+
+    def assign(window: List[int]):
+        pivots_above = 0
+        for idx in window:
+            if idx in pivots:
+                pivots_above += 1
+            else:
+                buckets[pivots_above].append(idx)
+
+    assign(first)
+    rest = idxs[window_size:]
+    size = window_size - n_pivots
+    windows = await asyncio.gather(
+        *[
+            _rerank_headline_window(
+                headlines, pivots + rest[i : i + size], reranking_prompt, use_cache
+            )
+            for i in range(0, len(rest), size)
+        ]
+    )
+    for window in windows:
+        assign(window)
+
+    # The buckets are ranked concurrently, split again until they fit a window.
+    ranked_buckets = await asyncio.gather(
+        *[
+            _rerank_headlines_windowed(
+                headlines, bucket, reranking_prompt, window_size, use_cache
+            )
+            for bucket in buckets
+        ]
+    )
+    ranked = list(ranked_buckets[0])
+    for pivot, bucket in zip(pivots, ranked_buckets[1:]):
+        ranked += [pivot, *bucket]
+    return ranked
+
+
+def make_windowed_llm_request_for_headline_reranking(
+    headlines: List[Headline],
+    reranking_prompt: str,
+    window_size: int = RERANK_WINDOW_SIZE,
+    use_cache: bool = True,
+) -> List[Headline]:
+    """
+    Rerank headlines listwise in windows of at most ``window_size``, so each request
+    stays small however many headlines there are. Windows overlapping in a few
+    pivot headlines are reranked concurrently to split the list into buckets
+    between the pivots, and each bucket is split again until it fits in a single
+    window. Every headline is returned.
+    """
+    if not headlines:
+        return []
+    ranked = aio.run(
+        _rerank_headlines_windowed(
+            headlines,
+            list(range(len(headlines))),
+            reranking_prompt,
+            max(3, window_size),
+            use_cache,
+        )
+    )
+    return [headlines[idx] for idx in ranked]
+
+
+def make_llm_request_for_story_batch(
+    stories, prompt: str, limit=10, use_cache: bool = True
+):
     # remove publication date from stories
     story_llm_ids_lookup = {}
     content = []
@@ -203,7 +668,8 @@ def make_llm_request_for_story_batch(stories, prompt: str, limit=10):
             "text": story.text,
         }
         content.append(data)
-    result = client.beta.chat.completions.parse(
+    result = _chat_completion(
+        use_cache=use_cache,
         model=OPEN_AI_DEFAULT_MODEL,
         messages=[
             {"role": "system", "content": prompt},
@@ -221,7 +687,7 @@ def make_llm_request_for_story_batch(stories, prompt: str, limit=10):
     return stories
 
 
-def make_llm_request_for_single_story(story, prompt: str, attributes):
+def _story_content(story, attributes) -> dict:
     content = {}
 
     for attribute in attributes:
@@ -230,51 +696,187 @@ def make_llm_request_for_single_story(story, prompt: str, attributes):
             content[attribute] = value.isoformat()
         else:
             content[attribute] = value
+    return content
+
 
-    result = client.beta.chat.completions.parse(
+def _single_story_request(story, prompt: str, attributes) -> dict:
+    return dict(
         model=OPEN_AI_DEFAULT_MODEL,
         messages=[
             {"role": "system", "content": prompt},
-            {"role": "user", "content": json.dumps(content)},
+            {"role": "user", "content": json.dumps(_story_content(story, attributes))},
         ],
         response_format=LLMSingleStoryValueResponse,
     )
 
-    result = result.choices[0].message.parsed.json()
-    result = json.loads(result)
-    result["id"] = story.id
-    result["title"] = story.title
-    result["value"] = result["value"] if result["value"] is not None else 0
-    result["similarity_score"] = story.similarity_score
-    result["position"] = story.position
-    result["publication"] = story.publication
-    result["published_at"] = story.published_at
-    return result
+
+def _story_record(story, value: Optional[float]) -> dict:
+    return {
+        "value": value if value is not None else 0,
+        "id": story.id,
+        "title": story.title,
+        "similarity_score": story.similarity_score,
+        "position": story.position,
+        "publication": story.publication,
+        "published_at": story.published_at,
+    }
+
+
+def _scored_story(story, result) -> dict:
+    return _story_record(story, result.choices[0].message.parsed.value)
+
+
+def make_llm_request_for_single_story(
+    story, prompt: str, attributes, use_cache: bool = True
+):
+    result = _chat_completion(
+        use_cache=use_cache, **_single_story_request(story, prompt, attributes)
+    )
+    return _scored_story(story, result)
 
 
 def make_concurrent_llm_requests_for_stories(
     prompt: str,
     stories: list[Story],
     attributes: Optional[list[str]] = None,
+    use_cache: bool = True,
+):
+    async def score_story(story) -> dict:
+        result = await _chat_completion_async(
+            use_cache=use_cache, **_single_story_request(story, prompt, attributes)
+        )
+        return _scored_story(story, result)
+
+    results = _run_concurrently(score_story, stories)
+    results = sorted(results, key=lambda x: x["value"], reverse=True)
+    del stories
+    return results
+
+
+def iter_concurrent_llm_requests_for_stories(
+    prompt: str,
+    stories: list[Story],
+    attributes: Optional[list[str]] = None,
+    use_cache: bool = True,
+) -> Iterator[dict]:
+    """
+    Score stories like make_concurrent_llm_requests_for_stories, yielding each
+    scored story as soon as its request completes instead of a sorted list.
+    """
+
+    async def score_story(story) -> dict:
+        result = await _chat_completion_async(
+            use_cache=use_cache, **_single_story_request(story, prompt, attributes)
+        )
+        return _scored_story(story, result)
+
+    yield from _iter_concurrently(score_story, stories)
+
+
+def _story_batches(stories, attributes, stories_per_request: int) -> list[list]:
+    """
+    Split stories into batches of at most ``stories_per_request`` whose contents
+    stay within STORY_BATCH_MAX_PROMPT_TOKENS. A story over the budget on its own
+    still gets a batch.
+    """
+    batches, batch, batch_tokens = [], [], 0
+    for story in stories:
+        tokens = len(json.dumps(_story_content(story, attributes))) // 4
+        if batch and (
+            len(batch) == stories_per_request
+            or batch_tokens + tokens > STORY_BATCH_MAX_PROMPT_TOKENS
+        ):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(story)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def _story_batch_request(stories, prompt: str, attributes) -> dict:
+    # Stories are referred to by their index in the batch, which is shorter than
+    # their id and easy to check for hallucinations. The attributes are nested so
+    # that none of them (e.g. the story's own id) can replace the ref.
+    content = [
+        {"ref": str(idx), "story": _story_content(story, attributes)}
+        for idx, story in enumerate(stories)
+    ]
+    return dict(
+        model=OPEN_AI_DEFAULT_MODEL,
+        messages=[
+            {"role": "system", "content": f"{prompt}\n\n{STORY_BATCH_INSTRUCTIONS}"},
+            {"role": "user", "content": json.dumps(content)},
+        ],
+        response_format=LLMStoryBatchValuesResponse,
+    )
+
+
+def make_batched_llm_requests_for_stories(
+    prompt: str,
+    stories: list[Story],
+    attributes: Optional[list[str]] = None,
+    stories_per_request: int = STORIES_PER_REQUEST,
+    use_cache: bool = True,
 ):
-    tasks: TaskList = [
-        (
-            make_llm_request_for_single_story,
-            (
-                story,
-                prompt,
-                attributes,
-            ),
+    """
+    Score stories like make_concurrent_llm_requests_for_stories, but with up to
+    ``stories_per_request`` stories in each request, so the prompt is sent once per
+    batch instead of once per story. Stories missing from a response (or in a batch
+    whose request failed) are scored individually; values for refs which were not in
+    the batch are ignored.
+    """
+    attributes = attributes or []
+
+    async def score_story(story) -> dict:
+        result = await _chat_completion_async(
+            use_cache=use_cache, **_single_story_request(story, prompt, attributes)
         )
-        for story in stories
+        return _scored_story(story, result)
+
+    async def score_batch(batch) -> list[dict]:
+        try:
+            result = await _chat_completion_async(
+                use_cache=use_cache, **_story_batch_request(batch, prompt, attributes)
+            )
+            values = result.choices[0].message.parsed.stories
+        except Exception as e:
+            LOG.warning(f"Story batch of {len(batch)} failed, scoring singly: {e!r}")
+            values = []
+
+        scored = {}
+        for story_value in values:
+            idx = int(story_value.ref) if story_value.ref.isdigit() else -1
+            if not 0 <= idx < len(batch):
+                LOG.warning(
+                    f"LLM returned a value for unknown story ref {story_value.ref!r}"
+                )
+                continue
+            scored.setdefault(idx, _story_record(batch[idx], story_value.value))
+
+        missing = [story for idx, story in enumerate(batch) if idx not in scored]
+        if missing:
+            LOG.info(f"Scoring {len(missing)} of {len(batch)} batched stories singly")
+        retried = await asyncio.gather(
+            *[score_story(story) for story in missing], return_exceptions=True
+        )
+        for error in [result for result in retried if isinstance(result, Exception)]:
+            LOG.warning(f"LLM request failed: {error!r}")
+        return list(scored.values()) + [
+            result for result in retried if not isinstance(result, Exception)
+        ]
+
+    batches = _story_batches(stories, attributes, max(1, stories_per_request))
+    results = [
+        story for batch in _run_concurrently(score_batch, batches) for story in batch
     ]
-    results = execute_in_thread_pool(tasks, max_workers=10)
     results = sorted(results, key=lambda x: x["value"], reverse=True)
     del stories
     return results
 
 
-def transform_stories(stories, prompt):
+def _transform_content(stories) -> list[dict]:
     content = []
     for story in stories:
         data = {
@@ -282,9 +884,12 @@ def transform_stories(stories, prompt):
             "text": story["text"],
         }
         content.append(data)
-    prompt += "Do not include any additional json in the response. Return text as html no styling. "
+    return content
 
-    result = client.beta.chat.completions.parse(
+
+def _transform_request(content, prompt: str) -> dict:
+    prompt += "Do not include any additional json in the response. Return text as html no styling. "
+    return dict(
         model=OPEN_AI_DEFAULT_MODEL,
         messages=[
             {"role": "system", "content": prompt},
@@ -292,6 +897,9 @@ def transform_stories(stories, prompt):
         ],
         response_format=LLMTransformStoriesResponse,
     )
+
+
+def _transformation_text(result) -> str:
     data = result.choices[0].message.parsed.json()
     result = json.loads(data)["text"]
 
@@ -303,13 +911,198 @@ def transform_stories(stories, prompt):
         return result
 
 
-def openai_text_intra_similarity(texts: List[str]) -> np.ndarray:
-    embedding_model = "text-embedding-3-small"
+def transform_stories(stories, prompt, use_cache: bool = True):
+    result = _chat_completion(
+        use_cache=use_cache, **_transform_request(_transform_content(stories), prompt)
+    )
+    return _transformation_text(result)
+
 
-    embeddings = [
-        res.embedding
-        for res in client.embeddings.create(input=texts, model=embedding_model).data
-    ]
-    embeddings_matrix = np.array(embeddings)
-    intra_similarity_matrix = np.dot(embeddings_matrix, embeddings_matrix.T)
+def _token_budgeted_chunks(items: list, max_tokens: int) -> list[list]:
+    """Split items into consecutive chunks whose JSON stays within max_tokens."""
+    chunks, chunk, chunk_tokens = [], [], 0
+    for item in items:
+        tokens = len(json.dumps(item)) // 4
+        if chunk and chunk_tokens + tokens > max_tokens:
+            chunks.append(chunk)
+            chunk, chunk_tokens = [], 0
+        chunk.append(item)
+        chunk_tokens += tokens
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def map_reduce_transform_stories(
+    stories,
+    prompt,
+    chunk_max_tokens: int = TRANSFORM_CHUNK_MAX_TOKENS,
+    max_concurrency: int = TRANSFORM_MAX_CONCURRENCY,
+    use_cache: bool = True,
+):
+    """
+    Transform a large selection of stories in two steps. The map step applies the
+    prompt to chunks of at most ``chunk_max_tokens`` of stories concurrently, at
+    most ``max_concurrency`` at a time. The reduce step merges the partial outputs
+    into one, in rounds if they do not fit in a single request.
+    """
+    content = _transform_content(stories)
+    # A story longer than a whole chunk is cut to fit rather than overflowing it.
+    max_chars = chunk_max_tokens * 4
+    for story, item in zip(stories, content):
+        text = item["text"] or ""
+        if len(text) > max_chars:
+            LOG.warning(
+                f"Map-reduce transform | Story {story.get('id') or story['title']!r} "
+                f"truncated from {len(text)} to {max_chars} characters"
+            )
+        item["text"] = text[:max_chars]
+    reduce_prompt = f"{prompt}\n\n{TRANSFORM_REDUCE_INSTRUCTIONS}"
+
+    async def transform_all(chunks, chunk_prompt) -> list[str]:
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def transform_chunk(chunk) -> str:
+            async with semaphore:
+                result = await _chat_completion_async(
+                    use_cache=use_cache, **_transform_request(chunk, chunk_prompt)
+                )
+            return _transformation_text(result)
+
+        return await asyncio.gather(*[transform_chunk(chunk) for chunk in chunks])
+
+    partials = aio.run(
+        transform_all(_token_budgeted_chunks(content, chunk_max_tokens), prompt)
+    )
+    LOG.info(
+        f"Map-reduce transform | Stories: {len(stories)} | Chunks: {len(partials)}"
+    )
+    while len(partials) > 1:
+        groups = _token_budgeted_chunks(partials, chunk_max_tokens)
+        if len(groups) == len(partials):
+            # Partials too long to group within the budget are merged in pairs.
+            groups = [partials[i : i + 2] for i in range(0, len(partials), 2)]
+        partials = aio.run(transform_all(groups, reduce_prompt))
+    return partials[0] if partials else ""
+
+
+def stream_transform_stories(stories, prompt, use_cache: bool = True) -> Iterator[str]:
+    """
+    Transform stories like transform_stories, yielding the generated html as it
+    is streamed. The model answers in plain text rather than a structured
+    response, so chunks can be shown as they arrive.
+    """
+    prompt += "Return only the text as html, with no styling and no json. "
+    yield from _stream_chat_completion(
+        use_cache=use_cache,
+        model=OPEN_AI_DEFAULT_MODEL,
+        messages=[
+            {"role": "system", "content": prompt},
+            {"role": "user", "content": json.dumps(_transform_content(stories))},
+        ],
+    )
+
+
+def _embedding_cache_key(model: str, dimensions: Optional[int], text: str) -> str:
+    return make_key(model, dimensions, hashlib.sha256(text.encode()).hexdigest())
+
+
+def _embedding_batches(texts: List[str]) -> List[List[str]]:
+    batches, batch, batch_chars = [], [], 0
+    for text in texts:
+        if batch and (
+            len(batch) == EMBEDDING_BATCH_SIZE
+            or batch_chars + len(text) > EMBEDDING_BATCH_MAX_CHARS
+        ):
+            batches.append(batch)
+            batch, batch_chars = [], 0
+        batch.append(text)
+        batch_chars += len(text)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def _request_embeddings(
+    texts: List[str],
+    dimensions: Optional[int],
+    priority: Optional[rate_limit.Priority] = None,
+) -> np.ndarray:
+    extra_args = {"dimensions": dimensions} if dimensions else {}
+    estimated_tokens = sum(len(text) for text in texts) // 4
+    rate_limit.acquire(EMBEDDING_MODEL, estimated_tokens, priority)
+    response = client.embeddings.create(
+        input=texts, model=EMBEDDING_MODEL, encoding_format="base64", **extra_args
+    )
+    rate_limit.record_usage(
+        EMBEDDING_MODEL, estimated_tokens, response.usage.total_tokens
+    )
+    # Base64 responses decode straight into float32 instead of lists of floats.
+    return np.stack(
+        [
+            np.frombuffer(base64.b64decode(res.embedding), dtype=np.float32)
+            for res in sorted(response.data, key=lambda res: res.index)
+        ]
+    )
+
+
+def openai_text_embeddings(
+    texts: List[str],
+    dimensions: Optional[int] = None,
+    use_cache: bool = True,
+    priority: Optional[rate_limit.Priority] = None,
+) -> np.ndarray:
+    """
+    Embed ``texts`` with EMBEDDING_MODEL, returning a contiguous float32 array with
+    one row per text.
+
+    Vectors are cached by model, dimensions and a hash of the text, so only texts
+    that have not been embedded before are sent to the API. These are split into
+    batches within the API's input limits and requested concurrently, at the given
+    rate limiter priority (or the process default).
+    """
+    if not texts:
+        return np.empty((0, dimensions or EMBEDDING_MODEL_DIMENSIONS), dtype=np.float32)
+    unique_texts = list(dict.fromkeys(texts))
+    keys = {
+        text: _embedding_cache_key(EMBEDDING_MODEL, dimensions, text)
+        for text in unique_texts
+    }
+    cached = embedding_cache.get_many(keys.values()) if use_cache else {}
+    vectors = {
+        text: np.frombuffer(base64.b64decode(cached[key]), dtype=np.float32)
+        for text, key in keys.items()
+        if key in cached
+    }
+
+    missing = [text for text in unique_texts if text not in vectors]
+    if missing:
+        batches = _embedding_batches(missing)
+        with ThreadPoolExecutor(
+            max_workers=min(EMBEDDING_MAX_CONCURRENCY, len(batches))
+        ) as executor:
+            results = executor.map(
+                lambda batch: _request_embeddings(batch, dimensions, priority), batches
+            )
+            embedded = dict(zip(missing, (row for rows in results for row in rows)))
+        if use_cache:
+            embedding_cache.set_many(
+                {
+                    keys[text]: base64.b64encode(vector.tobytes()).decode()
+                    for text, vector in embedded.items()
+                }
+            )
+        vectors.update(embedded)
+
+    LOG.info(
+        f"Embeddings | Texts: {len(texts)} | Cached: {len(unique_texts) - len(missing)} | Requested: {len(missing)}"
+    )
+    return np.ascontiguousarray(np.stack([vectors[text] for text in texts]))
+
+
+def openai_text_intra_similarity(
+    texts: List[str], dimensions: Optional[int] = None
+) -> np.ndarray:
+    embeddings_matrix = openai_text_embeddings(texts, dimensions=dimensions)
+    intra_similarity_matrix = embeddings_matrix @ embeddings_matrix.T
     return intra_similarity_matrix
@@ -0,0 +1,197 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from contextlib import suppress
+from http import HTTPStatus
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import openai
+
+T = TypeVar("T")
+
+LOG = logging.getLogger(__name__)
+
+LLM_INITIAL_CONCURRENCY = int(os.environ.get("LLM_INITIAL_CONCURRENCY", 10))
+LLM_MIN_CONCURRENCY = int(os.environ.get("LLM_MIN_CONCURRENCY", 1))
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", 64))
+LLM_MAX_ATTEMPTS = int(os.environ.get("LLM_MAX_ATTEMPTS", 5))
+# A request slower than this multiple of the average latency means the API is
+# saturating, so the concurrency limit stops growing.
+LLM_LATENCY_TOLERANCE = 2.0
+LLM_BACKOFF_DECREASE_FACTOR = 0.5
+
+
+def _is_overload_error(error: Exception) -> bool:
+    if isinstance(error, (openai.RateLimitError, openai.APITimeoutError)):
+        return True
+    if isinstance(error, openai.APIConnectionError):
+        return True
+    return (
+        isinstance(error, openai.APIStatusError)
+        and error.status_code >= HTTPStatus.INTERNAL_SERVER_ERROR
+    )
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Return the delay the API asked for in its retry-after(-ms) headers, if any."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        return None
+    return None
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    An asyncio concurrency limit adjusted with AIMD (additive increase,
+    multiplicative decrease).
+
+    Each healthy response raises the limit by ``1 / limit``, so the limit grows by
+    about one per round of requests. An overload response (429, 5xx, timeout) halves
+    the limit and holds back new requests for the retry-after delay the API asked
+    for. A response much slower than the average latency stops the limit growing.
+    """
+
+    def __init__(
+        self,
+        initial: int = LLM_INITIAL_CONCURRENCY,
+        min_limit: int = LLM_MIN_CONCURRENCY,
+        max_limit: int = LLM_MAX_CONCURRENCY,
+    ):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.in_flight = 0
+        self.queued = 0
+        self.average_latency: Optional[float] = None
+        self._paused_until = 0.0
+        self._cond: Optional[asyncio.Condition] = None
+
+    @property
+    def _condition(self) -> asyncio.Condition:
+        # Created lazily so it binds to the event loop that uses the limiter.
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        return self._cond
+
+    async def acquire(self):
+        async with self._condition:
+            self.queued += 1
+            try:
+                while True:
+                    pause = self._paused_until - time.monotonic()
+                    if pause > 0:
+                        with suppress(asyncio.TimeoutError):
+                            await asyncio.wait_for(self._condition.wait(), pause)
+                    elif self.in_flight < int(self.limit):
+                        break
+                    else:
+                        await self._condition.wait()
+            finally:
+                self.queued -= 1
+            self.in_flight += 1
+
+    async def release(
+        self,
+        latency: Optional[float] = None,
+        overloaded: bool = False,
+        retry_after: Optional[float] = None,
+    ):
+        async with self._condition:
+            self.in_flight -= 1
+            if overloaded:
+                self.limit = max(
+                    self.min_limit, self.limit * LLM_BACKOFF_DECREASE_FACTOR
+                )
+                if retry_after:
+                    self._paused_until = max(
+                        self._paused_until, time.monotonic() + retry_after
+                    )
+                LOG.warning(
+                    f"LLM overloaded | Concurrency limit: {int(self.limit)} | Retry after: {retry_after}"
+                )
+            elif latency is not None:
+                average = self.average_latency or latency
+                if latency <= average * LLM_LATENCY_TOLERANCE:
+                    self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+                self.average_latency = 0.9 * average + 0.1 * latency
+            self._condition.notify_all()
+
+    def stats(self) -> dict:
+        return {
+            "concurrency_limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "average_latency": self.average_latency,
+        }
+
+
+class LLMExecutor:
+    """
+    Runs LLM API calls under an AdaptiveConcurrencyLimiter, retrying overload errors
+    after the retry-after delay (or an exponential backoff with jitter).
+    """
+
+    def __init__(self, limiter: AdaptiveConcurrencyLimiter, max_attempts: int):
+        self.limiter = limiter
+        self.max_attempts = max_attempts
+
+    async def submit(
+        self,
+        make_request: Callable[[], Awaitable[T]],
+        before_attempt: Optional[Callable[[], Awaitable]] = None,
+    ) -> T:
+        """
+        Run ``make_request`` once a concurrency slot is free. ``before_attempt``, e.g.
+        waiting for the account rate limit, is awaited before each attempt takes a
+        slot, so that time neither holds a slot nor counts towards the latency.
+        """
+        for attempt in range(1, self.max_attempts + 1):
+            if before_attempt is not None:
+                await before_attempt()
+            await self.limiter.acquire()
+            started_at = time.monotonic()
+            latency, overloaded, retry_after = None, False, None
+            try:
+                result = await make_request()
+                latency = time.monotonic() - started_at
+                return result
+            except Exception as e:
+                overloaded = _is_overload_error(e)
+                retry_after = _retry_after(e) if overloaded else None
+                if not overloaded or attempt == self.max_attempts:
+                    raise
+            finally:
+                # Also reached when the caller is cancelled mid-request, which must
+                # free the slot without counting towards the latency average.
+                await asyncio.shield(
+                    self.limiter.release(
+                        latency=latency, overloaded=overloaded, retry_after=retry_after
+                    )
+                )
+            await asyncio.sleep(
+                retry_after or min(30, 2**attempt) * random.uniform(0.5, 1)
+            )
+
+    def stats(self) -> dict:
+        return self.limiter.stats()
+
+
+executor = LLMExecutor(AdaptiveConcurrencyLimiter(), max_attempts=LLM_MAX_ATTEMPTS)
+
+
+def _reset_executor_in_child():
+    global executor  # noqa: PLW0603
+    executor = LLMExecutor(AdaptiveConcurrencyLimiter(), max_attempts=LLM_MAX_ATTEMPTS)
+
+
+os.register_at_fork(after_in_child=_reset_executor_in_child)
@@ -0,0 +1,384 @@
+import datetime
+import fcntl
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+
+import numpy as np
+from django.db.models import Count, Exists, Max, OuterRef
+
+from app import models as md
+
+from . import rate_limit
+from .llm import EMBEDDING_MODEL, openai_text_embeddings
+
+LOG = logging.getLogger(__name__)
+
+EMBEDDING_DIMENSIONS = int(os.environ.get("LOCAL_VECTOR_SEARCH_DIMENSIONS", 512))
+# Characters of story text embedded alongside the title.
+EMBEDDING_TEXT_CHARS = 8000
+EMBEDDING_BATCH_SIZE = 100
+LOCAL_INDEX_REFRESH_SECONDS = float(
+    os.environ.get("LOCAL_VECTOR_SEARCH_REFRESH_SECONDS", 60)
+)
+# Index files are written by the embed_stories task and memory-mapped by every worker
+# on the host, so the vectors are held in memory once, in the page cache, however
+# many workers search them.
+LOCAL_INDEX_DIR = os.environ.get(
+    "LOCAL_VECTOR_SEARCH_DIR",
+    os.path.join(tempfile.gettempdir(), "local_vector_search"),
+)
+LOCAL_INDEX_LOAD_BATCH_SIZE = 5000
+STORY_ID_DTYPE = np.dtype("S36")
+
+
+def _to_epoch_us(values) -> np.ndarray:
+    return np.array(
+        [int(value.timestamp() * 1_000_000) for value in values], dtype=np.int64
+    )
+
+
+def _normalise(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, np.finfo(np.float32).eps)
+
+
+class EmbeddingIndex:
+    """
+    A read-only matrix of L2-normalised float32 story embeddings with exact top-k
+    cosine search restricted to a publication date window.
+
+    ``order`` lists the rows of ``vectors`` to search, sorted by publication time,
+    and ``published_at`` holds their epoch microseconds in the same order, so the
+    rows of a date window are found with a binary search and only those rows are
+    scored. The arrays may be memory-mapped index files.
+    """
+
+    def __init__(
+        self,
+        story_ids: np.ndarray,
+        vectors: np.ndarray,
+        order: np.ndarray,
+        published_at: np.ndarray,
+    ):
+        self.story_ids = story_ids
+        self.vectors = vectors
+        self.order = order
+        self.published_at = published_at
+
+    @classmethod
+    def from_rows(
+        cls, story_ids: List[str], published_at: np.ndarray, vectors: np.ndarray
+    ) -> "EmbeddingIndex":
+        """Build an in-memory index; ``published_at`` holds epoch microseconds."""
+        order = np.argsort(published_at, kind="stable")
+        return cls(
+            story_ids=np.array(story_ids, dtype=STORY_ID_DTYPE),
+            vectors=_normalise(vectors.astype(np.float32)),
+            order=order,
+            published_at=np.asarray(published_at)[order],
+        )
+
+    def __len__(self):
+        return len(self.order)
+
+    def search(
+        self,
+        query_vector: np.ndarray,
+        k: int,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+    ) -> List[tuple[str, float]]:
+        """Return up to ``k`` (id, cosine similarity) pairs, most similar first."""
+        lo = 0 if start is None else np.searchsorted(self.published_at, start, "left")
+        hi = (
+            len(self.order)
+            if end is None
+            else np.searchsorted(self.published_at, end, "right")
+        )
+        if hi <= lo or k <= 0:
+            return []
+
+        # Reading the rows in file order keeps page faults sequential.
+        rows = np.sort(self.order[lo:hi])
+        scores = self.vectors[rows] @ _normalise(query_vector.astype(np.float32))
+        k = min(k, len(rows))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.story_ids[rows[i]].decode(), float(scores[i])) for i in top]
+
+
+def _index_dir() -> str:
+    return os.path.join(LOCAL_INDEX_DIR, f"{EMBEDDING_MODEL}-{EMBEDDING_DIMENSIONS}")
+
+
+def _index_path(directory: str, name: str) -> str:
+    return os.path.join(directory, name)
+
+
+def _read_manifest(directory: str) -> Optional[dict]:
+    try:
+        with open(_index_path(directory, "manifest.json")) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_manifest(directory: str, manifest: dict):
+    path = _index_path(directory, "manifest.json")
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(manifest, f)
+    os.replace(f"{path}.tmp", path)
+
+
+# The rows of a generation are appended to these files as embeddings are stored.
+_ROW_FILES = {
+    "vectors": np.float32,
+    "story_ids": STORY_ID_DTYPE,
+    "embedding_ids": np.int64,
+    "published_at": np.int64,
+}
+
+
+def _row_file(directory: str, generation: str, name: str) -> str:
+    return _index_path(directory, f"{generation}.{name}")
+
+
+def _row_size(name: str) -> int:
+    itemsize = np.dtype(_ROW_FILES[name]).itemsize
+    return itemsize * EMBEDDING_DIMENSIONS if name == "vectors" else itemsize
+
+
+def _map_rows(directory: str, generation: str, name: str, rows: int) -> np.ndarray:
+    dtype = _ROW_FILES[name]
+    shape = (rows, EMBEDDING_DIMENSIONS) if name == "vectors" else (rows,)
+    if rows == 0:
+        return np.empty(shape, dtype=dtype)
+    return np.memmap(
+        _row_file(directory, generation, name), dtype=dtype, mode="r", shape=shape
+    )
+
+
+def _append_rows(directory: str, generation: str, rows: int, batch: list):
+    arrays = {
+        "vectors": np.stack(
+            [np.frombuffer(vector, dtype=np.float32) for _, _, _, vector in batch]
+        ),
+        "story_ids": np.array(
+            [str(story_id) for _, story_id, _, _ in batch], dtype=STORY_ID_DTYPE
+        ),
+        "embedding_ids": np.array([row[0] for row in batch], dtype=np.int64),
+        "published_at": _to_epoch_us([published_at for _, _, published_at, _ in batch]),
+    }
+    for name, array in arrays.items():
+        with open(_row_file(directory, generation, name), "ab") as f:
+            # Drop anything an interrupted update wrote after the published rows.
+            f.truncate(rows * _row_size(name))
+            f.write(np.ascontiguousarray(array).tobytes())
+
+
+def _remove_unused_files(directory: str, keep: set):
+    for name in os.listdir(directory):
+        if name.split(".")[0] not in keep and name not in ("manifest.json", "lock"):
+            os.remove(_index_path(directory, name))
+
+
+def update_index_files() -> bool:
+    """
+    Bring the shared index files up to date with the story_embeddings table,
+    returning whether they changed.
+
+    New embeddings are appended to the current generation's row files. Rows of
+    deleted stories (whose embeddings were deleted with them) are left out of the
+    search order, and once they outnumber the live rows a new generation is written
+    from scratch. This runs in the embed_stories task, never on the search path; only
+    one task updates the files at a time and searches keep using the published index.
+    """
+    directory = _index_dir()
+    os.makedirs(directory, exist_ok=True)
+    with open(_index_path(directory, "lock"), "w") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+
+        embeddings = md.StoryEmbedding.objects.filter(
+            model=EMBEDDING_MODEL, dimensions=EMBEDDING_DIMENSIONS
+        )
+        stats = embeddings.aggregate(last_id=Max("id"), live=Count("id"))
+        checked = [stats["last_id"] or 0, stats["live"]]
+        manifest = _read_manifest(directory)
+        if manifest is not None and manifest["checked"] == checked:
+            return False
+        if manifest is None or manifest["rows"] - stats["live"] > stats["live"]:
+            manifest = {"generation": uuid.uuid4().hex, "rows": 0, "last_id": 0}
+        generation, rows = manifest["generation"], manifest["rows"]
+
+        new_rows = (
+            embeddings.filter(id__gt=manifest["last_id"])
+            .order_by("id")
+            .values_list("id", "story_id", "published_at", "vector")
+            .iterator(chunk_size=LOCAL_INDEX_LOAD_BATCH_SIZE)
+        )
+        batch = []
+        for row in new_rows:
+            batch.append(row)
+            if len(batch) == LOCAL_INDEX_LOAD_BATCH_SIZE:
+                _append_rows(directory, generation, rows, batch)
+                rows, batch = rows + len(batch), []
+        if batch:
+            _append_rows(directory, generation, rows, batch)
+            rows += len(batch)
+        last_id = (
+            int(_map_rows(directory, generation, "embedding_ids", rows)[-1])
+            if rows
+            else 0
+        )
+
+        live = np.arange(rows)
+        if stats["live"] < rows:
+            live_ids = np.fromiter(
+                embeddings.filter(id__lte=last_id).values_list("id", flat=True),
+                dtype=np.int64,
+            )
+            embedding_ids = _map_rows(directory, generation, "embedding_ids", rows)
+            live = np.flatnonzero(np.isin(embedding_ids, live_ids))
+        published_at = _map_rows(directory, generation, "published_at", rows)
+        order = live[np.argsort(published_at[live], kind="stable")]
+
+        version = uuid.uuid4().hex
+        np.save(_index_path(directory, f"{version}.order.npy"), order)
+        np.save(
+            _index_path(directory, f"{version}.published_at.npy"), published_at[order]
+        )
+        previous = _read_manifest(directory) or {}
+        _write_manifest(
+            directory,
+            {
+                "generation": generation,
+                "version": version,
+                "rows": rows,
+                "last_id": last_id,
+                "checked": checked,
+            },
+        )
+        # Workers may still be loading the previous version, so it is kept too.
+        _remove_unused_files(
+            directory,
+            {generation, version, previous.get("generation"), previous.get("version")},
+        )
+    LOG.info(f"Local vector index updated | Rows: {rows} | Live: {len(order)}")
+    return True
+
+
+def _load_index(directory: str, manifest: dict) -> EmbeddingIndex:
+    generation, version, rows = (
+        manifest["generation"],
+        manifest["version"],
+        manifest["rows"],
+    )
+    return EmbeddingIndex(
+        story_ids=_map_rows(directory, generation, "story_ids", rows),
+        vectors=_map_rows(directory, generation, "vectors", rows),
+        order=np.load(_index_path(directory, f"{version}.order.npy"), mmap_mode="r"),
+        published_at=np.load(
+            _index_path(directory, f"{version}.published_at.npy"), mmap_mode="r"
+        ),
+    )
+
+
+_index: Optional[EmbeddingIndex] = None
+_index_state = {"version": None, "refreshed_at": None}
+_refresh_lock = threading.Lock()
+
+
+def refresh_index():
+    """
+    Map the latest published version of the shared index files if it changed. Only
+    the manifest is read; the files themselves are written by update_index_files.
+    """
+    global _index  # noqa: PLW0603
+    with _refresh_lock:
+        directory = _index_dir()
+        manifest = _read_manifest(directory)
+        if manifest is not None and manifest["version"] != _index_state["version"]:
+            _index = _load_index(directory, manifest)
+            _index_state["version"] = manifest["version"]
+        _index_state["refreshed_at"] = time.monotonic()
+
+
+def _refresh_if_stale():
+    refreshed_at = _index_state["refreshed_at"]
+    if (
+        refreshed_at is None
+        or time.monotonic() - refreshed_at >= LOCAL_INDEX_REFRESH_SECONDS
+    ):
+        refresh_index()
+
+
+def get_vector_search_stories(start_date, limit, vector_search) -> List[Dict]:
+    """Local drop-in for the remote vector search, with the same return shape."""
+    _refresh_if_stale()
+    if _index is None:
+        return []
+    query_vector = openai_text_embeddings(
+        [str(vector_search)], dimensions=EMBEDDING_DIMENSIONS
+    )[0]
+    start = datetime.datetime.fromisoformat(str(start_date))
+    if start.tzinfo is None:
+        start = start.astimezone()
+    results = _index.search(
+        query_vector,
+        k=limit,
+        start=int(start.timestamp() * 1_000_000),
+        end=int(time.time() * 1_000_000),
+    )
+    return [{"id": story_id, "similarity_score": score} for story_id, score in results]
+
+
+def _embedding_text(story: md.Story) -> str:
+    return f"{story.title}\n\n{(story.text or '')[:EMBEDDING_TEXT_CHARS]}"
+
+
+def embed_new_stories(limit: int = 1000) -> int:
+    """
+    Compute and store embeddings for mirrored stories that do not have one yet for
+    the current embedding model and dimensions, returning the number embedded.
+    """
+    embedded = md.StoryEmbedding.objects.filter(
+        story=OuterRef("pk"), model=EMBEDDING_MODEL, dimensions=EMBEDDING_DIMENSIONS
+    )
+    stories = list(
+        md.Story.objects.filter(~Exists(embedded)).order_by("-published_at")[:limit]
+    )
+    for i in range(0, len(stories), EMBEDDING_BATCH_SIZE):
+        batch = stories[i : i + EMBEDDING_BATCH_SIZE]
+        vectors = _normalise(
+            openai_text_embeddings(
+                [_embedding_text(story) for story in batch],
+                dimensions=EMBEDDING_DIMENSIONS,
+                # Story vectors are stored in story_embeddings instead.
+                use_cache=False,
+                # Backfilling embeddings can wait for any other OpenAI request.
+                priority=rate_limit.Priority.BATCH,
+            )
+        )
+        md.StoryEmbedding.objects.bulk_create(
+            [
+                md.StoryEmbedding(
+                    story=story,
+                    model=EMBEDDING_MODEL,
+                    dimensions=EMBEDDING_DIMENSIONS,
+                    vector=vector.astype(np.float32).tobytes(),
+                    published_at=story.published_at,
+                )
+                for story, vector in zip(batch, vectors)
+            ],
+            ignore_conflicts=True,
+        )
+    return len(stories)
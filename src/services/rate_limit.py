@@ -0,0 +1,197 @@
+import asyncio
+import enum
+import logging
+import os
+import random
+import time
+
+import redis
+
+from .cache import get_redis
+
+LOG = logging.getLogger(__name__)
+
+# Limits of the OpenAI account, applied per model across every web and celery worker.
+OPENAI_RPM_LIMIT = int(os.environ.get("OPENAI_RPM_LIMIT", 5000))
+OPENAI_TPM_LIMIT = int(os.environ.get("OPENAI_TPM_LIMIT", 800_000))
+# Longest single sleep between attempts to take from the buckets.
+RATE_LIMIT_MAX_SLEEP = 1.0
+
+
+class Priority(enum.Enum):
+    """
+    Priority classes of OpenAI requests. Lower priorities may only take from the
+    buckets while they are more than ``reserve`` full, which leaves that headroom to
+    higher priority requests whenever the account gets close to its limits.
+    """
+
+    INTERACTIVE = 0.0
+    BACKGROUND = 0.25
+    BATCH = 0.5
+
+    @property
+    def reserve(self) -> float:
+        return self.value
+
+
+# Web workers serve the playgrounds; celery workers switch this to BACKGROUND.
+default_priority = Priority.INTERACTIVE
+
+# Refills the RPM and TPM buckets of a model for the time elapsed since they were
+# last used and takes one request and the estimated tokens from them, but only if
+# both would stay above the priority's reserve. Returns 0 when the request may go
+# ahead, otherwise the seconds until the buckets will have refilled enough.
+_TAKE_SCRIPT = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local reserve = tonumber(ARGV[5])
+local wait = 0
+local levels = {}
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i])
+    local bucket = redis.call('HMGET', key, 'level', 'updated_at')
+    local level = tonumber(bucket[1]) or capacity
+    local updated_at = tonumber(bucket[2]) or now
+    local rate = capacity / 60
+    level = math.min(capacity, level + math.max(0, now - updated_at) * rate)
+    local needed = tonumber(ARGV[i + 2]) + reserve * capacity
+    if level < needed then
+        wait = math.max(wait, (needed - level) / rate)
+    end
+    levels[i] = level
+end
+for i, key in ipairs(KEYS) do
+    local level = levels[i]
+    if wait == 0 then
+        level = level - tonumber(ARGV[i + 2])
+    end
+    redis.call('HSET', key, 'level', level, 'updated_at', now)
+    redis.call('EXPIRE', key, 600)
+end
+return tostring(wait)
+"""
+
+
+# Corrects the TPM bucket of a model by the difference between the estimated and the
+# used tokens, after refilling it like _TAKE_SCRIPT so the correction applies to the
+# current level. The level never exceeds the bucket's capacity. A bucket which has
+# expired is full already and is left alone.
+_CORRECT_SCRIPT = """
+local bucket = redis.call('HMGET', KEYS[1], 'level', 'updated_at')
+local level = tonumber(bucket[1])
+if not level then
+    return
+end
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local capacity = tonumber(ARGV[1])
+local updated_at = tonumber(bucket[2]) or now
+level = level + math.max(0, now - updated_at) * capacity / 60
+level = math.min(capacity, level + tonumber(ARGV[2]))
+redis.call('HSET', KEYS[1], 'level', level, 'updated_at', now)
+redis.call('EXPIRE', KEYS[1], 600)
+"""
+
+
+def _bucket_keys(model: str) -> list[str]:
+    return [f"rate-limit:{model}:rpm", f"rate-limit:{model}:tpm"]
+
+
+def _take(model: str, tokens: int, priority: Priority) -> float:
+    tokens = min(tokens, OPENAI_TPM_LIMIT)
+    try:
+        return float(
+            get_redis().eval(
+                _TAKE_SCRIPT,
+                2,
+                *_bucket_keys(model),
+                OPENAI_RPM_LIMIT,
+                OPENAI_TPM_LIMIT,
+                1,
+                tokens,
+                priority.reserve,
+            )
+        )
+    except redis.RedisError as e:
+        # Without Redis requests are not coordinated, but they are not blocked either.
+        LOG.warning(f"OpenAI rate limiter unavailable: {e}")
+        return 0.0
+
+
+def _record_wait(priority: Priority, waited: float):
+    try:
+        pipe = get_redis().pipeline()
+        pipe.hincrby("rate-limit:metrics", f"{priority.name}:requests", 1)
+        if waited > 0:
+            pipe.hincrby("rate-limit:metrics", f"{priority.name}:waited", 1)
+            pipe.hincrbyfloat(
+                "rate-limit:metrics", f"{priority.name}:wait_seconds", waited
+            )
+        pipe.execute()
+    except redis.RedisError as e:
+        LOG.warning(f"OpenAI rate limiter unavailable: {e}")
+
+
+def _sleep_time(wait: float) -> float:
+    return min(wait, RATE_LIMIT_MAX_SLEEP) * random.uniform(1, 1.2)
+
+
+def acquire(model: str, tokens: int, priority: Priority = None) -> float:
+    """
+    Block until one request and ``tokens`` estimated tokens for ``model`` can be
+    taken from the account-wide buckets, returning the seconds spent waiting.
+    """
+    priority = priority or default_priority
+    waited = 0.0
+    while (wait := _take(model, tokens, priority)) > 0:
+        sleep_for = _sleep_time(wait)
+        time.sleep(sleep_for)
+        waited += sleep_for
+    _record_wait(priority, waited)
+    return waited
+
+
+async def acquire_async(model: str, tokens: int, priority: Priority = None) -> float:
+    """The asyncio counterpart of acquire, for the services event loop."""
+    priority = priority or default_priority
+    waited = 0.0
+    while (wait := await asyncio.to_thread(_take, model, tokens, priority)) > 0:
+        sleep_for = _sleep_time(wait)
+        await asyncio.sleep(sleep_for)
+        waited += sleep_for
+    await asyncio.to_thread(_record_wait, priority, waited)
+    return waited
+
+
+def record_usage(model: str, estimated_tokens: int, used_tokens: int):
+    """Return over-estimated tokens to the TPM bucket, or take the shortfall."""
+    try:
+        get_redis().eval(
+            _CORRECT_SCRIPT,
+            1,
+            _bucket_keys(model)[1],
+            OPENAI_TPM_LIMIT,
+            estimated_tokens - used_tokens,
+        )
+    except redis.RedisError as e:
+        LOG.warning(f"OpenAI rate limiter unavailable: {e}")
+
+
+def get_rate_limit_stats() -> dict:
+    """Requests and time spent waiting for the rate limiter, per priority class."""
+    try:
+        metrics = get_redis().hgetall("rate-limit:metrics")
+    except redis.RedisError as e:
+        LOG.warning(f"OpenAI rate limiter unavailable: {e}")
+        return {}
+    metrics = {key.decode(): float(value) for key, value in metrics.items()}
+    stats = {}
+    for priority in Priority:
+        requests = metrics.get(f"{priority.name}:requests", 0)
+        wait_seconds = metrics.get(f"{priority.name}:wait_seconds", 0)
+        stats[priority.name.lower()] = {
+            "requests": int(requests),
+            "waited": int(metrics.get(f"{priority.name}:waited", 0)),
+            "mean_wait_seconds": wait_seconds / requests if requests else 0.0,
+        }
+    return stats
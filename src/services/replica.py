@@ -0,0 +1,310 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager, suppress
+
+import psycopg2
+from psycopg2 import extensions
+
+LOG = logging.getLogger(__name__)
+
+# Pool sizes are per process, i.e. per gunicorn worker or celery worker child.
+REPLICA_POOL_MAX_SIZE = int(os.environ.get("REPLICA_POOL_MAX_SIZE", 10))
+REPLICA_POOL_TIMEOUT = float(os.environ.get("REPLICA_POOL_TIMEOUT", 30))
+REPLICA_CONN_MAX_LIFETIME = float(os.environ.get("REPLICA_CONN_MAX_LIFETIME", 1800))
+REPLICA_CONN_HEALTH_CHECK_AFTER = float(
+    os.environ.get("REPLICA_CONN_HEALTH_CHECK_AFTER", 30)
+)
+REPLICA_CONNECT_TIMEOUT = int(os.environ.get("REPLICA_CONNECT_TIMEOUT", 10))
+REPLICA_HEALTH_CHECK_INTERVAL = float(
+    os.environ.get("REPLICA_HEALTH_CHECK_INTERVAL", 15)
+)
+REPLICA_HEALTH_CHECK_TIMEOUT_MS = int(
+    os.environ.get("REPLICA_HEALTH_CHECK_TIMEOUT_MS", 2000)
+)
+REPLICA_HEALTH_CHECK_CONNECT_TIMEOUT = int(
+    os.environ.get("REPLICA_HEALTH_CHECK_CONNECT_TIMEOUT", 2)
+)
+
+
+class PoolTimeoutError(Exception):
+    pass
+
+
+class ReplicaConnection(extensions.connection):
+    """A psycopg2 connection that keeps track of its age and idle time."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.created_at = time.monotonic()
+        self.last_used_at = self.created_at
+        self.prepared_statements = set()
+
+
+class ConnectionPool:
+    """
+    A thread-safe, blocking pool of psycopg2 connections.
+
+    Connections are created lazily up to ``max_size``. Connections which have been
+    idle for longer than ``health_check_after`` seconds are pinged before being
+    handed out, and connections older than ``max_lifetime`` seconds are recycled.
+    The pool is fork-safe: a child process never reuses its parent's sockets.
+    """
+
+    def __init__(
+        self,
+        connect,
+        max_size: int,
+        timeout: float,
+        max_lifetime: float,
+        health_check_after: float,
+    ):
+        self._connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.health_check_after = health_check_after
+        self._idle: list[ReplicaConnection] = []
+        self._size = 0
+        self._cond = threading.Condition()
+        self._pid = os.getpid()
+
+    def _reset_after_fork(self):
+        # The inherited sockets belong to the parent process, so they are dropped
+        # without being closed (closing would terminate the parent's sessions).
+        self._idle = []
+        self._size = 0
+        self._cond = threading.Condition()
+        self._pid = os.getpid()
+
+    def _is_expired(self, conn: ReplicaConnection) -> bool:
+        return time.monotonic() - conn.created_at > self.max_lifetime
+
+    def _is_healthy(self, conn: ReplicaConnection) -> bool:
+        if conn.closed or self._is_expired(conn):
+            return False
+        if time.monotonic() - conn.last_used_at < self.health_check_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn: ReplicaConnection):
+        with suppress(psycopg2.Error):
+            conn.close()
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def getconn(self) -> ReplicaConnection:
+        if os.getpid() != self._pid:
+            self._reset_after_fork()
+        deadline = time.monotonic() + self.timeout
+        while True:
+            conn = None
+            with self._cond:
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeoutError(
+                            f"Timed out after {self.timeout}s waiting for a replica connection"
+                        )
+                    self._cond.wait(remaining)
+                if self._idle:
+                    conn = self._idle.pop()
+                else:
+                    self._size += 1
+
+            if conn is None:
+                try:
+                    return self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+
+            if self._is_healthy(conn):
+                return conn
+            LOG.info("Discarding stale replica connection")
+            self._discard(conn)
+
+    def putconn(self, conn: ReplicaConnection, discard: bool = False):
+        if os.getpid() != self._pid:
+            return
+        if not discard and not conn.closed and not self._is_expired(conn):
+            try:
+                if conn.status != extensions.STATUS_READY:
+                    conn.rollback()
+            except psycopg2.Error:
+                discard = True
+        else:
+            discard = True
+
+        if discard:
+            self._discard(conn)
+            return
+        conn.last_used_at = time.monotonic()
+        with self._cond:
+            self._idle.append(conn)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        conn = self.getconn()
+        discard = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            discard = True
+            raise
+        finally:
+            self.putconn(conn, discard=discard)
+
+    def close(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn in idle:
+            conn.close()
+
+
+def connect(connect_timeout: int = REPLICA_CONNECT_TIMEOUT) -> ReplicaConnection:
+    return psycopg2.connect(
+        host=os.environ["REPLICA_HOST"],
+        database=os.environ["REPLICA_DB"],
+        user=os.environ["REPLICA_USER"],
+        password=os.environ["REPLICA_PASSWORD"],
+        connect_timeout=connect_timeout,
+        application_name="playground",
+        keepalives=1,
+        keepalives_idle=60,
+        connection_factory=ReplicaConnection,
+    )
+
+
+def execute_prepared(cur, query: str, param_types: list[str], params: tuple):
+    """
+    Execute ``query`` (written with ``$1``, ``$2``... placeholders) as a server-side
+    prepared statement, preparing it on first use for each pooled connection so
+    Postgres plans it once per session rather than once per call.
+    """
+    conn = cur.connection
+    signature = f"{param_types}:{query}"
+    name = f"stmt_{hashlib.md5(signature.encode()).hexdigest()[:16]}"
+    if name not in conn.prepared_statements:
+        cur.execute(f"PREPARE {name} ({', '.join(param_types)}) AS {query}")
+        conn.prepared_statements.add(name)
+    placeholders = ", ".join(f"%s::{param_type}" for param_type in param_types)
+    cur.execute(f"EXECUTE {name} ({placeholders})", params)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    global _pool  # noqa: PLW0603
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    connect,
+                    max_size=REPLICA_POOL_MAX_SIZE,
+                    timeout=REPLICA_POOL_TIMEOUT,
+                    max_lifetime=REPLICA_CONN_MAX_LIFETIME,
+                    health_check_after=REPLICA_CONN_HEALTH_CHECK_AFTER,
+                )
+    return _pool
+
+
+def _reset_pool_in_child():
+    global _pool, _pool_lock  # noqa: PLW0603
+    _pool = None
+    _pool_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_pool_in_child)
+
+
+@contextmanager
+def connection():
+    """Borrow a connection to the replica database from the process-wide pool."""
+    with get_pool().connection() as conn:
+        yield conn
+
+
+_health = {"checked_at": None, "available": True, "generation": 0}
+_health_lock = threading.Lock()
+
+
+def _probe() -> bool:
+    # While the replica is being re-populated its story tables are locked, missing
+    # or empty, so the probe checks they can be read within a short timeout. It runs
+    # on the request path, so it opens its own connection with a short connect
+    # timeout rather than waiting for the pool or its longer connect timeout.
+    conn = None
+    try:
+        conn = connect(connect_timeout=REPLICA_HEALTH_CHECK_CONNECT_TIMEOUT)
+        with conn.cursor() as cur:
+            cur.execute(
+                "SET LOCAL statement_timeout = %s", (REPLICA_HEALTH_CHECK_TIMEOUT_MS,)
+            )
+            cur.execute(
+                "SET LOCAL lock_timeout = %s", (REPLICA_HEALTH_CHECK_TIMEOUT_MS,)
+            )
+            cur.execute(
+                """
+                SELECT
+                    EXISTS (SELECT 1 FROM content_story)
+                    AND EXISTS (SELECT 1 FROM scripts_script)
+                """
+            )
+            return cur.fetchone()[0]
+    except Exception as e:
+        LOG.warning(f"Replica health check failed: {e}")
+        return False
+    finally:
+        if conn is not None:
+            with suppress(psycopg2.Error):
+                conn.close()
+
+
+def availability() -> tuple[bool, int]:
+    """
+    Return whether the replica is currently usable and its availability generation.
+
+    The replica is probed at most every REPLICA_HEALTH_CHECK_INTERVAL seconds per
+    process. The generation is incremented every time the replica becomes available
+    again, so callers can drop anything cached from before it went away.
+    """
+    now = time.monotonic()
+    with _health_lock:
+        checked_at = _health["checked_at"]
+        is_due = checked_at is None or now - checked_at >= REPLICA_HEALTH_CHECK_INTERVAL
+        if is_due:
+            _health["checked_at"] = now
+
+    if is_due:
+        available = _probe()
+        with _health_lock:
+            if available and not _health["available"]:
+                _health["generation"] += 1
+                LOG.info("Replica is available again")
+            elif not available and _health["available"]:
+                LOG.warning("Replica is unavailable, falling back to the local mirror")
+            _health["available"] = available
+
+    with _health_lock:
+        return _health["available"], _health["generation"]
+
+
+def is_available() -> bool:
+    return availability()[0]
@@ -0,0 +1,151 @@
+import datetime
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import httpx
+
+from .cache import SharedCache, make_key
+
+# "remote" searches the vector search service, "local" searches an in-process index
+# over the embeddings of the mirrored stories (see services.local_vector_search).
+VECTOR_SEARCH_ENGINE = os.environ.get("VECTOR_SEARCH_ENGINE", "remote")
+VECTOR_DB_URL = os.environ.get("VECTOR_DB_URL", "http://13.92.253.7")
+VECTOR_DB_TIMEOUT = float(os.environ.get("VECTOR_DB_TIMEOUT", 10))
+VECTOR_DB_CONNECT_TIMEOUT = float(os.environ.get("VECTOR_DB_CONNECT_TIMEOUT", 5))
+VECTOR_DB_MAX_CONNECTIONS = int(os.environ.get("VECTOR_DB_MAX_CONNECTIONS", 10))
+VECTOR_DB_KEEPALIVE_EXPIRY = float(os.environ.get("VECTOR_DB_KEEPALIVE_EXPIRY", 60))
+# Search windows are widened to multiples of this many seconds so that repeated
+# searches made within the same bucket are identical and can share a cache entry.
+VECTOR_SEARCH_CACHE_BUCKET_SECONDS = int(
+    os.environ.get("VECTOR_SEARCH_CACHE_BUCKET_SECONDS", 900)
+)
+# A cached result misses the stories published since it was stored, so the TTL (not
+# the bucket length) bounds how stale a search can be.
+VECTOR_SEARCH_CACHE_TTL = int(
+    os.environ.get("VECTOR_SEARCH_CACHE_TTL", VECTOR_SEARCH_CACHE_BUCKET_SECONDS // 6)
+)
+VECTOR_SEARCH_CACHE_MAX_ENTRIES = int(
+    os.environ.get("VECTOR_SEARCH_CACHE_MAX_ENTRIES", 1000)
+)
+
+vector_search_cache = SharedCache(
+    "vector-search",
+    ttl=VECTOR_SEARCH_CACHE_TTL,
+    max_entries=VECTOR_SEARCH_CACHE_MAX_ENTRIES,
+)
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> httpx.Client:
+    """Return the process-wide keep-alive HTTP client for the vector search service."""
+    global _client  # noqa: PLW0603
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = httpx.Client(
+                    base_url=VECTOR_DB_URL,
+                    headers={
+                        "accept": "application/json",
+                        "Content-Type": "application/json",
+                    },
+                    timeout=httpx.Timeout(
+                        VECTOR_DB_TIMEOUT, connect=VECTOR_DB_CONNECT_TIMEOUT
+                    ),
+                    limits=httpx.Limits(
+                        max_connections=VECTOR_DB_MAX_CONNECTIONS,
+                        max_keepalive_connections=VECTOR_DB_MAX_CONNECTIONS,
+                        keepalive_expiry=VECTOR_DB_KEEPALIVE_EXPIRY,
+                    ),
+                )
+    return _client
+
+
+def _reset_client_in_child():
+    # never share the parent's keep-alive sockets with a forked worker
+    global _client, _client_lock  # noqa: PLW0603
+    _client = None
+    _client_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_client_in_child)
+
+
+def _floor_to_bucket(value: datetime.datetime) -> datetime.datetime:
+    naive = value.replace(microsecond=0, tzinfo=None)
+    seconds = int((naive - datetime.datetime(1970, 1, 1)).total_seconds())
+    floored = naive - datetime.timedelta(
+        seconds=seconds % VECTOR_SEARCH_CACHE_BUCKET_SECONDS
+    )
+    return floored.replace(tzinfo=value.tzinfo)
+
+
+def _search_window(start_date) -> tuple[str, str]:
+    """
+    Quantise the search window: the start is floored and the end (now) is rounded up
+    to the bucket boundary, so the window only ever grows slightly.
+    """
+    start = _floor_to_bucket(datetime.datetime.fromisoformat(str(start_date)))
+    end = _floor_to_bucket(datetime.datetime.now()) + datetime.timedelta(
+        seconds=VECTOR_SEARCH_CACHE_BUCKET_SECONDS
+    )
+    return start.isoformat(), end.isoformat()
+
+
+def get_vector_search_stories(start_date, limit, vector_search):
+    """
+    Search the stories published since ``start_date``. Results are cached per
+    quantised window, so they can leave out stories published in the last
+    VECTOR_SEARCH_CACHE_TTL seconds (150 by default).
+    """
+    if VECTOR_SEARCH_ENGINE == "local":
+        from . import local_vector_search
+
+        return local_vector_search.get_vector_search_stories(
+            start_date, limit, vector_search
+        )
+
+    start_date_time, end_date_time = _search_window(start_date)
+    payload = {
+        "query": str(vector_search),
+        "n_results": limit,
+        "start_date_time": start_date_time,
+        "end_date_time": end_date_time,
+    }
+    cache_key = make_key(payload)
+    cached_stories = vector_search_cache.get(cache_key)
+    if cached_stories is not None:
+        return cached_stories
+
+    response = get_client().post("/search_articles/", json=payload)
+    response.raise_for_status()
+    stories = response.json()[0]
+    vector_search_cache.set(cache_key, stories)
+    return stories
+
+
+def get_vector_search_stories_for_queries(
+    start_date, limit, vector_searches: List[str]
+) -> List[List[Dict]]:
+    """
+    Run several vector searches concurrently over the shared client, returning the
+    results in the same order as ``vector_searches``.
+    """
+    if len(vector_searches) <= 1:
+        return [
+            get_vector_search_stories(start_date, limit, vector_search)
+            for vector_search in vector_searches
+        ]
+    max_workers = min(VECTOR_DB_MAX_CONNECTIONS, len(vector_searches))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(
+            executor.map(
+                lambda vector_search: get_vector_search_stories(
+                    start_date, limit, vector_search
+                ),
+                vector_searches,
+            )
+        )
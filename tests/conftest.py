@@ -0,0 +1,61 @@
+import fakeredis
+import pytest
+from django.db import connection
+
+from src.services import cache, external_data, replica
+
+REPLICA_TABLES = """
+CREATE TABLE content_publication (id uuid PRIMARY KEY, name text);
+CREATE TABLE content_story (
+    id uuid PRIMARY KEY,
+    title text,
+    published_at timestamptz,
+    author text,
+    type text,
+    classification text,
+    publication_id uuid REFERENCES content_publication
+);
+CREATE TABLE scripts_script (story_id uuid REFERENCES content_story, text text);
+"""
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    """Point the shared Redis client at an in-memory fake (with Lua scripting)."""
+    client = fakeredis.FakeRedis()
+    monkeypatch.setattr(cache, "_redis", client)
+    return client
+
+
+@pytest.fixture
+def replica_db(django_db_setup, monkeypatch):
+    """
+    Point the replica pool at the test database, with empty replica story tables.
+    Yields an autocommit connection to populate them with.
+    """
+    settings = connection.settings_dict
+    monkeypatch.setenv("REPLICA_HOST", settings["HOST"] or "")
+    monkeypatch.setenv("REPLICA_DB", settings["NAME"])
+    monkeypatch.setenv("REPLICA_USER", settings["USER"] or "")
+    monkeypatch.setenv("REPLICA_PASSWORD", settings["PASSWORD"] or "")
+    if settings["PORT"]:
+        monkeypatch.setenv("PGPORT", str(settings["PORT"]))
+    monkeypatch.setattr(replica, "_pool", None)
+    monkeypatch.setattr(
+        replica, "_health", {"checked_at": None, "available": True, "generation": 0}
+    )
+    external_data.story_cache.clear()
+
+    conn = replica.connect()
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute(REPLICA_TABLES)
+    try:
+        yield conn
+    finally:
+        if replica._pool is not None:
+            replica._pool.close()
+        with conn.cursor() as cur:
+            cur.execute("DROP TABLE scripts_script, content_story, content_publication")
+        conn.close()
+        external_data.story_cache.clear()
@@ -0,0 +1,221 @@
+"""
+A local stand-in for the OpenAI Files and Batch APIs, so ranking batch jobs can be
+run end to end without network access:
+
+    python -m tests.local_batch_server --port 8100
+    OPENAI_BATCH_BASE_URL=http://localhost:8100/v1
+
+Batches complete shortly after they are created. Each chat completion is answered
+with JSON matching the request's response format, with numbers derived from a hash
+of the request so that results are deterministic.
+"""
+
+import argparse
+import email
+import email.policy
+import hashlib
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Seconds a batch stays in progress before its output is written.
+LOCAL_BATCH_DELAY = 1.0
+
+_files = {}
+_batches = {}
+_lock = threading.Lock()
+
+
+def _fake_value(schema: dict, seed: str):
+    schema_type = schema.get("type")
+    if schema_type == "object":
+        return {
+            name: _fake_value(prop, f"{seed}:{name}")
+            for name, prop in schema.get("properties", {}).items()
+        }
+    if schema_type == "array":
+        return []
+    if schema_type in ("number", "integer"):
+        digest = hashlib.sha256(seed.encode()).digest()
+        value = int.from_bytes(digest[:4], "big") / 2**32
+        return value if schema_type == "number" else int(value * 10)
+    if schema_type == "boolean":
+        return False
+    return ""
+
+
+def _chat_completion(body: dict) -> dict:
+    seed = json.dumps(body, sort_keys=True)
+    response_format = body.get("response_format") or {}
+    schema = response_format.get("json_schema", {}).get("schema")
+    content = json.dumps(_fake_value(schema, seed)) if schema else "OK"
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model"),
+        "choices": [
+            {
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": content},
+            }
+        ],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    }
+
+
+def _create_file(filename: str, purpose: str, content: bytes) -> dict:
+    file = {
+        "id": f"file-{uuid.uuid4().hex}",
+        "object": "file",
+        "bytes": len(content),
+        "created_at": int(time.time()),
+        "filename": filename,
+        "purpose": purpose,
+        "status": "processed",
+    }
+    with _lock:
+        _files[file["id"]] = (file, content)
+    return file
+
+
+def _run_batch(batch_id: str):
+    time.sleep(LOCAL_BATCH_DELAY)
+    with _lock:
+        batch = _batches[batch_id]
+        _, content = _files[batch["input_file_id"]]
+    output = []
+    for line in content.decode().splitlines():
+        if not line.strip():
+            continue
+        request = json.loads(line)
+        output.append(
+            json.dumps(
+                {
+                    "id": f"batch_req_{uuid.uuid4().hex}",
+                    "custom_id": request["custom_id"],
+                    "response": {
+                        "status_code": 200,
+                        "request_id": uuid.uuid4().hex,
+                        "body": _chat_completion(request["body"]),
+                    },
+                    "error": None,
+                }
+            )
+        )
+    output_file = _create_file(
+        "batch_output.jsonl", "batch_output", "\n".join(output).encode()
+    )
+    with _lock:
+        batch.update(
+            status="completed",
+            output_file_id=output_file["id"],
+            completed_at=int(time.time()),
+            request_counts={
+                "total": len(output),
+                "completed": len(output),
+                "failed": 0,
+            },
+        )
+
+
+class BatchRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _send_json(self, data: dict, status: int = 200):
+        self._send(json.dumps(data).encode(), "application/json", status)
+
+    def _send(self, body: bytes, content_type: str, status: int = 200):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _not_found(self):
+        self._send_json({"error": {"message": "Not found"}}, status=404)
+
+    def _body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def do_POST(self):  # noqa: N802
+        if self.path == "/v1/files":
+            message = email.message_from_bytes(
+                f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode()
+                + self._body(),
+                policy=email.policy.HTTP,
+            )
+            fields, filename, content = {}, "upload.jsonl", b""
+            for part in message.iter_parts():
+                name = part.get_param("name", header="content-disposition")
+                if name == "file":
+                    filename = part.get_filename() or filename
+                    content = part.get_payload(decode=True)
+                else:
+                    fields[name] = part.get_payload(decode=True).decode()
+            self._send_json(_create_file(filename, fields.get("purpose"), content))
+        elif self.path == "/v1/batches":
+            request = json.loads(self._body())
+            if request["input_file_id"] not in _files:
+                self._not_found()
+                return
+            batch = {
+                "id": f"batch_{uuid.uuid4().hex}",
+                "object": "batch",
+                "endpoint": request["endpoint"],
+                "input_file_id": request["input_file_id"],
+                "completion_window": request["completion_window"],
+                "status": "in_progress",
+                "created_at": int(time.time()),
+                "metadata": request.get("metadata"),
+            }
+            with _lock:
+                _batches[batch["id"]] = batch
+            threading.Thread(target=_run_batch, args=(batch["id"],)).start()
+            self._send_json(batch)
+        else:
+            self._not_found()
+
+    def do_GET(self):  # noqa: N802
+        if match := re.fullmatch(r"/v1/batches/([\w-]+)", self.path):
+            with _lock:
+                batch = _batches.get(match[1])
+            if batch is None:
+                self._not_found()
+            else:
+                self._send_json(batch)
+        elif match := re.fullmatch(r"/v1/files/([\w-]+)/content", self.path):
+            with _lock:
+                _, content = _files.get(match[1], (None, None))
+            if content is None:
+                self._not_found()
+            else:
+                self._send(content, "application/octet-stream")
+        elif match := re.fullmatch(r"/v1/files/([\w-]+)", self.path):
+            with _lock:
+                file, _ = _files.get(match[1], (None, None))
+            if file is None:
+                self._not_found()
+            else:
+                self._send_json(file)
+        else:
+            self._not_found()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8100)
+    args = parser.parse_args()
+    server = ThreadingHTTPServer((args.host, args.port), BatchRequestHandler)
+    url = f"http://{args.host}:{args.port}/v1"
+    print(f"Local batch server listening on {url}")  # noqa: T201
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+import datetime
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+import pytest
+from django.utils import timezone
+from openai import OpenAI
+
+from app import models as md
+from app import repo, tasks
+from app.repo import story_sources
+from app.types import StorySelection
+from src.services import batch_ranking
+
+from . import local_batch_server
+
+
+@pytest.fixture
+def batch_server(monkeypatch):
+    monkeypatch.setattr(local_batch_server, "LOCAL_BATCH_DELAY", 0)
+    server = ThreadingHTTPServer(
+        ("localhost", 0), local_batch_server.BatchRequestHandler
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(
+        batch_ranking,
+        "batch_client",
+        OpenAI(
+            api_key="sk-local",
+            base_url=f"http://localhost:{server.server_port}/v1",
+        ),
+    )
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def stories(monkeypatch):
+    monkeypatch.setattr(repo.stories, "get_story_source", lambda: story_sources.mirror)
+    published_at = timezone.now() - datetime.timedelta(hours=1)
+    return md.Story.objects.bulk_create(
+        md.Story(
+            title=f"Story {i}",
+            text=f"Text of story {i}",
+            published_at=published_at - datetime.timedelta(minutes=i),
+            publication="The Paper",
+        )
+        for i in range(25)
+    )
+
+
+def _job(prompt_name="Batch ranking"):
+    return {
+        "prompt_name": prompt_name,
+        "prompt_value": "How important is this story?",
+        "vector_query": None,
+        "is_vector_search": None,
+        "start_date": (timezone.now() - datetime.timedelta(days=1)).isoformat(),
+        "attributes": ["title", "text"],
+    }
+
+
+def _wait_for_batch(batch_id):
+    for _ in range(100):
+        if batch_ranking.get_batch(batch_id).status == "completed":
+            return
+        time.sleep(0.05)
+    raise TimeoutError(batch_id)
+
+
+@pytest.mark.django_db
+def test_ranking_batch_is_saved_as_a_prompt_result(batch_server, stories, monkeypatch):
+    polls = []
+    monkeypatch.setattr(
+        tasks.poll_ranking_batch, "apply_async", lambda **kwargs: polls.append(kwargs)
+    )
+    task = repo.tasks.create()
+
+    tasks.submit_ranking_batch(task.task_id, _job())
+    task.refresh_from_db()
+    assert task.status == "STARTED"
+    assert polls == [
+        {"args": [task.task_id], "countdown": tasks.RANKING_BATCH_POLL_SECONDS}
+    ]
+    _wait_for_batch(json.loads(task.result)["batch_id"])
+    tasks.poll_ranking_batch(task.task_id)
+
+    task.refresh_from_db()
+    result = json.loads(task.result)
+    assert task.status == "COMPLETED"
+    assert result["ranked"] == len(stories)
+    assert "stories" not in result
+    prompt_result = md.PromptResult.objects.get(id=result["prompt_result_id"])
+    assert prompt_result.prompt_name == "Batch ranking"
+    assert {story["id"] for story in prompt_result.stories["data"]} == {
+        str(story.id) for story in stories
+    }
+    values = [story["value"] for story in prompt_result.stories["data"]]
+    assert values == sorted(values, reverse=True)
+
+
+@pytest.mark.django_db
+def test_ranking_batch_input_is_capped_by_size(batch_server, stories, monkeypatch):
+    monkeypatch.setattr(tasks.poll_ranking_batch, "apply_async", lambda **kwargs: None)
+    job = _job()
+    candidates = repo.stories.get_random_stories(
+        StorySelection(start_date=job["start_date"]), with_text=True
+    )
+    capped = candidates[:10]
+    content, _ = batch_ranking.build_batch_file(
+        job["prompt_value"],
+        capped,
+        job["attributes"],
+        max_bytes=batch_ranking.RANKING_BATCH_MAX_FILE_BYTES,
+    )
+    monkeypatch.setattr(batch_ranking, "RANKING_BATCH_MAX_FILE_BYTES", len(content))
+    task = repo.tasks.create()
+
+    tasks.submit_ranking_batch(task.task_id, job)
+
+    state = json.loads(md.Task.objects.get(id=task.id).result)
+    assert [story["id"] for story in state["stories"]] == [
+        str(story.id) for story in capped
+    ]
+    batch = batch_ranking.get_batch(state["batch_id"])
+    _, uploaded = local_batch_server._files[batch.input_file_id]
+    assert uploaded == content
+
+
+@pytest.mark.django_db
+def test_malformed_batch_output_is_left_out(batch_server, stories, monkeypatch):
+    monkeypatch.setattr(tasks.poll_ranking_batch, "apply_async", lambda **kwargs: None)
+    task = repo.tasks.create()
+    tasks.submit_ranking_batch(task.task_id, _job())
+    state = json.loads(md.Task.objects.get(id=task.id).result)
+    _wait_for_batch(state["batch_id"])
+    batch = batch_ranking.get_batch(state["batch_id"])
+    file, content = local_batch_server._files[batch.output_file_id]
+    lines = content.decode().splitlines()
+    broken = json.loads(lines[1])
+    broken["response"]["body"]["choices"][0]["message"]["content"] = "{}"
+    lines[1] = json.dumps(broken)
+    lines[2] = lines[2][:20]
+    local_batch_server._files[batch.output_file_id] = (
+        file,
+        "\n".join(lines).encode(),
+    )
+
+    ranked = batch_ranking.get_batch_results(batch, state["stories"])
+    assert len(ranked) == len(stories) - 2
+
+
+@pytest.mark.django_db
+def test_batch_polling_gives_up_after_the_completion_window(monkeypatch):
+    monkeypatch.setattr(
+        batch_ranking,
+        "get_batch",
+        lambda batch_id: batch_ranking.Batch(
+            id=batch_id,
+            object="batch",
+            endpoint=batch_ranking.RANKING_BATCH_ENDPOINT,
+            input_file_id="file-1",
+            completion_window=batch_ranking.RANKING_BATCH_COMPLETION_WINDOW,
+            status="in_progress",
+            created_at=0,
+        ),
+    )
+    task = repo.tasks.create()
+    task.result = json.dumps({"batch_id": "batch-1", "stories": []})
+    task.save()
+
+    tasks.poll_ranking_batch.apply(
+        args=[task.task_id], retries=tasks.RANKING_BATCH_MAX_POLLS
+    )
+
+    task.refresh_from_db()
+    assert task.status == "FAILED"
+    assert json.loads(task.result)["error"] == "Batch still in_progress"
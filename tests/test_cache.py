@@ -0,0 +1,74 @@
+import pickle
+
+from src.services import cache as cache_module
+from src.services.cache import LRUCache, SharedCache
+
+
+def test_shared_cache_round_trips_json_values(fake_redis):
+    cache = SharedCache("test", ttl=60, max_entries=10)
+    cache.set_many({"a": {"value": [1, 2.5, "three"]}, "b": "b"})
+
+    assert cache.get_many(["a", "b", "c"]) == {
+        "a": {"value": [1, 2.5, "three"]},
+        "b": "b",
+    }
+    assert cache.get("c", "default") == "default"
+
+
+def test_shared_cache_treats_undecodable_entries_as_misses(fake_redis):
+    cache = SharedCache("test", ttl=60, max_entries=10)
+    cache.set("good", 1)
+    fake_redis.set("test:pickled", pickle.dumps({"value": 1}))
+    fake_redis.set("test:truncated", b'{"value": ')
+
+    assert cache.get_many(["good", "pickled", "truncated"]) == {"good": 1}
+
+
+def test_shared_cache_evicts_the_oldest_entries(fake_redis):
+    cache = SharedCache("test", ttl=60, max_entries=2)
+    for key in ("a", "b", "c"):
+        cache.set(key, key)
+
+    assert cache.get_many(["a", "b", "c"]) == {"b": "b", "c": "c"}
+
+
+def test_lru_cache_expires_entries_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, "monotonic", lambda: now[0])
+    cache = LRUCache(maxsize=10, ttl=60)
+    cache.set("a", 1)
+
+    now[0] += 59
+    assert cache.get("a") == 1
+    now[0] += 1
+    assert cache.get("a") is None
+    assert cache.peek("a") is None
+    assert cache.stats() == {
+        "hits": 1,
+        "misses": 1,
+        "hit_rate": 0.5,
+        "size": 0,
+        "maxsize": 10,
+        "ttl": 60,
+    }
+
+
+def test_lru_cache_evicts_the_least_recently_used_entry():
+    cache = LRUCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.peek("b")
+    cache.set("c", 3)
+
+    assert cache.get_many(["a", "b", "c"]) == {"a": 1, "c": 3}
+    assert cache.stats()["size"] == cache.maxsize
+
+
+def test_lru_cache_counts_rejected_entries_as_misses_and_keeps_them():
+    cache = LRUCache(maxsize=10, ttl=60)
+    cache.set("a", {"title": "A"})
+
+    assert cache.get_many(["a"], accept=lambda story: "text" in story) == {}
+    assert cache.get_many(["a"]) == {"a": {"title": "A"}}
+    assert (cache.hits, cache.misses) == (1, 1)
@@ -0,0 +1,94 @@
+import numpy as np
+
+from src.services import dedupe
+
+
+def _unit_vectors(degrees):
+    radians = np.radians(degrees)
+    return np.stack([np.cos(radians), np.sin(radians)], axis=1)
+
+
+def test_clusters_join_chains_of_similar_vectors_across_blocks():
+    # 0-30 and 30-60 degrees are similar; 0-60 is not, but they share a cluster.
+    vectors = _unit_vectors([0, 180, 30, 120, 60])
+    threshold = np.cos(np.radians(35))
+
+    for block_size in (1, 2, 5):
+        clusters = dedupe.cluster_duplicates(vectors, threshold, block_size)
+        assert clusters == [[0, 2, 4], [1], [3]]
+
+
+def test_union_find_groups_are_transitive():
+    union_find = dedupe.UnionFind(6)
+    union_find.union(4, 5)
+    union_find.union(0, 4)
+    union_find.union(2, 3)
+    union_find.union(5, 0)
+
+    assert union_find.groups() == [[0, 4, 5], [1], [2, 3]]
+
+
+def test_most_central_follows_the_weights():
+    vectors = _unit_vectors([0, 10, 40])
+    first, middle, last = members = [0, 1, 2]
+
+    assert dedupe.most_central(vectors, members) == middle
+    assert dedupe.most_central(vectors, members, weights=[10, 1, 1]) == first
+    assert dedupe.most_central(vectors, [last]) == last
+
+
+def _near_duplicates(rng, words, copies, edits):
+    text = list(rng.choice(words, 60))
+    variants = [" ".join(text)]
+    for _ in range(copies - 1):
+        variant = list(text)
+        for position in rng.choice(len(variant), edits, replace=False):
+            variant[position] = rng.choice(words)
+        variants.append(" ".join(variant))
+    return variants
+
+
+def test_near_verbatim_clusters_find_every_near_duplicate():
+    rng = np.random.default_rng(0)
+    words = [f"word{i}" for i in range(500)]
+    texts = []
+    for _ in range(40):
+        texts += _near_duplicates(rng, words, copies=3, edits=1)
+    order = rng.permutation(len(texts))
+    texts = [texts[i] for i in order]
+
+    clusters = dedupe.cluster_near_verbatim(texts)
+
+    # Texts were generated in groups of three consecutive originals.
+    expected = {}
+    for position, original in enumerate(order):
+        expected.setdefault(original // 3, []).append(position)
+    assert clusters == sorted(expected.values(), key=lambda members: members[0])
+
+
+def test_near_verbatim_clusters_match_comparing_every_pair():
+    rng = np.random.default_rng(1)
+    words = [f"word{i}" for i in range(50)]
+    texts = []
+    for edits in range(1, 12):
+        texts += _near_duplicates(rng, words, copies=2, edits=edits)
+    signatures = dedupe.minhash_signatures(texts)
+    union_find = dedupe.UnionFind(len(texts))
+    for i in range(len(texts)):
+        for j in range(i + 1, len(texts)):
+            similarity = np.mean(signatures[i] == signatures[j])
+            if similarity >= dedupe.LEXICAL_DUPLICATE_THRESHOLD:
+                union_find.union(i, j)
+
+    assert dedupe.cluster_near_verbatim(texts) == union_find.groups()
+    assert union_find.groups() != [[i] for i in range(len(texts))]
+
+
+def test_near_verbatim_ignores_markup_and_case():
+    text = "The minister said the economy grew faster than expected this year"
+
+    clusters = dedupe.cluster_near_verbatim(
+        [text, f"<p>{text.upper()}</p>", "An unrelated story about the weather"]
+    )
+
+    assert clusters == [[0, 1], [2]]
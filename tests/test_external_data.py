@@ -0,0 +1,152 @@
+import datetime
+import uuid
+
+import pytest
+
+from app import models as md
+from app.repo import story_sources
+from src.services import external_data, replica
+
+pytestmark = pytest.mark.django_db
+
+
+def _add_story(conn, title, published_at, story_type="ARTICLE", text="Text"):
+    story_id = str(uuid.uuid4())
+    publication_id = str(uuid.uuid4())
+    with conn.cursor() as cur:
+        cur.execute(
+            "INSERT INTO content_publication VALUES (%s, 'The Paper')",
+            (publication_id,),
+        )
+        cur.execute(
+            """
+            INSERT INTO content_story (id, title, published_at, type, publication_id)
+            VALUES (%s, %s, %s, %s, %s)
+            """,
+            (story_id, title, published_at, story_type, publication_id),
+        )
+        cur.execute("INSERT INTO scripts_script VALUES (%s, %s)", (story_id, text))
+    return story_id
+
+
+def _days_ago(days):
+    return datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=days)
+
+
+def test_iter_story_batches_streams_the_newest_stories_in_batches(replica_db):
+    story_ids = [_add_story(replica_db, f"Story {i}", _days_ago(i)) for i in range(5)]
+    _add_story(replica_db, "Segment", _days_ago(0), story_type="SEGMENT")
+    limit = 4
+    batch_size = 3
+
+    batches = list(external_data.iter_story_batches(limit=limit, batch_size=batch_size))
+
+    assert [len(batch) for batch in batches] == [batch_size, limit - batch_size]
+    streamed_ids = [story["id"] for batch in batches for story in batch]
+    assert streamed_ids == story_ids[:limit]
+
+
+def test_get_stories_collects_the_streamed_batches(replica_db):
+    # Days apart, so the date comparison holds whatever the server's time zone
+    story_ids = [
+        _add_story(replica_db, f"Story {i}", _days_ago(3 * i)) for i in range(3)
+    ]
+
+    result = external_data.get_stories(start_date=_days_ago(4).date(), limit=10)
+
+    assert result["total"] == len(result["data"])
+    assert [story["id"] for story in result["data"]] == story_ids[:2]
+
+
+def test_stories_only_include_the_requested_fields(replica_db):
+    story_id = _add_story(replica_db, "Story", _days_ago(0))
+
+    result = external_data.get_stories_by_id([story_id], fields=["title"])
+
+    assert result["data"] == [{"id": story_id, "title": "Story"}]
+    with pytest.raises(ValueError, match="Unknown story fields"):
+        external_data.get_stories_by_id([story_id], fields=["body"])
+
+
+def test_story_texts_are_fetched_separately(replica_db):
+    story_id = _add_story(replica_db, "Story", _days_ago(0), text="The script")
+
+    stories = external_data.get_stories_by_id(
+        [story_id], fields=external_data.STORY_FIELDS_WITHOUT_TEXT
+    )["data"]
+
+    assert "text" not in stories[0]
+    assert external_data.get_story_texts([story_id]) == {story_id: "The script"}
+
+
+def test_stories_are_looked_up_in_chunks_in_the_requested_order(
+    replica_db, monkeypatch
+):
+    monkeypatch.setattr(external_data, "STORY_LOOKUP_CHUNK_SIZE", 2)
+    story_ids = [_add_story(replica_db, f"Story {i}", _days_ago(i)) for i in range(5)]
+    requested_ids = story_ids[::-1]
+
+    result = external_data.get_stories_by_id(requested_ids, fields=["title"])
+    by_title = external_data.get_stories_by_title(["Story 1", "Story 3", "Story 4"])
+
+    assert [story["id"] for story in result["data"]] == requested_ids
+    assert [story["title"] for story in by_title["data"]] == [
+        "Story 1",
+        "Story 3",
+        "Story 4",
+    ]
+
+
+def test_statements_are_prepared_once_per_connection(replica_db):
+    query = "SELECT count(*) FROM content_story WHERE id = ANY($1)"
+    story_ids = [str(uuid.uuid4())]
+
+    def prepared_count(conn):
+        with conn.cursor() as cur:
+            replica.execute_prepared(cur, query, ["uuid[]"], (story_ids,))
+            cur.execute("SELECT count(*) FROM pg_prepared_statements")
+            return cur.fetchone()[0]
+
+    first, second = replica.connect(), replica.connect()
+    try:
+        assert prepared_count(first) == 1
+        assert prepared_count(first) == 1
+        assert len(first.prepared_statements) == 1
+        assert prepared_count(second) == 1
+    finally:
+        first.close()
+        second.close()
+
+
+def test_story_cache_is_cleared_when_the_replica_comes_back(replica_db, monkeypatch):
+    story_id = _add_story(replica_db, "Before", _days_ago(0))
+    probes = iter([True, False, True])
+    monkeypatch.setattr(replica, "REPLICA_HEALTH_CHECK_INTERVAL", 0)
+    monkeypatch.setattr(replica, "_probe", lambda: next(probes))
+
+    def title():
+        return external_data.get_stories_by_id([story_id])["data"][0]["title"]
+
+    assert title() == "Before"
+    with replica_db.cursor() as cur:
+        cur.execute(
+            "UPDATE content_story SET title = 'After' WHERE id = %s", (story_id,)
+        )
+
+    # Served from the cache while the replica is down, refreshed once it is back.
+    assert title() == "Before"
+    assert title() == "After"
+
+
+def test_stories_are_read_from_the_mirror_while_the_replica_is_down(monkeypatch):
+    story = md.Story.objects.create(
+        id=uuid.uuid4(), title="Mirrored", text="Text", published_at=_days_ago(0)
+    )
+    monkeypatch.setattr(replica, "availability", lambda: (False, 0))
+
+    source = story_sources.get_story_source()
+
+    assert source is story_sources.mirror
+    assert source.get_stories_by_id([str(story.id)], fields=["title"])["data"] == [
+        {"id": str(story.id), "title": "Mirrored"}
+    ]
@@ -0,0 +1,161 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from app import tasks
+from src.services import aio, headlines
+
+
+def _bing_result(feed):
+    return {
+        "value": [
+            {
+                "name": f"{feed} headline",
+                "description": f"Everything that happened in {feed} today",
+                "provider": [{"name": "The Paper"}],
+                "datePublished": "2024-09-01T08:00:00Z",
+            }
+        ]
+    }
+
+
+@pytest.fixture
+def bing_requests(fake_redis, monkeypatch):
+    requests = []
+
+    def handler(request):
+        feed = request.url.params.get("category", headlines.TOP_HEADLINES_FEED)
+        requests.append(feed)
+        return httpx.Response(200, json=_bing_result(feed))
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(headlines, "_client", client)
+    return requests
+
+
+def _age_feed(market, feed, headline_limit, seconds):
+    key = headlines._bing_feed_cache_key(market, feed, headline_limit)
+    entry = headlines.bing_feed_cache.get(key)
+    headlines.bing_feed_cache.set(
+        key, {**entry, "fetched_at": entry["fetched_at"] - seconds}
+    )
+
+
+def test_feeds_are_served_from_the_cache(bing_requests):
+    feed = headlines.TOP_HEADLINES_FEED
+
+    first = headlines.get_all_bing_news_headlines("US", use_top_headlines_feed=True)
+    second = headlines.get_all_bing_news_headlines("US", use_top_headlines_feed=True)
+
+    assert first == second
+    assert [headline.title for headline in first] == [f"{feed} headline"]
+    assert bing_requests == [feed]
+
+
+def test_stale_feeds_are_served_while_one_caller_revalidates(
+    bing_requests, monkeypatch
+):
+    market, feed, headline_limit = "US", headlines.TOP_HEADLINES_FEED, 20
+    headlines._refresh_bing_feeds(market, [feed], headline_limit)
+    _age_feed(market, feed, headline_limit, headlines.BING_FEED_FRESH_SECONDS)
+    revalidations = []
+
+    def revalidate(*args):
+        revalidations.append(args)
+        return asyncio.sleep(0)
+
+    monkeypatch.setattr(headlines, "_revalidate_bing_feed", revalidate)
+
+    for _ in range(3):
+        stale = headlines._get_cached_bing_feed(market, feed, headline_limit)
+        assert stale["value"] == _bing_result(feed)["value"]
+
+    assert revalidations == [(market, feed, headline_limit)]
+    assert bing_requests == [feed]
+
+
+def test_revalidation_refreshes_the_cached_feed(bing_requests):
+    market, feed, headline_limit = "GB", "Business", 20
+    key = headlines._bing_feed_cache_key(market, feed, headline_limit)
+    started_at = time.time()
+
+    aio.run(headlines._revalidate_bing_feed(market, feed, headline_limit))
+
+    assert headlines.bing_feed_cache.get(key)["fetched_at"] >= started_at
+    assert bing_requests == [feed]
+
+
+def test_prefetched_feeds_are_read_from_the_shared_cache(bing_requests):
+    prefetched = tasks.prefetch_headline_feeds()
+
+    assert prefetched == {
+        "GB:categories": len(headlines._bing_categories_gb()),
+        "GB:top-news": 1,
+        "US:categories": len(headlines._bing_categories_us()),
+        "US:top-news": 1,
+    }
+    categories = headlines.get_prefetched_bing_news_headlines("GB")
+    assert [headline.category for headline in categories] == (
+        headlines._bing_categories_gb()
+    )
+    top_news = headlines.get_prefetched_bing_news_headlines(
+        "US", use_top_headlines_feed=True, headline_limit=10
+    )
+    assert [headline.category for headline in top_news] == [
+        headlines.TOP_HEADLINES_FEED
+    ]
+
+
+def test_prefetched_feeds_are_ignored_when_missing_short_or_old(
+    bing_requests, monkeypatch
+):
+    headlines.prefetch_bing_news_headlines("US", use_top_headlines_feed=True)
+
+    too_many = headlines.PREFETCH_TOP_HEADLINES_LIMIT + 1
+    assert (
+        headlines.get_prefetched_bing_news_headlines(
+            "US", use_top_headlines_feed=True, headline_limit=too_many
+        )
+        is None
+    )
+    assert headlines.get_prefetched_bing_news_headlines("GB") is None
+
+    monkeypatch.setattr(headlines, "HEADLINE_PREFETCH_MAX_AGE", -1)
+    assert (
+        headlines.get_prefetched_bing_news_headlines("US", use_top_headlines_feed=True)
+        is None
+    )
+
+
+def test_category_feeds_are_fetched_concurrently(fake_redis, monkeypatch):
+    feeds = headlines._bing_categories_gb()
+    missing_feed = feeds[-1]
+    in_flight = []
+    max_in_flight = []
+
+    async def handler(request):
+        feed = request.url.params["category"]
+        in_flight.append(feed)
+        max_in_flight.append(len(in_flight))
+        await asyncio.sleep(0.01)
+        in_flight.remove(feed)
+        if feed == missing_feed:
+            return httpx.Response(404)
+        return httpx.Response(200, json=_bing_result(feed))
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(headlines, "_client", client)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        headlines._refresh_bing_feeds("GB", feeds, 20)
+
+    assert max(max_in_flight) == len(feeds)
+    # The feeds that were fetched are cached, so a retry only fetches the failed one.
+    cached = [
+        feed
+        for feed in feeds
+        if headlines._get_cached_bing_feed("GB", feed, 20) is not None
+    ]
+    assert cached == feeds[:-1]
@@ -0,0 +1,280 @@
+import json
+import math
+import types
+
+import numpy as np
+import pytest
+
+from app.types import Headline
+from src.services import llm
+
+
+def _response(parsed):
+    message = types.SimpleNamespace(parsed=parsed)
+    return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)])
+
+
+@pytest.fixture
+def stories():
+    return [
+        types.SimpleNamespace(
+            id=f"story-{i}",
+            title=f"Story {i}",
+            similarity_score=0.5,
+            position=i,
+            publication="The Paper",
+            published_at=None,
+        )
+        for i in range(7)
+    ]
+
+
+def test_batched_scoring_refers_to_stories_by_ref(stories, monkeypatch):
+    requests = []
+
+    async def chat_completion(use_cache, **request):
+        requests.append(request)
+        if request["response_format"] is llm.LLMSingleStoryValueResponse:
+            return _response(llm.LLMSingleStoryValueResponse(value=-1))
+        content = json.loads(request["messages"][1]["content"])
+        values = [
+            llm.StoryValue(ref=item["ref"], value=int(item["story"]["id"][-1]))
+            for item in content
+            # One story is left out of every response, and an unknown one added.
+            if item["ref"] != "1"
+        ]
+        values.append(llm.StoryValue(ref="99", value=100))
+        return _response(llm.LLMStoryBatchValuesResponse(stories=values))
+
+    monkeypatch.setattr(llm, "_chat_completion_async", chat_completion)
+
+    stories_per_request = 3
+    results = llm.make_batched_llm_requests_for_stories(
+        "prompt",
+        stories,
+        attributes=["id", "title"],
+        stories_per_request=stories_per_request,
+    )
+
+    values = {result["id"]: result["value"] for result in results}
+    assert values == {
+        "story-0": 0,
+        "story-1": -1,
+        "story-2": 2,
+        "story-3": 3,
+        "story-4": -1,
+        "story-5": 5,
+        "story-6": 6,
+    }
+    batch_requests = [
+        request
+        for request in requests
+        if request["response_format"] is llm.LLMStoryBatchValuesResponse
+    ]
+    assert len(batch_requests) == math.ceil(len(stories) / stories_per_request)
+
+
+def test_map_reduce_transform_truncates_long_stories_visibly(monkeypatch, caplog):
+    requests = []
+
+    async def chat_completion(use_cache, **request):
+        requests.append(json.loads(request["messages"][1]["content"]))
+        return _response(llm.LLMTransformStoriesResponse(text="Summary"))
+
+    monkeypatch.setattr(llm, "_chat_completion_async", chat_completion)
+    stories = [
+        {"id": "long", "title": "Long", "text": "x" * 1000},
+        {"title": "Short", "text": "y" * 10},
+    ]
+
+    text = llm.map_reduce_transform_stories(stories, "Summarise. ", chunk_max_tokens=50)
+
+    assert text == "Summary"
+    map_requests = requests[:2]
+    assert [item["text"] for chunk in map_requests for item in chunk] == [
+        "x" * 200,
+        "y" * 10,
+    ]
+    assert "Story 'long' truncated from 1000 to 200 characters" in caplog.text
+
+
+def _headlines(n):
+    # The importance the stub model ranks by is hidden in the summary.
+    return [
+        Headline(
+            id=f"headline-{i}",
+            title=f"Headline {i}",
+            summary=str((i * 37) % n),
+            publication="The Paper",
+            category="News",
+        )
+        for i in range(n)
+    ]
+
+
+def _stub_reranker(monkeypatch, requests, drop=0, hallucinate=False):
+    async def chat_completion(use_cache, **request):
+        content = json.loads(request["messages"][1]["content"])
+        requests.append(len(content))
+        ranked = sorted(content, key=lambda item: -int(item["summary"]))
+        ids = [item["id"] for item in ranked[drop:]]
+        if hallucinate:
+            ids += [ids[0], "999", "not-an-id"]
+        return _response(
+            llm.LLMHeadlineRerankingResponse(
+                headlines=[llm.HeadlineIdentifier(id=ref) for ref in ids]
+            )
+        )
+
+    monkeypatch.setattr(llm, "_chat_completion_async", chat_completion)
+
+
+def test_windowed_reranking_orders_every_headline(monkeypatch):
+    requests = []
+    _stub_reranker(monkeypatch, requests)
+    headlines = _headlines(200)
+    window_size = 20
+
+    reranked = llm.make_windowed_llm_request_for_headline_reranking(
+        headlines, "Most important first", window_size=window_size
+    )
+
+    importance = [int(headline.summary) for headline in reranked]
+    assert importance == sorted(range(len(headlines)), reverse=True)
+    assert max(requests) <= window_size
+
+
+@pytest.mark.parametrize("drop, hallucinate", [(3, False), (0, True), (2, True)])
+def test_windowed_reranking_loses_and_repeats_no_headline(
+    monkeypatch, drop, hallucinate
+):
+    _stub_reranker(monkeypatch, [], drop=drop, hallucinate=hallucinate)
+    headlines = _headlines(150)
+
+    reranked = llm.make_windowed_llm_request_for_headline_reranking(
+        headlines, "Most important first", window_size=20
+    )
+
+    assert sorted(headline.id for headline in reranked) == sorted(
+        headline.id for headline in headlines
+    )
+
+
+def test_embeddings_are_cached_per_text_and_dimensions(fake_redis, monkeypatch):
+    requests = []
+
+    def request_embeddings(texts, dimensions, priority=None):
+        requests.append((list(texts), dimensions))
+        rng = np.random.default_rng(len(requests))
+        return rng.standard_normal((len(texts), dimensions or 4), dtype=np.float32)
+
+    monkeypatch.setattr(llm, "_request_embeddings", request_embeddings)
+
+    first = llm.openai_text_embeddings(["a", "b", "a"], dimensions=4)
+    second = llm.openai_text_embeddings(["b", "c", "a"], dimensions=4)
+    other_dimensions = llm.openai_text_embeddings(["a"], dimensions=8)
+
+    assert requests == [(["a", "b"], 4), (["c"], 4), (["a"], 8)]
+    assert first.dtype == np.float32 and first.flags.c_contiguous
+    np.testing.assert_array_equal(first[0], first[2])
+    np.testing.assert_array_equal(second[0], first[1])
+    np.testing.assert_array_equal(second[2], first[0])
+    assert other_dimensions.shape == (1, 8)
+
+
+def test_embedding_no_texts_returns_an_empty_matrix(monkeypatch):
+    def request_embeddings(texts, dimensions, priority=None):
+        raise AssertionError("Nothing should be requested")
+
+    monkeypatch.setattr(llm, "_request_embeddings", request_embeddings)
+
+    embeddings = llm.openai_text_embeddings([], dimensions=4)
+
+    assert embeddings.shape == (0, 4)
+    assert embeddings.dtype == np.float32
+    assert llm.openai_text_embeddings([]).shape == (0, llm.EMBEDDING_MODEL_DIMENSIONS)
+
+
+def _parsed_completion(value, total_tokens):
+    return llm.ParsedChatCompletion[llm.LLMSingleStoryValueResponse].model_validate(
+        {
+            "id": "chatcmpl-1",
+            "object": "chat.completion",
+            "created": 0,
+            "model": "gpt-4o-mini",
+            "choices": [
+                {
+                    "index": 0,
+                    "finish_reason": "stop",
+                    "message": {
+                        "role": "assistant",
+                        "content": json.dumps({"value": value}),
+                        "parsed": {"value": value},
+                    },
+                }
+            ],
+            "usage": {
+                "prompt_tokens": total_tokens - 1,
+                "completion_tokens": 1,
+                "total_tokens": total_tokens,
+            },
+        }
+    )
+
+
+def test_llm_cache_keys_cover_the_whole_request():
+    request = {
+        "model": "gpt-4o-mini",
+        "messages": [{"role": "user", "content": "Rate this story"}],
+        "response_format": llm.LLMSingleStoryValueResponse,
+    }
+    key = llm._chat_completion_cache_key(request)
+
+    assert llm._chat_completion_cache_key(dict(reversed(request.items()))) == key
+    assert llm._chat_completion_cache_key({**request, "temperature": 0}) != key
+    assert (
+        llm._chat_completion_cache_key(
+            {**request, "response_format": llm.LLMTransformStoriesResponse}
+        )
+        != key
+    )
+
+
+def test_cached_llm_responses_skip_the_api(fake_redis, monkeypatch):
+    requests = []
+    total_tokens = 20
+
+    def parse(**request):
+        requests.append(request)
+        return _parsed_completion(len(requests), total_tokens)
+
+    completions = types.SimpleNamespace(parse=parse)
+    monkeypatch.setattr(
+        llm,
+        "client",
+        types.SimpleNamespace(
+            beta=types.SimpleNamespace(
+                chat=types.SimpleNamespace(completions=completions)
+            )
+        ),
+    )
+    monkeypatch.setattr(llm.rate_limit, "acquire", lambda *args: 0.0)
+    request = {
+        "model": "gpt-4o-mini",
+        "messages": [{"role": "user", "content": "Rate this story"}],
+        "response_format": llm.LLMSingleStoryValueResponse,
+    }
+
+    first = llm._chat_completion(**request)
+    cached = llm._chat_completion(**request)
+    fresh = llm._chat_completion(use_cache=False, **request)
+
+    assert requests == [request, request]
+    assert cached.choices[0].message.parsed == first.choices[0].message.parsed
+    assert fresh.choices[0].message.parsed.value == len(requests)
+    assert llm.get_llm_cache_stats() == {
+        "hits": 1,
+        "misses": 2,
+        "hit_rate": 1 / 3,
+        "tokens_saved": total_tokens,
+    }
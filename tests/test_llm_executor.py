@@ -0,0 +1,142 @@
+import asyncio
+
+import httpx
+import openai
+import pytest
+
+from src.services.llm_executor import (
+    LLM_BACKOFF_DECREASE_FACTOR,
+    AdaptiveConcurrencyLimiter,
+    LLMExecutor,
+)
+
+
+def _rate_limit_error():
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    response = httpx.Response(429, request=request, headers={"retry-after-ms": "1"})
+    return openai.RateLimitError("Rate limited", response=response, body=None)
+
+
+def test_limit_grows_by_one_per_round_of_healthy_responses():
+    initial = 4
+    limiter = AdaptiveConcurrencyLimiter(initial=initial, min_limit=1, max_limit=64)
+
+    async def run():
+        for _ in range(initial):
+            await limiter.acquire()
+        for _ in range(initial):
+            await limiter.release(latency=1.0)
+
+    asyncio.run(run())
+    assert initial < limiter.limit < initial + 1
+    assert limiter.in_flight == 0
+
+
+def test_slow_response_stops_the_limit_growing():
+    initial = 4
+    limiter = AdaptiveConcurrencyLimiter(initial=initial, min_limit=1, max_limit=64)
+
+    async def run():
+        await limiter.acquire()
+        await limiter.release(latency=1.0)
+        await limiter.acquire()
+        await limiter.release(latency=10.0)
+
+    asyncio.run(run())
+    assert limiter.limit == initial + 1 / initial
+
+
+def test_overload_halves_the_limit_down_to_the_minimum():
+    min_limit = 3
+    limiter = AdaptiveConcurrencyLimiter(initial=8, min_limit=min_limit, max_limit=64)
+
+    async def run():
+        for _ in range(3):
+            await limiter.acquire()
+            await limiter.release(overloaded=True)
+
+    asyncio.run(run())
+    assert limiter.limit == min_limit
+
+
+def test_submit_retries_overload_errors():
+    initial, max_attempts = 8, 3
+    executor = LLMExecutor(
+        AdaptiveConcurrencyLimiter(initial=initial), max_attempts=max_attempts
+    )
+    calls = []
+
+    async def make_request():
+        calls.append(1)
+        if len(calls) < max_attempts:
+            raise _rate_limit_error()
+        return "OK"
+
+    assert asyncio.run(executor.submit(make_request)) == "OK"
+    assert len(calls) == max_attempts
+    # Halved by each of the two overloads, then raised by the healthy response.
+    backed_off = initial * LLM_BACKOFF_DECREASE_FACTOR**2
+    assert executor.limiter.limit == backed_off + 1 / backed_off
+    assert executor.limiter.in_flight == 0
+
+
+def test_submit_raises_other_errors_without_retrying():
+    initial = 8
+    executor = LLMExecutor(AdaptiveConcurrencyLimiter(initial=initial), max_attempts=3)
+    calls = []
+
+    async def make_request():
+        calls.append(1)
+        raise ValueError("Bad request")
+
+    with pytest.raises(ValueError):
+        asyncio.run(executor.submit(make_request))
+    assert len(calls) == 1
+    assert executor.limiter.limit == initial
+    assert executor.limiter.in_flight == 0
+
+
+def test_cancelled_request_releases_its_slot():
+    executor = LLMExecutor(AdaptiveConcurrencyLimiter(initial=1), max_attempts=3)
+    started = asyncio.Event()
+
+    async def make_request():
+        started.set()
+        await asyncio.sleep(60)
+
+    async def run():
+        task = asyncio.create_task(executor.submit(make_request))
+        await started.wait()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert executor.limiter.in_flight == 0
+        # The freed slot is usable by the next request.
+        return await asyncio.wait_for(executor.submit(lambda: asyncio.sleep(0)), 1)
+
+    asyncio.run(run())
+    assert executor.limiter.in_flight == 0
+    assert executor.limiter.average_latency is not None
+
+
+def test_before_attempt_holds_no_slot_and_is_not_timed():
+    executor = LLMExecutor(AdaptiveConcurrencyLimiter(initial=1), max_attempts=3)
+    in_flight_while_waiting = []
+    wait = 0.2
+
+    async def wait_for_rate_limit():
+        in_flight_while_waiting.append(executor.limiter.in_flight)
+        await asyncio.sleep(wait)
+
+    async def make_request():
+        return "OK"
+
+    async def run():
+        return await asyncio.gather(
+            executor.submit(make_request, before_attempt=wait_for_rate_limit),
+            executor.submit(make_request, before_attempt=wait_for_rate_limit),
+        )
+
+    assert asyncio.run(run()) == ["OK", "OK"]
+    assert in_flight_while_waiting == [0, 0]
+    assert executor.limiter.average_latency < wait / 2
@@ -0,0 +1,146 @@
+import datetime
+
+import numpy as np
+import pytest
+from django.utils import timezone
+
+from app import models as md
+from app import tasks
+from src.services import local_vector_search as lvs
+
+DIMENSIONS = 8
+
+
+def test_search_scores_only_the_date_window():
+    rng = np.random.default_rng(0)
+    published_at = rng.permutation(1000).astype(np.int64)
+    vectors = rng.standard_normal((1000, DIMENSIONS), dtype=np.float32)
+    index = lvs.EmbeddingIndex.from_rows(
+        [f"story-{i}" for i in range(1000)], published_at, vectors
+    )
+    query = rng.standard_normal(DIMENSIONS, dtype=np.float32)
+
+    start, end = 100, 199
+
+    results = index.search(query, k=5, start=start, end=end)
+
+    in_window = np.flatnonzero((published_at >= start) & (published_at <= end))
+    scores = lvs._normalise(vectors[in_window]) @ lvs._normalise(query)
+    expected = in_window[np.argsort(-scores)[:5]]
+    assert [story_id for story_id, _ in results] == [f"story-{i}" for i in expected]
+    assert [score for _, score in results] == pytest.approx(
+        sorted(scores, reverse=True)[:5]
+    )
+    assert index.search(query, k=5, start=2000) == []
+
+
+@pytest.fixture
+def index_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(lvs, "LOCAL_INDEX_DIR", str(tmp_path))
+    monkeypatch.setattr(lvs, "EMBEDDING_DIMENSIONS", DIMENSIONS)
+    monkeypatch.setattr(lvs, "_index", None)
+    monkeypatch.setattr(lvs, "_index_state", {"version": None, "refreshed_at": None})
+    return tmp_path
+
+
+def _embedded_story(title, published_at, vector, dimensions=DIMENSIONS):
+    story = md.Story.objects.create(title=title, text="", published_at=published_at)
+    md.StoryEmbedding.objects.create(
+        story=story,
+        model=lvs.EMBEDDING_MODEL,
+        dimensions=dimensions,
+        vector=lvs._normalise(np.asarray(vector, dtype=np.float32)).tobytes(),
+        published_at=published_at,
+    )
+    return story
+
+
+def _publish():
+    lvs.update_index_files()
+    lvs.refresh_index()
+
+
+def _search(vector, k=10):
+    return [
+        story_id
+        for story_id, _ in lvs._index.search(np.asarray(vector, dtype=np.float32), k)
+    ]
+
+
+@pytest.mark.django_db
+def test_index_files_follow_the_embeddings_table(index_dir):
+    now = timezone.now()
+    basis = np.eye(DIMENSIONS)
+    first = _embedded_story("First", now - datetime.timedelta(hours=2), basis[0])
+    second = _embedded_story("Second", now - datetime.timedelta(hours=3), basis[1])
+    # An embedding of another size is not part of this index.
+    _embedded_story("Other", now, np.ones(4), dimensions=4)
+
+    _publish()
+    assert _search(basis[0], k=1) == [str(first.id)]
+    assert sorted(_search(basis[0])) == sorted([str(first.id), str(second.id)])
+    assert lvs.update_index_files() is False
+
+    third = _embedded_story("Third", now - datetime.timedelta(hours=1), basis[2])
+    first.delete()
+    _publish()
+    assert sorted(_search(basis[0])) == sorted([str(second.id), str(third.id)])
+    assert _search(basis[2], k=1) == [str(third.id)]
+
+    # Once deleted rows outnumber live ones the files are written from scratch.
+    generation = lvs._read_manifest(lvs._index_dir())["generation"]
+    second.delete()
+    _publish()
+    assert _search(basis[0]) == [str(third.id)]
+    manifest = lvs._read_manifest(lvs._index_dir())
+    assert manifest["generation"] != generation
+    assert manifest["rows"] == 1
+
+
+@pytest.mark.django_db
+def test_stories_are_embedded_once_per_model_and_dimensions(index_dir, monkeypatch):
+    monkeypatch.setattr(
+        lvs,
+        "openai_text_embeddings",
+        lambda texts, dimensions, **kwargs: np.ones((len(texts), dimensions)),
+    )
+    story = md.Story.objects.create(title="Story", text="", published_at=timezone.now())
+    md.StoryEmbedding.objects.create(
+        story=story,
+        model=lvs.EMBEDDING_MODEL,
+        dimensions=4,
+        vector=np.ones(4, dtype=np.float32).tobytes(),
+        published_at=story.published_at,
+    )
+
+    assert lvs.embed_new_stories() == 1
+    assert lvs.embed_new_stories() == 0
+    assert set(story.embeddings.values_list("dimensions", flat=True)) == {
+        4,
+        lvs.EMBEDDING_DIMENSIONS,
+    }
+
+
+@pytest.mark.django_db
+def test_searches_map_the_index_published_by_the_embed_task(
+    index_dir, monkeypatch, django_assert_num_queries
+):
+    monkeypatch.setattr(tasks.vector_search, "VECTOR_SEARCH_ENGINE", "local")
+    monkeypatch.setattr(
+        lvs,
+        "openai_text_embeddings",
+        lambda texts, dimensions, **kwargs: np.ones((len(texts), dimensions)),
+    )
+    now = timezone.now()
+    story = md.Story.objects.create(
+        title="Story", text="", published_at=now - datetime.timedelta(hours=1)
+    )
+    start_date = (now - datetime.timedelta(days=1)).isoformat()
+    assert lvs.get_vector_search_stories(start_date, 5, "query") == []
+
+    assert tasks.embed_stories() == 1
+    # The index is re-mapped from the published files without touching the database.
+    lvs._index_state["refreshed_at"] = None
+    with django_assert_num_queries(0):
+        results = lvs.get_vector_search_stories(start_date, 5, "query")
+    assert [result["id"] for result in results] == [str(story.id)]
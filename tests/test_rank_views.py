@@ -0,0 +1,31 @@
+from app.views import rank
+
+
+def test_scored_stories_are_streamed_as_server_sent_events(monkeypatch):
+    llm_stories = [{"id": "story-1"}, {"id": "story-2"}]
+
+    def iter_concurrent_llm_requests_for_stories(**kwargs):
+        yield from llm_stories
+
+    def render_to_string(template_name, context):
+        return f"<tr>\n  <td>{context['llm_story']['id']}</td>\n</tr>"
+
+    monkeypatch.setattr(
+        rank.services,
+        "iter_concurrent_llm_requests_for_stories",
+        iter_concurrent_llm_requests_for_stories,
+    )
+    monkeypatch.setattr(rank, "render_to_string", render_to_string)
+
+    stream = "".join(rank._story_events([], "prompt", ["title"], use_cache=True))
+
+    # Every event ends with a blank line, and every line of its HTML gets a
+    # `data:` prefix, so the browser reassembles the multi-line partial.
+    *story_events, done, trailing = stream.split("\n\n")
+    assert trailing == ""
+    assert done == "event: done\ndata: "
+    for event, llm_story in zip(story_events, llm_stories, strict=True):
+        name, *data = event.split("\n")
+        assert name == "event: story"
+        html = "\n".join(line.removeprefix("data: ") for line in data)
+        assert html == render_to_string(None, {"llm_story": llm_story})
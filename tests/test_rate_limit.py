@@ -0,0 +1,71 @@
+import pytest
+
+from src.services import rate_limit
+from src.services.rate_limit import Priority
+
+MODEL = "gpt-test"
+TPM_LIMIT = 6000
+
+
+@pytest.fixture
+def limits(fake_redis, monkeypatch):
+    monkeypatch.setattr(rate_limit, "OPENAI_RPM_LIMIT", 60)
+    monkeypatch.setattr(rate_limit, "OPENAI_TPM_LIMIT", TPM_LIMIT)
+
+
+def _tpm_level(fake_redis):
+    return float(fake_redis.hget(rate_limit._bucket_keys(MODEL)[1], "level"))
+
+
+def test_take_waits_once_the_bucket_is_empty(limits):
+    assert rate_limit._take(MODEL, 2000, Priority.INTERACTIVE) == 0
+    assert rate_limit._take(MODEL, 2000, Priority.INTERACTIVE) == 0
+    assert rate_limit._take(MODEL, 2000, Priority.INTERACTIVE) == 0
+    # The TPM bucket refills at 100 tokens per second.
+    assert rate_limit._take(MODEL, 2000, Priority.INTERACTIVE) == pytest.approx(
+        20, abs=0.5
+    )
+
+
+def test_lower_priorities_leave_a_reserve(limits):
+    assert rate_limit._take(MODEL, 2500, Priority.INTERACTIVE) == 0
+    # 3500 tokens are left, but BATCH must leave half the capacity untouched.
+    assert rate_limit._take(MODEL, 1000, Priority.BATCH) > 0
+    assert rate_limit._take(MODEL, 1000, Priority.BACKGROUND) == 0
+    assert rate_limit._take(MODEL, 2500, Priority.INTERACTIVE) == 0
+
+
+def test_record_usage_corrects_the_estimate_up_to_capacity(limits, fake_redis):
+    rate_limit._take(MODEL, 2000, Priority.INTERACTIVE)
+    rate_limit.record_usage(MODEL, estimated_tokens=2000, used_tokens=500)
+    assert _tpm_level(fake_redis) == pytest.approx(5500, abs=50)
+
+    rate_limit.record_usage(MODEL, estimated_tokens=5000, used_tokens=0)
+    assert _tpm_level(fake_redis) == TPM_LIMIT
+
+    rate_limit.record_usage(MODEL, estimated_tokens=0, used_tokens=1000)
+    assert _tpm_level(fake_redis) == pytest.approx(5000, abs=50)
+
+
+def test_acquire_records_waits_per_priority(limits, fake_redis, monkeypatch):
+    def sleep(seconds):
+        # Let the buckets refill as if the time had passed.
+        for key in rate_limit._bucket_keys(MODEL):
+            fake_redis.hincrbyfloat(key, "updated_at", -seconds)
+
+    monkeypatch.setattr(rate_limit.time, "sleep", sleep)
+    assert rate_limit.acquire(MODEL, TPM_LIMIT, Priority.INTERACTIVE) == 0
+    # BACKGROUND requests wait until the TPM bucket, which refills in a minute, is a
+    # quarter full again.
+    background_wait = 60 * Priority.BACKGROUND.value
+    assert rate_limit.acquire(MODEL, 1, Priority.BACKGROUND) >= background_wait
+
+    stats = rate_limit.get_rate_limit_stats()
+    assert stats["interactive"] == {
+        "requests": 1,
+        "waited": 0,
+        "mean_wait_seconds": 0.0,
+    }
+    assert stats["background"]["requests"] == 1
+    assert stats["background"]["waited"] == 1
+    assert stats["background"]["mean_wait_seconds"] >= background_wait
@@ -0,0 +1,145 @@
+import time
+
+import psycopg2
+import pytest
+from psycopg2 import extensions
+
+from src.services import replica
+
+
+class _Cursor:
+    def __init__(self, conn):
+        self.connection = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, query, params=None):
+        self.connection.queries.append(query)
+
+    def fetchone(self):
+        return (True,)
+
+
+class _Connection:
+    def __init__(self):
+        self.queries = []
+        self.closed = False
+
+    def cursor(self):
+        return _Cursor(self)
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def no_pool(monkeypatch):
+    def get_pool():
+        raise AssertionError("The pool must not be used")
+
+    monkeypatch.setattr(replica, "get_pool", get_pool)
+
+
+def test_probe_opens_its_own_short_lived_connection(no_pool, monkeypatch):
+    connections = []
+
+    def connect(connect_timeout):
+        conn = _Connection()
+        connections.append((connect_timeout, conn))
+        return conn
+
+    monkeypatch.setattr(replica, "connect", connect)
+
+    assert replica._probe() is True
+    [(connect_timeout, conn)] = connections
+    assert connect_timeout == replica.REPLICA_HEALTH_CHECK_CONNECT_TIMEOUT
+    assert conn.closed
+
+
+def test_probe_fails_when_the_replica_cannot_be_reached(no_pool, monkeypatch):
+    def connect(connect_timeout):
+        raise psycopg2.OperationalError("timeout expired")
+
+    monkeypatch.setattr(replica, "connect", connect)
+
+    assert replica._probe() is False
+
+
+class _PooledConnection(_Connection):
+    def __init__(self):
+        super().__init__()
+        self.created_at = self.last_used_at = time.monotonic()
+        self.status = extensions.STATUS_READY
+        self.broken = False
+
+    def cursor(self):
+        if self.broken:
+            raise psycopg2.OperationalError("server closed the connection")
+        return super().cursor()
+
+    def rollback(self):
+        pass
+
+
+def _pool(connections, **options):
+    def connect():
+        conn = _PooledConnection()
+        connections.append(conn)
+        return conn
+
+    options = {"max_lifetime": 60, "health_check_after": 60, **options}
+    return replica.ConnectionPool(connect, max_size=2, timeout=1, **options)
+
+
+def test_pool_reuses_idle_connections():
+    connections = []
+    pool = _pool(connections)
+
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        pass
+
+    assert second is first
+    assert len(connections) == 1
+
+
+def test_pool_discards_expired_and_broken_connections():
+    connections = []
+    pool = _pool(connections, max_lifetime=0)
+    with pool.connection():
+        pass
+    with pool.connection():
+        pass
+    assert [conn.closed for conn in connections] == [True, True]
+
+    pool = _pool(connections, health_check_after=0)
+    with pool.connection() as conn:
+        pass
+    conn.broken = True
+    with pool.connection() as replacement:
+        pass
+    assert replacement is not conn
+    assert conn.closed
+
+
+def test_pool_drops_the_parents_connections_after_a_fork(monkeypatch):
+    connections = []
+    pool = _pool(connections)
+    with pool.connection() as parent_conn:
+        pass
+
+    monkeypatch.setattr(replica.os, "getpid", lambda: pool._pid + 1)
+    with pool.connection() as child_conn:
+        pass
+
+    assert child_conn is not parent_conn
+    # Closing would end the parent's session too.
+    assert not parent_conn.closed
+    monkeypatch.setattr(replica, "_pool", pool)
+    replica._reset_pool_in_child()
+    assert replica._pool is None
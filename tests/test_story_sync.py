@@ -0,0 +1,123 @@
+import datetime
+import uuid
+
+import pytest
+from django.utils import timezone
+
+from app import models as md
+from app import tasks
+
+
+def _story(published_at):
+    return {
+        "id": str(uuid.uuid4()),
+        "title": "Story",
+        "text": "Text",
+        "published_at": published_at,
+        "publication": "The Paper",
+        "author": None,
+        "type": "ARTICLE",
+        "classification": None,
+    }
+
+
+class _Replica(list):
+    """The replica's stories, and the ids of those it was asked for in full."""
+
+    def __init__(self):
+        super().__init__()
+        self.full_reads = []
+
+
+def _key(story):
+    return story["published_at"], story["id"]
+
+
+@pytest.fixture
+def replica(monkeypatch):
+    stories = _Replica()
+
+    def iter_new_story_batches(after_published_at, after_id=None, limit=1000):
+        newer = sorted(
+            (
+                story
+                for story in stories
+                if _key(story) > (after_published_at, str(after_id or ""))
+            ),
+            key=_key,
+        )[:limit]
+        stories.full_reads.extend(story["id"] for story in newer)
+        yield newer
+
+    def get_story_ids_in_range(after_published_at, until_published_at, until_id):
+        return [
+            story["id"]
+            for story in stories
+            if story["published_at"] > after_published_at
+            and _key(story) <= (until_published_at, str(until_id))
+        ]
+
+    def get_stories_by_id(story_ids):
+        stories.full_reads.extend(story_ids)
+        data = [story for story in stories if story["id"] in story_ids]
+        return {"total": len(data), "data": data}
+
+    monkeypatch.setattr(
+        tasks.services, "iter_new_story_batches", iter_new_story_batches
+    )
+    monkeypatch.setattr(
+        tasks.services, "get_story_ids_in_range", get_story_ids_in_range
+    )
+    monkeypatch.setattr(tasks.services, "get_stories_by_id", get_stories_by_id)
+    monkeypatch.setattr(
+        tasks.services,
+        "get_latest_story_published_at",
+        # The replica's timestamps are naive UTC.
+        lambda: max(story["published_at"] for story in stories).replace(tzinfo=None),
+    )
+    return stories
+
+
+@pytest.mark.django_db
+def test_sync_picks_up_stories_that_appear_behind_the_cursor(replica):
+    now = timezone.now()
+    replica.append(_story(now - datetime.timedelta(minutes=5)))
+    assert tasks.fetch_stories() == {"synced": 1, "recovered": 0, "lag_seconds": 0}
+
+    # Committed on the replica after the last sync, but published before it.
+    late = _story(now - datetime.timedelta(minutes=10))
+    replica.append(late)
+    replica.append(_story(now - datetime.timedelta(minutes=1)))
+    result = tasks.fetch_stories()
+
+    assert (result["synced"], result["recovered"]) == (1, 1)
+    assert md.Story.objects.count() == len(replica)
+    assert md.Story.objects.filter(id=late["id"]).exists()
+
+
+@pytest.mark.django_db
+def test_sync_reads_only_missing_stories_in_full(replica):
+    now = timezone.now()
+    replica.extend(_story(now - datetime.timedelta(minutes=i)) for i in range(3))
+    tasks.fetch_stories()
+    replica.full_reads.clear()
+
+    result = tasks.fetch_stories()
+
+    assert (result["synced"], result["recovered"]) == (0, 0)
+    assert replica.full_reads == []
+
+
+@pytest.mark.django_db
+def test_sync_recovers_more_late_stories_than_the_sync_limit(replica, monkeypatch):
+    monkeypatch.setattr(tasks, "STORY_SYNC_LIMIT", 2)
+    now = timezone.now()
+    replica.append(_story(now))
+    tasks.fetch_stories()
+
+    late = [_story(now - datetime.timedelta(minutes=i)) for i in range(1, 6)]
+    replica.extend(late)
+    result = tasks.fetch_stories()
+
+    assert result["recovered"] == len(late)
+    assert md.Story.objects.count() == len(replica)
@@ -0,0 +1,61 @@
+import datetime
+import json
+
+import httpx
+import pytest
+
+from src.services import vector_search
+
+
+@pytest.fixture
+def search_requests(fake_redis, monkeypatch):
+    requests = []
+
+    def handler(request):
+        payload = json.loads(request.content)
+        requests.append(payload)
+        return httpx.Response(200, json=[[{"id": payload["query"]}]])
+
+    client = httpx.Client(
+        transport=httpx.MockTransport(handler), base_url="http://vector-search"
+    )
+    monkeypatch.setattr(vector_search, "VECTOR_SEARCH_ENGINE", "remote")
+    monkeypatch.setattr(vector_search, "_client", client)
+    return requests
+
+
+def test_searches_in_the_same_bucket_share_a_cached_result(search_requests):
+    start_date = (datetime.datetime.now() - datetime.timedelta(days=1)).isoformat()
+
+    first = vector_search.get_vector_search_stories(start_date, 10, "economy")
+    second = vector_search.get_vector_search_stories(start_date, 10, "economy")
+
+    assert first == second == [{"id": "economy"}]
+    [payload] = search_requests
+    end = datetime.datetime.fromisoformat(payload["end_date_time"])
+    assert end >= datetime.datetime.now()
+    # Cached results go stale well before the bucket they cover ends.
+    ttl = vector_search.vector_search_cache.ttl
+    assert ttl < vector_search.VECTOR_SEARCH_CACHE_BUCKET_SECONDS
+
+
+def test_batched_searches_keep_the_query_order(search_requests):
+    start_date = datetime.datetime.now().isoformat()
+    queries = ["economy", "elections", "weather"]
+
+    results = vector_search.get_vector_search_stories_for_queries(
+        start_date, 10, queries
+    )
+
+    assert results == [[{"id": query}] for query in queries]
+    assert sorted(payload["query"] for payload in search_requests) == queries
+
+
+def test_the_client_is_shared_and_dropped_after_a_fork(monkeypatch):
+    monkeypatch.setattr(vector_search, "_client", None)
+
+    client = vector_search.get_client()
+    assert vector_search.get_client() is client
+
+    vector_search._reset_client_in_child()
+    assert vector_search.get_client() is not client